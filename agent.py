@@ -23,6 +23,22 @@ class Agent(object):
         self.name = name
         # Uninitialized player - will be set upon starting a Game
         self.player = 0
+        # Time (as returned by time.time()) by which go() must return, None if untimed
+        # Set by go_by() before each move
+        self.deadline = None
+        # Set by game.Game when ponder() must return
+        self.stop_pondering = False
+        # Whether go() fills in last_stats; off by default, since it costs time
+        self.collect_stats = False
+        # Statistics of the last move (stats.SearchStats), None if not collected
+        self.last_stats = None
+
+    # Prepare for a new game.
+    #
+    # NOTE: called by game.Game when the game is created, after setting self.player.
+    def new_game(self):
+        """Resets any state kept from one move to the next"""
+        pass
 
     # Pick a column.
     #
@@ -32,6 +48,30 @@ class Agent(object):
         """Returns a column between 0 and (brd.w-1). The column must be free in the board."""
         raise NotImplementedError("Please implement this method")
 
+    # Pick a column before a deadline.
+    #
+    # PARAM [board.Board] brd:      the current board state
+    # PARAM [float]       deadline: the time (as returned by time.time()) by which
+    #                               the move must be made, None if untimed
+    # RETURN [int]: the column where the token must be added
+    #
+    # NOTE: agents read the deadline from self.deadline in go().
+    def go_by(self, brd, deadline):
+        """Returns a column, chosen before the deadline"""
+        self.deadline = deadline
+        return self.go(brd)
+
+    # Think while the opponent picks its move.
+    #
+    # Called by game.Game, when pondering is on, in a background thread right
+    # after this agent moved. It must return soon after self.stop_pondering
+    # is set; go() is only called after it has returned.
+    #
+    # PARAM [board.Board] brd: the board after this agent's move, owned by the agent
+    def ponder(self, brd):
+        """Uses the opponent's time, by default does nothing"""
+        pass
+
 
 
 ##########################
@@ -1,10 +1,26 @@
 import math
+import time
+import multiprocessing
+import concurrent.futures
 import agent
+import solver
+import stats
+import scoring
+import transposition as tt
+try:
+    import evaluator
+except ImportError:
+    # NumPy is not available, use the pure Python heuristic
+    evaluator = None
 
 ###########################
 # Alpha-Beta Search Agent #
 ###########################
 
+class SearchTimeout(Exception):
+    """Raised inside the search when the time for the move has run out"""
+    pass
+
 class AlphaBetaAgent(agent.Agent):
     """Agent that uses alpha-beta search"""
 
@@ -12,39 +28,116 @@ class AlphaBetaAgent(agent.Agent):
     #
     # PARAM [string] name:      the name of this player
     # PARAM [int]    max_depth: the maximum search depth
-    def __init__(self, name, max_depth):
+    # PARAM [int]    tt_size:   the number of entries of the transposition table
+    # PARAM [float]  max_time:  the maximum time per move in seconds, None for no limit
+    # PARAM [int]    workers:   the number of processes searching the root moves
+    # PARAM [opening_book.OpeningBook] book: the opening book to play from, None for no book
+    # PARAM [int]    solve_below: the number of empty cells from which positions are
+    #                             solved exactly, 0 (the default) to always search
+    # PARAM [solved_db.SolvedDatabase] database: the solved positions to play from, None for none
+    # PARAM [string or function] profile: the scoring profile of the heuristic, or the path
+    #                             of a weight file written by tune.py, see scoring.py
+    # PARAM [Bool]   incremental: True to have the board maintain the heuristic as moves
+    #                             are played, rather than scoring every leaf from scratch
+    #
+    # NOTE: the search deepens iteratively up to max_depth, and stops earlier
+    #       if max_time or the deadline set by game.Game.timed_go() is reached.
+    def __init__(self, name, max_depth, tt_size=1 << 18, max_time=None, workers=1, book=None,
+                 solve_below=0, database=None, profile="classic", incremental=False):
         super().__init__(name)
+        # Opening book
+        self.book = book
+        # Database of solved positions
+        self.database = database
+        # Endgame solver, and the number of empty cells from which it is used
+        self.solver = solver.Solver(tt_size)
+        self.solve_below = solve_below
+        # Proven result of the last move: (1 win, 0 tie, -1 loss, number of
+        # moves until then), or None if the move was searched heuristically
+        self.proven = None
         # Max search depth
         self.max_depth = max_depth
-        
-    # Return the height of the columns, if a column is full, set to -1
-    #
-    # PARAM [board.Board]: the column of the cell to be checked
-    # RETURN [int[]]: the heights of all columns in the board
-    def valid_moves(self, brd):
-        # Initialize possible moves array with width of board
-        moves = [None] * brd.w
-        
-        # For each column, check if full, if not find valid move spot
-        for i in range(brd.w):
-            
-            # If the column is full, set to no possible move
-            if brd[i][0] != 0:
-                moves[i] = -1
-            
-            # If the column is not full, return the height of the first open space
-            else:
-                for j in range(brd.h):
-                    # If it is at the bottom, only check if the space is empty, not if the space below is full
-                    if brd[i][j] == 0 and j == brd.h - 1:
-                        moves[i] = j
-                    # Otherwise check if the current space is empty and the space below is full
-                    elif brd[i][j] == 0 and brd[i][j + 1] != 0:
-                        moves[i] = j
-        # Return the array of possible moves
-        return moves
-                
-        
+        # Max time per move
+        self.max_time = max_time
+        # Number of search processes
+        self.workers = workers
+        # Process pool and best value found so far at the root, shared with
+        # the workers; created on the first parallel search
+        self.pool = None
+        self.shared_alpha = None
+        # In a worker of the parallel search, the best value found so far at
+        # the root by all the workers, None elsewhere; and the value below
+        # which this worker prunes, read from it with the clock
+        self.worker_alpha = None
+        self.root_alpha = -math.inf
+        # Number of searches started, so that workers can age their tables
+        self.searches = 0
+        # Depth of the current iteration
+        self.depth = 0
+        # Depth of the last completed iteration
+        self.completed_depth = 0
+        # Time at which the search is aborted, None for no limit
+        self.stop_time = None
+        # Time after which no new iteration is started, None for no limit
+        self.soft_stop_time = None
+        # Principal variation of the last completed iteration
+        self.pv = []
+        # Move of the principal variation, by position hash
+        self.pv_moves = {}
+        # Transposition table, kept from one move to the next within a game
+        self.tt = tt.TranspositionTable(tt_size)
+        # Killer moves: the last two moves that caused a cutoff, per depth
+        self.killers = []
+        # History heuristic: cutoff score per player and cell
+        self.history = []
+        # Number of nodes visited by the last search
+        self.nodes = 0
+        # Value of nodes // 256 when the clock was last read
+        self.clock_block = 0
+        # Number of leaves evaluated, cutoffs, and cutoffs caused by the
+        # first move searched, by the last search
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        # Whether the last move was played from the opening book
+        self.from_book = False
+        # Whether the search runs on the opponent's time, and then stops
+        # when stop_pondering is set
+        self.pondering = False
+        # Scoring profile of the heuristic
+        self.profile = scoring.get_profile(profile)
+        # Whether the board maintains the heuristic incrementally
+        self.incremental = incremental
+        # Vectorized evaluator for the current board geometry, None if not built yet
+        self.evaluator = None
+
+    # Prepare for a new game.
+    def new_game(self):
+        """Clears the transposition table and the move ordering statistics"""
+        self.tt.clear()
+        self.solver.tt.clear()
+        self.history = []
+        # The workers' tables belong to the previous game too
+        self.close()
+
+    # Stop the search processes, if any.
+    def close(self):
+        """Shuts down the process pool of the parallel search"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.shared_alpha = None
+
+    # Get the state to pickle.
+    #
+    # RETURN [dict]: the attributes, without the process pool
+    def __getstate__(self):
+        """Returns the state to pickle"""
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["shared_alpha"] = None
+        return state
+
     # Pick a column.
     #
     # PARAM [board.Board] brd: the current board state
@@ -53,167 +146,582 @@ class AlphaBetaAgent(agent.Agent):
     # NOTE: make sure the column is legal, or you'll lose the game.
     def go(self, brd):
         """Search for the best move (choice of column for the token)"""
-        # Use get-successors to find the set of successive board states for the next move
-        next_move_list = self.get_successors(brd)
-        # Initialize a dictionary to track board states their values to find max values and their assoc states tuples
-        values_dict = {}
+        if not self.collect_stats:
+            self.last_stats = None
+            return self.choose(brd)
+        s = stats.SearchStats()
+        self.last_stats = s
+        (hits, probes) = (self.tt.hits, self.tt.hits + self.tt.misses)
+        (solver_hits, solver_probes) = (self.solver.tt.hits,
+                                        self.solver.tt.hits + self.solver.tt.misses)
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.solver.nodes = 0
+        start = time.time()
+        col = self.choose(brd)
+        s.time = time.time() - start
+        s.moves = 1
+        s.nodes = self.nodes + self.solver.nodes
+        s.leaves = self.leaves
+        s.cutoffs = self.cutoffs
+        s.first_cutoffs = self.first_cutoffs
+        s.tt_hits = self.tt.hits - hits + self.solver.tt.hits - solver_hits
+        s.tt_probes = (self.tt.hits + self.tt.misses - probes +
+                       self.solver.tt.hits + self.solver.tt.misses - solver_probes)
+        s.book_moves = int(self.from_book)
+        s.solved_moves = int(self.proven is not None)
+        return col
+
+    # Pick a column, from the book, the solved positions, the endgame solver or the search.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the column where the token must be added
+    def choose(self, brd):
+        # Play from the opening book if the position is in it
+        self.from_book = False
+        self.proven = None
+        self.pv = []
+        if self.book is not None:
+            col = self.book.probe(brd)
+            if col is not None:
+                self.from_book = True
+                return col
+        # Play perfectly if the position is solved
+        if self.database is not None:
+            col = self.database.best_move(brd)
+            if col is not None:
+                self.proven = self.solver.outcome(brd, self.database.probe(brd))
+                return col
+        # The search plays and takes back moves on this board, it is never cloned
+        self.allocate_time()
+        # Solve the position exactly when few cells are left
+        if brd.w * brd.h - brd.tokens <= self.solve_below:
+            col = self.solve(brd)
+            if col is not None:
+                return col
+        return self.deepen(brd)
+
+    # Search with iterative deepening until max_depth or the time is up.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the best column found by the last completed iteration
+    def deepen(self, brd):
+        if self.incremental and brd.profile != self.profile:
+            brd.enable_scoring(self.profile)
+        self.start_search(brd)
+        self.pv = []
+        self.pv_moves = {}
+        self.completed_depth = 0
+        # Fall back on the most central column if not even depth 1 completes
+        best_col = min(brd.free_cols(), key=lambda col: abs(col - (brd.w - 1) / 2))
+        moves_before = len(brd.history)
+        # Iterative deepening
+        for depth in range(1, self.max_depth + 1):
+            self.depth = depth
+            if self.last_stats is not None:
+                (start, nodes) = (time.time(), self.nodes)
+            try:
+                (max_found, best_col) = self.search_root(brd)
+            except SearchTimeout:
+                # Take back the moves of the aborted iteration
+                while len(brd.history) > moves_before:
+                    brd.undo()
+                break
+            self.completed_depth = depth
+            if self.last_stats is not None:
+                self.last_stats.add_iteration(depth, time.time() - start, self.nodes - nodes)
+            # Search the principal variation first in the next iteration
+            self.pv = self.principal_variation(brd)
+            # Stop if the game is decided or the next iteration will not finish in time
+            if abs(max_found) >= self.win_score(brd) - brd.w * brd.h:
+                break
+            if self.soft_stop_time is not None and time.time() >= self.soft_stop_time:
+                break
+        return best_col
+
+    # Search the expected position while the opponent thinks.
+    #
+    # The opponent's reply is taken from the principal variation of the
+    # last move, and the position after it is searched until
+    # stop_pondering is set. If the opponent plays that reply, the next
+    # search finds the results in the transposition table.
+    #
+    # PARAM [board.Board] brd: the board after this agent's move
+    #
+    # NOTE: there is no pondering with several workers or close to the end,
+    #       where the endgame solver is used.
+    def ponder(self, brd):
+        """Searches the position after the expected reply until told to stop"""
+        self.last_stats = None
+        if self.workers > 1 or brd.w * brd.h - brd.tokens - 1 <= self.solve_below:
+            return
+        reply = self.pv[1] if len(self.pv) > 1 else None
+        if reply is None:
+            entry = self.tt.probe_board(brd)
+            reply = entry[3] if entry is not None else None
+        if reply is None or reply not in brd.free_cols():
+            return
+        brd.play(reply)
+        if brd.is_over():
+            return
+        self.pondering = True
+        self.stop_time = None
+        self.soft_stop_time = None
+        try:
+            self.deepen(brd)
+        finally:
+            self.pondering = False
+
+    # Solve the position with the endgame solver
+    #
+    # The solver gets half the time of the move; if it can't finish, the
+    # heuristic search gets the rest.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the best column, or None if the solver ran out of time
+    def solve(self, brd):
+        stop_time = None
+        if self.stop_time is not None:
+            now = time.time()
+            stop_time = now + (self.stop_time - now) / 2
+        try:
+            (score, col) = self.solver.solve(brd, stop_time)
+        except solver.SolverTimeout:
+            return None
+        self.proven = self.solver.outcome(brd, score)
+        return col
+
+    # Reset the per-search state
+    #
+    # PARAM [board.Board] brd: the current board state
+    def start_search(self, brd):
+        self.searches += 1
+        self.tt.new_search()
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.killers = [[None, None] for i in range(self.max_depth + 1)]
+        if len(self.history) != 2 * brd.w * brd.stride:
+            self.history = [0] * (2 * brd.w * brd.stride)
+
+    # Search the board to the depth of the current iteration
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [(int, int)]: the value of the board and the best column
+    def search_root(self, brd):
+        if self.workers > 1 and self.depth > 2:
+            return self.search_root_parallel(brd)
+        best_col = None
         # Int to hold the max_value found (init to negative infinity)
-        max_found = float("-inf")
-        # Iterate through the possible board states (tuple of board and index of new token) in the nextMove_list
-        for state in next_move_list:
-            # Begin find_min function with the new max and depth of 1 on the successors of the current initial state
-            min_found = self.find_min(self.get_successors(state[0]), max_found, 1)
-            # Update the dict with the min value found and the state tuple
-            values_dict.update({min_found : state})
+        max_found = -math.inf
+        cols = self.ordered_moves(brd, 0)
+        leaves = self.leaf_values(brd, cols, 0)
+        for i, col in enumerate(cols):
+            if leaves is not None:
+                min_found = leaves[i]
+            else:
+                brd.play(col)
+                # Begin find_min function with the current bounds and depth of 1
+                min_found = self.find_min(brd, max_found, math.inf, 1)
+                brd.undo()
             # Check for new max and replace if possible
-            if min_found > max_found:
+            if best_col is None or min_found > max_found:
                 max_found = min_found
-        # Once all values are found, find max_found in the dict and get the tuple to return the move needed to be made
-        return (values_dict[max_found])[0]
-    
-    # Find the board state that returns the highest value
+                best_col = col
+        self.tt.store_board(brd, max_found, self.depth, tt.EXACT, best_col)
+        return (max_found, best_col)
+
+    # Search the board to the depth of the current iteration, one root move per process
     #
-    # PARAM [list of board.Board]: The list of successive board states
-    # PARAM [int]: The current maximum value found, used for Alpha-Beta Pruning
-    # PARAM [int]: The current depth of the nodes
-    # RETURN [int]: Maximum value found
-    #
-    def find_max(self, states, max_val, curr_depth):
-        # Check to see if no states are returned
-        # TODO: Figure out what to do
-        # Check to see if the current depth is the maximum depth
-        if curr_depth == self.max_depth:
-            max_state_value = float("-inf")
-            for state in states:
-                curr_value = self.heuristic(self, state)
-                if curr_value > max_state_value:
-                    max_state_value = curr_value
+    # The first move in the root order is searched here first, so that the
+    # workers start with its value as alpha (young brothers wait). The other
+    # moves are then searched by the workers, which keep pruning with the
+    # best value found so far by any of them, minus one so that moves as good
+    # as the best are still searched exactly. The first move in the root order
+    # among the best ones is then picked, as in the serial search.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [(int, int)]: the value of the board and the best column
+    def search_root_parallel(self, brd):
+        if self.pool is None:
+            self.shared_alpha = multiprocessing.Value('q', NO_ALPHA)
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.shared_alpha, self.name, self.max_depth, self.tt.size,
+                          self.profile, self.incremental))
+        cols = self.ordered_moves(brd, 0)
+        brd.play(cols[0])
+        first = self.find_min(brd, -math.inf, math.inf, 1)
+        brd.undo()
+        self.shared_alpha.value = first
+        futures = [self.pool.submit(_search_root_move, brd, col, self.player, self.depth,
+                                    self.stop_time, self.searches)
+                   for col in cols[1:]]
+        results = [(first, 0, 0, 0, 0)] + [f.result() for f in futures]
+        for r in results:
+            self.nodes += r[1]
+            self.leaves += r[2]
+            self.cutoffs += r[3]
+            self.first_cutoffs += r[4]
+        if any(r[0] is None for r in results):
+            raise SearchTimeout()
+        best = max(range(len(cols)), key=lambda i: (results[i][0], -i))
+        max_found = results[best][0]
+        self.tt.store_board(brd, max_found, self.depth, tt.EXACT, cols[best])
+        return (max_found, cols[best])
+
+    # Set the times at which the search stops
+    #
+    # The search is aborted when 80% of the time available is used; no new
+    # iteration is started after 40% of it, since it would hardly finish.
+    def allocate_time(self):
+        now = time.time()
+        budget = self.max_time
+        if self.deadline is not None:
+            # Leave a margin for the game to copy the board and check the move
+            left = (self.deadline - now) * 0.8 - 0.01
+            if budget is None or left < budget:
+                budget = left
+        if budget is None:
+            self.stop_time = None
+            self.soft_stop_time = None
         else:
-            # Init max state value to negative infinity
-            max_state_value = float("-inf")
-            # Iterate through the successive states and find the min for each, increment the depth
-            for state in states:
-                curr_value = self.find_min(state, max_val, curr_depth + 1)
-                if curr_value > max_state_value:
-                    max_state_value = curr_value
-        return max_state_value
+            self.stop_time = now + budget
+            self.soft_stop_time = now + budget * 0.4
 
-    # Find heuristic value based on vertical arrangement of tokens
+    # Abort the search if the time is up, or if pondering must stop
+    #
+    # NOTE: the clock is only read every 256 nodes. The leaves evaluated
+    #       together by leaf_values() add many nodes at once, so the clock is
+    #       read whenever nodes // 256 changes, not when nodes is a multiple of 256.
+    #       The pondering flag is checked on every call, so that pondering
+    #       stops at once and leaves the CPU to the agent to move.
+    #       In a worker of the parallel search, the best value found at the
+    #       root by the other workers is read along with the clock.
+    def check_time(self):
+        if self.pondering and self.stop_pondering:
+            raise SearchTimeout()
+        block = self.nodes >> 8
+        if block != self.clock_block:
+            self.clock_block = block
+            if self.stop_time is not None and time.time() > self.stop_time:
+                raise SearchTimeout()
+            if self.worker_alpha is not None:
+                self.read_root_alpha()
+
+    # Read the best value found so far at the root by all the workers
+    #
+    # NOTE: the value is lowered by one, so that root moves as good as the
+    #       best are still searched exactly.
+    def read_root_alpha(self):
+        alpha = self.worker_alpha.value
+        if alpha != NO_ALPHA and alpha - 1 > self.root_alpha:
+            self.root_alpha = alpha - 1
+
+    # Get the principal variation from the transposition table
     #
-    # PARAM [int]: The y value (row) of the token
-    # PARAM [int]: The x value (column) of the token
     # PARAM [board.Board] brd: the current board state
-    # RETURN [int]: Evaluation of vertical arrangement
-    #
-    def verticalHeuristic(self, row, col, brd):
-        # boolean to tell whether a chain of tokens is broken
-        is_broken = False
-        # boolean to tell if it the first value to be checked
-        first = True
-        # variable for the first token to start the chain
-        current_token = -1
-        # variables for the player and opponent tokens
-        plyr = 0
-        opp = 0
-
-        # iterate over the next brd.n spaces in the same column to get evaluation,
-        # starting from the bottom
-        for i in range(brd.n):  # ex: (0, 1, 2, 3)
-            # make sure that the token location is valid (less than the board height)
-            if (row + (brd.n - 1) - i) <= brd.h:
-                # store the value of the next token
-                value = brd[row + (brd.n - 1) - i][col]
-                # if it is the first, store it as the current_token
-                if first:
-                    current_token = value
-                    first = False
-                # if the current_token isn't the same as the value, then it is broken
-                if current_token != value:
-                    is_broken = True
-                # else, the chain is broken, so reset each player and the current_token
-                if is_broken:
-                    plyr = 0
-                    opp = 0
-                    is_broken = False
-                    current_token = value
-                # increment the player and opponent variables based on value
-                if value == 1:
-                    plyr += 1
-                elif value == 2:
-                    opp += 1
-        # return the greater value to the power of 10 ex: (1, 10, 100, 1000)
-        if plyr > opp:
-            return (10 ** plyr)/10
-        # return the negative if opponent
+    # RETURN [list of int]: the expected sequence of moves
+    def principal_variation(self, brd):
+        pv = []
+        self.pv_moves = {}
+        while len(pv) < self.depth and not brd.is_over():
+            entry = self.tt.probe_board(brd)
+            if entry is None or entry[3] is None:
+                break
+            self.pv_moves[brd.hash] = entry[3]
+            pv.append(entry[3])
+            brd.play(entry[3])
+        for col in pv:
+            brd.undo()
+        return pv
+
+    # Order the moves so that the best ones are likely searched first
+    #
+    # The move of the previous principal variation, or else the move stored in
+    # the transposition table, comes first, then the killer
+    # moves of this depth, then the other moves by history score and by
+    # distance from the centre column.
+    #
+    # PARAM [board.Board] brd: the board state
+    # PARAM [int] curr_depth: the depth of the node
+    # RETURN [list of int]: the free columns, best first
+    #
+    def ordered_moves(self, brd, curr_depth):
+        hash_move = self.pv_moves.get(brd.hash)
+        if hash_move is None:
+            entry = self.tt.probe_board(brd)
+            hash_move = entry[3] if entry is not None else None
+        killers = self.killers[curr_depth]
+        centre = (brd.w - 1) / 2
+        base = (brd.player - 1) * brd.w * brd.stride
+        def key(col):
+            if col == hash_move:
+                return (0, 0, 0)
+            if col == killers[0] or col == killers[1]:
+                return (1, 0, 0)
+            return (2,
+                    -self.history[base + col * brd.stride + brd.heights[col]],
+                    abs(col - centre))
+        return sorted(brd.free_cols(), key=key)
+
+    # Remember a move that caused a cutoff
+    #
+    # PARAM [board.Board] brd: the board state, before the move
+    # PARAM [int] col: the column of the move
+    # PARAM [int] curr_depth: the depth of the node
+    # PARAM [int] i: the rank of the move in the search order
+    #
+    def record_cutoff(self, brd, col, curr_depth, i):
+        self.cutoffs += 1
+        if i == 0:
+            self.first_cutoffs += 1
+        killers = self.killers[curr_depth]
+        if killers[0] != col:
+            killers[1] = killers[0]
+            killers[0] = col
+        remaining = self.depth - curr_depth
+        self.history[(brd.player - 1) * brd.w * brd.stride + col * brd.stride + brd.heights[col]] += remaining * remaining
+
+    # Look up the transposition table
+    #
+    # PARAM [board.Board] brd: the board state
+    # PARAM [int] alpha: the value this agent is already assured of
+    # PARAM [int] beta: the value the opponent is already assured of
+    # PARAM [int] curr_depth: the depth of the node
+    # RETURN [(int, int, int or None)]: the narrowed bounds, and the stored
+    #                                   value if it decides the node
+    #
+    def probe(self, brd, alpha, beta, curr_depth):
+        entry = self.tt.probe_board(brd)
+        if entry is None or entry[1] < self.depth - curr_depth:
+            return (alpha, beta, None)
+        (value, depth, bound, move) = entry
+        if bound == tt.EXACT:
+            return (alpha, beta, value)
+        if bound == tt.LOWER:
+            alpha = max(alpha, value)
         else:
-            return -(10 ** opp)/10
+            beta = min(beta, value)
+        if alpha >= beta:
+            return (alpha, beta, value)
+        return (alpha, beta, None)
+
+    # Store a search result in the transposition table
+    #
+    # PARAM [board.Board] brd: the board state
+    # PARAM [int] value: the value found
+    # PARAM [int] alpha: the lower bound the node was searched with
+    # PARAM [int] beta: the upper bound the node was searched with
+    # PARAM [int] curr_depth: the depth of the node
+    # PARAM [int] best_col: the best move found
+    #
+    def store(self, brd, value, alpha, beta, curr_depth, best_col):
+        if value <= alpha:
+            bound = tt.UPPER
+        elif value >= beta:
+            bound = tt.LOWER
+        else:
+            bound = tt.EXACT
+        self.tt.store_board(brd, value, self.depth - curr_depth, bound, best_col)
+
+    # Find the value of the board for the player to move, who is this agent
+    #
+    # PARAM [board.Board] brd: The board state, modified in place and restored
+    # PARAM [int]: The value this agent is already assured of (alpha)
+    # PARAM [int]: The value the opponent is already assured of (beta)
+    # PARAM [int]: The current depth of the nodes
+    # RETURN [int]: Maximum value found, or a bound on it if outside (alpha, beta)
+    #
+    def find_max(self, brd, alpha, beta, curr_depth):
+        self.nodes += 1
+        self.check_time()
+        # Check to see if the game is over or the current depth is the maximum depth
+        if brd.is_over() or curr_depth == self.depth:
+            self.leaves += 1
+            return self.heuristic(brd)
+        # Prune with the best value found at the root by the other workers
+        if alpha < self.root_alpha < beta:
+            alpha = self.root_alpha
+        # Reuse the value of this position if it was searched deep enough
+        (alpha_orig, beta_orig) = (alpha, beta)
+        (alpha, beta, value) = self.probe(brd, alpha, beta, curr_depth)
+        if value is not None:
+            return value
+        # Init max state value to negative infinity
+        max_state_value = -math.inf
+        best_col = None
+        # Iterate through the successive states and find the min for each, increment the depth
+        cols = self.ordered_moves(brd, curr_depth)
+        leaves = self.leaf_values(brd, cols, curr_depth)
+        for i, col in enumerate(cols):
+            if leaves is not None:
+                curr_value = leaves[i]
+            else:
+                brd.play(col)
+                curr_value = self.find_min(brd, alpha, beta, curr_depth + 1)
+                brd.undo()
+            if curr_value > max_state_value:
+                max_state_value = curr_value
+                best_col = col
+                if curr_value > alpha:
+                    alpha = curr_value
+                    # The opponent will not let the game get here
+                    if alpha >= beta:
+                        self.record_cutoff(brd, col, curr_depth, i)
+                        break
+        self.store(brd, max_state_value, alpha_orig, beta_orig, curr_depth, best_col)
+        return max_state_value
+
+    # Score a line of n cells
+    #
+    # PARAM [int] mine:   the number of tokens of this agent in the line
+    # PARAM [int] theirs: the number of tokens of the opponent in the line
+    # RETURN [int]: the score of the line under the scoring profile; with the
+    #               classic profile, 10^(k-1) for k tokens of a single player,
+    #               signed by player, 0 for a shared line
+    #
+    def line_score(self, mine, theirs):
+        return self.profile(mine, theirs)
+
+    # Score of a won game
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: a value larger than any heuristic value, larger for quicker wins
+    #
+    def win_score(self, brd):
+        return 10 ** brd.n * 4 * brd.w * brd.h + (brd.w * brd.h - brd.tokens)
+
+    # Get the vectorized evaluator for a board.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [evaluator.Evaluator]: the evaluator, or None if NumPy is not available
+    #
+    def get_evaluator(self, brd):
+        if evaluator is None:
+            return None
+        ev = self.evaluator
+        if ev is None or (ev.w, ev.h, ev.n) != (brd.w, brd.h, brd.n):
+            ev = evaluator.Evaluator(brd.w, brd.h, brd.n, self.line_score)
+            self.evaluator = ev
+        return ev
 
     # Heuristic function to return an evaluation of the board state
     #
+    # Every line of n cells that can still be completed by one player counts
+    # 10^(k-1) towards that player, where k is the number of tokens in it, with
+    # the classic scoring profile. When the board maintains the evaluation,
+    # the score is read from it.
+    #
     # PARAM [board.Board] brd: the current board state
-    # RETURN [int]: board state value
+    # RETURN [int]: board state value, from the point of view of this agent
     #
     def heuristic(self, brd):
-        # variable to hold score return value
+        outcome = brd.get_outcome()
+        if outcome == self.player:
+            return self.win_score(brd)
+        if outcome != 0:
+            return -self.win_score(brd)
+        if brd.scoring is not None and brd.profile == self.profile:
+            return brd.scores[self.player - 1]
+        mine = brd.bits[self.player - 1]
+        theirs = brd.bits[2 - self.player]
+        ev = self.get_evaluator(brd)
+        if ev is not None:
+            return ev.score(mine, theirs)
         total_score = 0
-        # get an array a of available moves for each column
-        moves = self.validMoves(brd)
-        # iterate through every column
-        for col in range(brd.w):
-            row = moves[col]
-            # if the row is full, proceed to next column
-            if row == -1:
-                continue
-            # TODO ADD: Set variable to vertical heuristic function
-            vertical_score = self.verticalHeuristic(row, col, brd)
-            if vertical_score == (10 ** (brd.n-1)) or vertical_score == -(10 ** (brd.n-1)):
-                return vertical_score
-            total_score += vertical_score
-
-            # TODO ADD: Set variable to horizontal heuristic function
-            horizontal_score = self.horizontalHeuristic(row, col, brd)
-            if horizontal_score == (10 ** (brd.n-1)) or horizontal_score == -(10 ** (brd.n-1)):
-                return horizontal_score
-            total_score += horizontal_score
-
-            # TODO ADD: Set variable to diagonal up heuristic function
-            diagonal_up = self.diagonalUpHeuristic(row, col, brd)
-            if diagonal_up == (10 ** (brd.n-1)) or diagonal_up == -(10 ** (brd.n-1)):
-                return diagonal_up
-            total_score += diagonal_up
-
-            # TODO ADD: Set variable to diagonal down heuristic function
-            diagonal_down = self.diagonalDownHeuristic(row, col, brd)
-            if diagonal_down == (10 ** (brd.n-1)) or diagonal_down == -(10 ** (brd.n-1)):
-                return diagonal_down
-            total_score += diagonal_down
+        for mask in brd.lines.masks:
+            total_score += self.line_score(bin(mine & mask).count("1"),
+                                           bin(theirs & mask).count("1"))
         return total_score
 
-    # Find the board state that returns the lowest value
+    # Evaluate all the children of a node at once, if they are leaves
+    #
+    # PARAM [board.Board] brd: the current board state
+    # PARAM [list of int] cols: the moves to evaluate
+    # PARAM [int] curr_depth: the depth of the node
+    # RETURN [list of int]: the heuristic value of the board after each move,
+    #                       or None if the children must be searched
+    #
+    def leaf_values(self, brd, cols, curr_depth):
+        if curr_depth + 1 != self.depth:
+            return None
+        if brd.scoring is not None and brd.profile == self.profile:
+            # The board keeps the score up to date, each child is a move away
+            self.nodes += len(cols)
+            self.leaves += len(cols)
+            values = []
+            for col in cols:
+                brd.play(col)
+                values.append(self.heuristic(brd))
+                brd.undo()
+            return values
+        ev = self.get_evaluator(brd)
+        if ev is None:
+            return None
+        self.nodes += len(cols)
+        self.leaves += len(cols)
+        pos = [col * brd.stride + brd.heights[col] for col in cols]
+        values = ev.score_children(brd.bits[self.player - 1], brd.bits[2 - self.player],
+                                   pos, brd.player == self.player).tolist()
+        # Children that end the game are scored as such
+        for i, col in enumerate(cols):
+            brd.play(col)
+            if brd.outcome != 0:
+                values[i] = self.heuristic(brd)
+            brd.undo()
+        return values
+
+    # Find the value of the board for the player to move, who is the opponent
     #
-    # PARAM [list of board.Board]: The list of successive board states
-    # PARAM [int]: The current maximum value found, used for Alpha-Beta Pruning
+    # PARAM [board.Board] brd: The board state, modified in place and restored
+    # PARAM [int]: The value this agent is already assured of (alpha)
+    # PARAM [int]: The value the opponent is already assured of (beta)
     # PARAM [int]: The current depth of the nodes
-    # RETURN [int]: Minimum value found
-    #
-    def find_min(self, states, max_val, curr_depth):
-        # Check to see if no states are returned
-        # TODO: Figure out what to do
-        # Check to see if the current depth is the maximum depth
-        if curr_depth == self.max_depth:
-            min_state_value = float("inf")
-            for state in states:
-                curr_value = self.heuristic(self, state)
-                if curr_value < min_state_value:
-                    min_state_value = curr_value
-        else:
-            # Init min state value to positive infinity
-            min_state_value = float("inf")
-            # Iterate through the successive states and find the max for each, increment the depth
-            for state in states:
-                curr_value = self.find_max(state, max_val, curr_depth + 1)
-                if curr_value < min_state_value:
-                    min_state_value = curr_value
+    # RETURN [int]: Minimum value found, or a bound on it if outside (alpha, beta)
+    #
+    def find_min(self, brd, alpha, beta, curr_depth):
+        self.nodes += 1
+        self.check_time()
+        # Check to see if the game is over or the current depth is the maximum depth
+        if brd.is_over() or curr_depth == self.depth:
+            self.leaves += 1
+            return self.heuristic(brd)
+        # Prune with the best value found at the root by the other workers
+        if alpha < self.root_alpha < beta:
+            alpha = self.root_alpha
+        # Reuse the value of this position if it was searched deep enough
+        (alpha_orig, beta_orig) = (alpha, beta)
+        (alpha, beta, value) = self.probe(brd, alpha, beta, curr_depth)
+        if value is not None:
+            return value
+        # Init min state value to positive infinity
+        min_state_value = math.inf
+        best_col = None
+        # Iterate through the successive states and find the max for each, increment the depth
+        cols = self.ordered_moves(brd, curr_depth)
+        leaves = self.leaf_values(brd, cols, curr_depth)
+        for i, col in enumerate(cols):
+            if leaves is not None:
+                curr_value = leaves[i]
+            else:
+                brd.play(col)
+                curr_value = self.find_max(brd, alpha, beta, curr_depth + 1)
+                brd.undo()
+            if curr_value < min_state_value:
+                min_state_value = curr_value
+                best_col = col
+                if curr_value < beta:
+                    beta = curr_value
+                    # This agent will not let the game get here
+                    if alpha >= beta:
+                        self.record_cutoff(brd, col, curr_depth, i)
+                        break
+        self.store(brd, min_state_value, alpha_orig, beta_orig, curr_depth, best_col)
         return min_state_value
 
 
@@ -223,6 +731,9 @@ class AlphaBetaAgent(agent.Agent):
     # RETURN [list of (board.Board, int)]: a list of the successor boards,
     #                                      along with the column where the last
     #                                      token was added in it
+    #
+    # NOTE: the search does not use this, it plays and takes back moves on a
+    #       single board instead.
     def get_successors(self, brd):
         """Returns the reachable boards from the given board brd. The return value is a tuple (new board state, column number where last token was added)."""
         # Get possible actions
@@ -241,3 +752,67 @@ class AlphaBetaAgent(agent.Agent):
             # Add board to list of successors
             succ.append((nb,col))
         return succ
+
+
+###########################################
+# Worker processes of the parallel search #
+###########################################
+
+# Value of the shared alpha before any root move is searched
+NO_ALPHA = -(1 << 62)
+
+# Agent searching in this worker process
+_worker_agent = None
+# Best value found so far at the root, shared by all the workers
+_shared_alpha = None
+
+# Set up a worker process.
+#
+# PARAM [multiprocessing.Value] shared_alpha: the best value found so far at the root
+# PARAM [string]                name:         the name of the agent
+# PARAM [int]                   max_depth:    the maximum search depth
+# PARAM [int]                   tt_size:      the number of entries of the transposition table
+# PARAM [function]              profile:      the scoring profile of the heuristic
+# PARAM [Bool]                  incremental:  True if the board maintains the heuristic
+def _init_worker(shared_alpha, name, max_depth, tt_size, profile, incremental):
+    global _worker_agent, _shared_alpha
+    _worker_agent = AlphaBetaAgent(name, max_depth, tt_size, profile=profile,
+                                   incremental=incremental)
+    _worker_agent.worker_alpha = shared_alpha
+    _shared_alpha = shared_alpha
+
+# Search a root move in a worker process.
+#
+# PARAM [board.Board] brd:       the board before the move
+# PARAM [int]         col:       the move to search
+# PARAM [int]         player:    the player of the searching agent
+# PARAM [int]         depth:     the depth of the current iteration
+# PARAM [float]       stop_time: the time at which the search is aborted, None for no limit
+# PARAM [int]         search:    the number of the search, to age the transposition table
+# RETURN [(int, int, int, int, int)]: the value of the move, or None if aborted, and the
+#                                    numbers of nodes, leaves, cutoffs and first-move cutoffs
+def _search_root_move(brd, col, player, depth, stop_time, search):
+    ag = _worker_agent
+    ag.player = player
+    if search != ag.searches:
+        ag.start_search(brd)
+        ag.searches = search
+    ag.depth = depth
+    ag.stop_time = stop_time
+    before = (ag.nodes, ag.leaves, ag.cutoffs, ag.first_cutoffs)
+    ag.root_alpha = -math.inf
+    ag.read_root_alpha()
+    brd.play(col)
+    try:
+        value = ag.find_min(brd, ag.root_alpha, math.inf, 1)
+    except SearchTimeout:
+        value = None
+    counts = (ag.nodes - before[0], ag.leaves - before[1],
+              ag.cutoffs - before[2], ag.first_cutoffs - before[3])
+    if value is None:
+        return (None,) + counts
+    # Let the other workers prune with this value
+    with _shared_alpha.get_lock():
+        if value > _shared_alpha.value:
+            _shared_alpha.value = value
+    return (value,) + counts
@@ -0,0 +1,241 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+import board
+import alpha_beta_agent as aba
+
+#############
+# Positions #
+#############
+
+# Board geometries benchmarked: (w, h, n)
+GEOMETRIES = [(7, 6, 4), (5, 4, 3), (9, 7, 5)]
+
+# Number of random moves played to reach each benchmarked position, as a
+# fraction of the number of cells: the empty board, an early and a middle game
+PLIES = [0, 0.25, 0.5]
+
+# Build a fixed position.
+#
+# The moves are drawn from a generator seeded with the geometry and the
+# number of moves, so the position is the same on every run. Games that end
+# early, or that reach a position where a player can win with a single token,
+# which the search would settle at once, are replayed with the next seed.
+#
+# PARAM [int] w:     the board width
+# PARAM [int] h:     the board height
+# PARAM [int] n:     the number of tokens to line up to win
+# PARAM [int] plies: the number of moves to play
+# RETURN [board.Board]: the position
+def position(w, h, n, plies):
+    """Returns the fixed benchmark position of plies moves for the geometry"""
+    attempt = 0
+    while True:
+        rnd = random.Random("bench %d %d %d %d %d" % (w, h, n, plies, attempt))
+        brd = board.Board([[0] * w for i in range(h)], w, h, n)
+        for i in range(plies):
+            if brd.is_over():
+                break
+            brd.play(rnd.choice(brd.free_cols()))
+        if not brd.is_over() and not has_winning_move(brd):
+            return brd
+        attempt += 1
+
+# Check if a player can win with a single token.
+#
+# PARAM [board.Board] brd: the position
+# RETURN [Bool]: True if either player has a winning move
+def has_winning_move(brd):
+    for bits in brd.bits:
+        for col in brd.free_cols():
+            pos = col * brd.stride + brd.heights[col]
+            if brd.has_line(bits | (1 << pos)):
+                return True
+    return False
+
+# Get the name of a position.
+#
+# PARAM [board.Board] brd: the position
+# RETURN [string]: the geometry and number of tokens, such as "7x6n4+8"
+def position_name(brd):
+    return "%dx%dn%d+%d" % (brd.w, brd.h, brd.n, brd.tokens)
+
+####################
+# Micro-benchmarks #
+####################
+
+# Time a function.
+#
+# The number of calls per repeat is raised until a repeat takes a tenth of
+# the budget, then five repeats are timed.
+#
+# PARAM [callable] fn:     the function to time, called without arguments
+# PARAM [float]    budget: the approximate time to spend, in seconds
+# RETURN [float]: the best time of a call, in seconds
+def time_call(fn, budget):
+    """Returns the best time per call of fn over a few repeats"""
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= budget / 10:
+            break
+        number *= 2 if elapsed >= budget / 100 else 10
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+# Micro-benchmarked operations
+OPS = ["copy", "get_outcome", "scan_outcome", "add_token", "add_token_scored", "free_cols",
+       "heuristic", "heuristic_python", "heuristic_incremental"]
+
+# Benchmark the board operations and the evaluation on a position.
+#
+# PARAM [board.Board]    brd:    the position
+# PARAM [float]          budget: the approximate time to spend per benchmark, in seconds
+# PARAM [list of string] ops:    the operations to benchmark, among OPS
+# RETURN [dict of string:float]: the time per call of each operation, in seconds
+#
+# NOTE: add_token is timed with the undo() that restores the board,
+#       heuristic_python is the heuristic without NumPy, and the _scored and
+#       _incremental variants run on a board that maintains the evaluation.
+def micro_benchmarks(brd, budget, ops=OPS):
+    """Returns the time per call of each board operation and evaluation"""
+    col = brd.free_cols()[len(brd.free_cols()) // 2]
+    searcher = aba.AlphaBetaAgent("bench", 1)
+    searcher.player = brd.player
+    scored = brd.copy()
+    scored.enable_scoring(searcher.profile)
+    def add_token():
+        brd.add_token(col)
+        brd.undo()
+    def add_token_scored():
+        scored.add_token(col)
+        scored.undo()
+    def heuristic_python():
+        saved = aba.evaluator
+        aba.evaluator = None
+        try:
+            return searcher.heuristic(brd)
+        finally:
+            aba.evaluator = saved
+    calls = {
+        "copy": brd.copy,
+        "get_outcome": brd.get_outcome,
+        "scan_outcome": brd.scan_outcome,
+        "add_token": add_token,
+        "add_token_scored": add_token_scored,
+        "free_cols": brd.free_cols,
+        "heuristic": lambda: searcher.heuristic(brd),
+        "heuristic_python": heuristic_python,
+        "heuristic_incremental": lambda: searcher.heuristic(scored),
+    }
+    return dict((op, time_call(calls[op], budget)) for op in ops)
+
+#################
+# Time to depth #
+#################
+
+# Time the search of a position to a fixed depth.
+#
+# The search starts from empty tables every time, and the endgame solver and
+# opening book are not used.
+#
+# PARAM [board.Board] brd:     the position
+# PARAM [int]         depth:   the search depth
+# PARAM [int]         repeat:  the number of searches, the best time is kept
+# RETURN [dict]: the best time in seconds, the nodes visited and the move found
+def time_to_depth(brd, depth, repeat):
+    """Returns the time to search the position to the given depth"""
+    searcher = aba.AlphaBetaAgent("bench", depth, solve_below=0)
+    searcher.player = brd.player
+    best = None
+    for i in range(repeat):
+        searcher.new_game()
+        start = time.perf_counter()
+        col = searcher.go(brd)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {"seconds": best, "nodes": searcher.nodes, "move": col}
+
+##############
+# Full suite #
+##############
+
+# Run the benchmarks.
+#
+# PARAM [float] budget: the approximate time per micro-benchmark, in seconds
+# PARAM [int]   depth:  the search depth of the time-to-depth benchmarks
+# PARAM [int]   repeat: the number of searches per time-to-depth benchmark
+# PARAM [string] only:  run only the benchmarks whose name contains this, None for all
+# RETURN [dict]: the results, by benchmark name
+def run(budget=0.2, depth=6, repeat=3, only=None):
+    """Runs the benchmark suite and returns the results"""
+    results = {}
+    for (w, h, n) in GEOMETRIES:
+        for fraction in PLIES:
+            brd = position(w, h, n, int(fraction * w * h))
+            name = position_name(brd)
+            prefix = "board/%s/" % name
+            ops = [op for op in OPS if only is None or only in prefix + op]
+            for op, t in micro_benchmarks(brd, budget, ops).items():
+                results[prefix + op] = {"seconds": t}
+            key = "search/%s/depth%d" % (name, depth)
+            if only is None or only in key:
+                results[key] = time_to_depth(brd, depth, repeat)
+    return results
+
+# Compare results with a baseline.
+#
+# Only the timings are compared; a benchmark missing from either side is skipped.
+#
+# PARAM [dict]  results:   the results of run()
+# PARAM [dict]  baseline:  the results of an earlier run
+# PARAM [float] threshold: the relative slowdown above which a benchmark regressed
+# RETURN [list of (string, float, float)]: the name, baseline time and new time of
+#                                          each regression
+def compare(results, baseline, threshold):
+    """Returns the benchmarks that are slower than the baseline by more than threshold"""
+    regressions = []
+    for name, r in sorted(results.items()):
+        b = baseline.get(name)
+        if b is None:
+            continue
+        if r["seconds"] > b["seconds"] * (1 + threshold):
+            regressions.append((name, b["seconds"], r["seconds"]))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ConnectN board, evaluation and search")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative slowdown counted as a regression (default 0.25)")
+    parser.add_argument("--depth", type=int, default=6, help="depth of the time-to-depth benchmarks")
+    parser.add_argument("--budget", type=float, default=0.2,
+                        help="approximate time per micro-benchmark, in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="searches per time-to-depth benchmark")
+    parser.add_argument("--only", default=None, help="run only the benchmarks whose name contains this")
+    args = parser.parse_args()
+    results = run(args.budget, args.depth, args.repeat, args.only)
+    for name, r in sorted(results.items()):
+        extra = "  (%d nodes)" % r["nodes"] if "nodes" in r else ""
+        print("%-40s %12.3f us%s" % (name, r["seconds"] * 1e6, extra))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(),
+                       "machine": platform.machine(),
+                       "results": results}, f, indent=1, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for (name, before, after) in regressions:
+            print("REGRESSION %s: %.3f us -> %.3f us (+%.0f%%)" %
+                  (name, before * 1e6, after * 1e6, 100 * (after / before - 1)))
+        if regressions:
+            sys.exit(1)
+        print("No regression beyond %.0f%%" % (100 * args.threshold))
@@ -1,9 +1,115 @@
-import copy
+import random
+import scoring
+
+###################
+# Zobrist hashing #
+###################
+
+# Zobrist keys by board geometry
+_zobrist = {}
+
+# Get the Zobrist keys for a board geometry.
+#
+# The keys are drawn from a fixed seed, so that hashes are the same across
+# runs and processes, and the global random generator is left untouched.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# RETURN [(list of list of int, int, list of list of int)]: the key of each bit
+#        for Player 1 and Player 2, the key of Player 2 to move, and the key
+#        of each bit's mirror image across the middle column
+def zobrist_keys(w, h):
+    """Returns the Zobrist keys for a board of size w*h"""
+    keys = _zobrist.get((w, h))
+    if keys is None:
+        rnd = random.Random("zobrist %d %d" % (w, h))
+        stride = h + 1
+        size = w * stride
+        bits = [[rnd.getrandbits(64) for i in range(size)] for p in range(2)]
+        side = rnd.getrandbits(64)
+        # Bit x*stride+y of the mirror image is bit (w-1-x)*stride+y
+        mirror = [[bits[p][(w - 1 - i // stride) * stride + i % stride] for i in range(size)]
+                  for p in range(2)]
+        keys = (bits, side, mirror)
+        _zobrist[(w, h)] = keys
+    return keys
+
+###############
+# Line tables #
+###############
+
+class LineTable(object):
+    """All the lines of n cells of a board geometry"""
+
+    # Class constructor.
+    #
+    # PARAM [int] w: the board width
+    # PARAM [int] h: the board height
+    # PARAM [int] n: the number of tokens to line up to win
+    #
+    # NOTE: use line_table() instead, which builds each table only once.
+    def __init__(self, w, h, n):
+        """Class constructor"""
+        self.w = w
+        self.h = h
+        self.n = n
+        stride = h + 1
+        # Bit positions of the cells of each line
+        self.lines = []
+        # Bitmask of each line
+        self.masks = []
+        # Index of the line starting at (x,y) in direction (dx,dy)
+        self.starts = {}
+        # Bitmasks and indices of the lines through each cell, by bit position
+        cell_masks = [[] for i in range(w * stride)]
+        cell_lines = [[] for i in range(w * stride)]
+        for (dx, dy) in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            for x in range(w - (n - 1) * dx):
+                for y in range(h):
+                    if not 0 <= y + (n - 1) * dy < h:
+                        continue
+                    line = tuple((x + i * dx) * stride + y + i * dy for i in range(n))
+                    mask = 0
+                    for pos in line:
+                        mask |= 1 << pos
+                    for pos in line:
+                        cell_masks[pos].append(mask)
+                        cell_lines[pos].append(len(self.lines))
+                    self.starts[(x, y, dx, dy)] = len(self.lines)
+                    self.lines.append(line)
+                    self.masks.append(mask)
+        self.cell_masks = [tuple(m) for m in cell_masks]
+        self.cell_lines = [tuple(l) for l in cell_lines]
+
+# Line tables by board geometry
+_line_tables = {}
+
+# Get the line table of a board geometry.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# PARAM [int] n: the number of tokens to line up to win
+# RETURN [board.LineTable]: the table, built on first use
+def line_table(w, h, n):
+    """Returns the table of all the lines of n cells on a w*h board"""
+    table = _line_tables.get((w, h, n))
+    if table is None:
+        table = LineTable(w, h, n)
+        _line_tables[(w, h, n)] = table
+    return table
 
 ##############
 # Game Board #
 ##############
 
+# The board is stored as a pair of bitboards, one per player.
+#
+# Each column uses h+1 consecutive bits: bits 0..h-1 are the cells of the
+# column from the bottom up, and bit h is an always-empty sentinel that stops
+# lines from wrapping from the top of a column into the bottom of the next.
+# The cell (x,y) therefore lives at bit x*(h+1)+y, and a step of (dx,dy) on
+# the board is a shift by dx*(h+1)+dy bits.
+
 class Board(object):
 
     # Class constructor.
@@ -14,8 +120,6 @@ class Board(object):
     # PARAM [int]            n:     the number of tokens to line up to win
     def __init__(self, board, w, h, n):
         """Class constructor"""
-        # Board data
-        self.board = board
         # Board width
         self.w = w
         # Board height
@@ -24,16 +128,120 @@ class Board(object):
         self.n = n
         # Current player
         self.player = 1
+        # Bits per column, including the sentinel bit
+        self.stride = h + 1
+        # Lines of n cells, shared by all the boards of this geometry
+        self.lines = line_table(w, h, n)
+        # Bitboards of the tokens of Player 1 and Player 2
+        self.bits = [0, 0]
+        # Number of tokens in each column
+        self.heights = [0] * w
+        # Board data
+        for y in range(h):
+            for x in range(w):
+                t = board[y][x]
+                if t != 0:
+                    self.bits[t-1] |= 1 << (x * self.stride + y)
+                    self.heights[x] = max(self.heights[x], y + 1)
+        # Total number of tokens on the board
+        self.tokens = sum(self.heights)
+        # Cell (x,y) of the last token added, None if unknown
+        self.last_move = None
+        # Move stack: (column, previous outcome, previous last move) per move
+        self.history = []
+        # Zobrist keys and incrementally updated hash of the position, and of
+        # its mirror image across the middle column
+        (self.zobrist, self.zobrist_side, self.zobrist_mirror) = zobrist_keys(w, h)
+        self.hash = 0
+        self.mirror_hash = 0
+        for p in range(2):
+            for i in range(w * self.stride):
+                if self.bits[p] >> i & 1:
+                    self.hash ^= self.zobrist[p][i]
+                    self.mirror_hash ^= self.zobrist_mirror[p][i]
+        # Cached game outcome
+        self.outcome = self.scan_outcome()
+        # Incremental evaluation, off until enable_scoring() is called
+        self.disable_scoring()
 
     # Clone a board.
     #
-    # RETURN [board.Board]: a deep copy of this object
+    # RETURN [board.Board]: a copy of this object
     def copy(self):
         """Returns a copy of this board that can be independently modified"""
-        cpy = Board(copy.deepcopy(self.board), self.w, self.h, self.n)
+        cpy = Board.__new__(Board)
+        cpy.w = self.w
+        cpy.h = self.h
+        cpy.n = self.n
         cpy.player = self.player
+        cpy.stride = self.stride
+        cpy.lines = self.lines
+        cpy.bits = self.bits[:]
+        cpy.heights = self.heights[:]
+        cpy.tokens = self.tokens
+        cpy.last_move = self.last_move
+        cpy.history = self.history[:]
+        cpy.zobrist = self.zobrist
+        cpy.zobrist_side = self.zobrist_side
+        cpy.zobrist_mirror = self.zobrist_mirror
+        cpy.hash = self.hash
+        cpy.mirror_hash = self.mirror_hash
+        cpy.outcome = self.outcome
+        cpy.profile = self.profile
+        cpy.scoring = self.scoring
+        if self.scoring is not None:
+            cpy.line_counts = [self.line_counts[0][:], self.line_counts[1][:]]
+            cpy.scores = self.scores[:]
+            cpy.threats = self.threats[:]
+        else:
+            (cpy.line_counts, cpy.scores, cpy.threats) = (None, None, None)
         return cpy
 
+    # Get the state to pickle.
+    #
+    # RETURN [dict]: the attributes, without the tables shared by all the boards of this geometry
+    def __getstate__(self):
+        """Returns the state to pickle"""
+        state = self.__dict__.copy()
+        del state["lines"]
+        del state["zobrist"]
+        del state["zobrist_side"]
+        del state["zobrist_mirror"]
+        return state
+
+    # Restore a pickled state.
+    #
+    # PARAM [dict] state: the pickled attributes
+    def __setstate__(self, state):
+        """Restores a pickled state"""
+        self.__dict__.update(state)
+        self.lines = line_table(self.w, self.h, self.n)
+        (self.zobrist, self.zobrist_side, self.zobrist_mirror) = zobrist_keys(self.w, self.h)
+
+    # The board configuration as a 2D list.
+    #
+    # RETURN [2D list of int]: the board configuration, row-major
+    #
+    # NOTE: this is a snapshot; modifying it does not modify the board.
+    @property
+    def board(self):
+        """Returns the board configuration as a row-major 2D list"""
+        return [[self.token_at(x, y) for x in range(self.w)] for y in range(self.h)]
+
+    # Get the token at (x,y)
+    #
+    # PARAM [int] x: the x coordinate of the cell
+    # PARAM [int] y: the y coordinate of the cell
+    # RETURN [int]: 1 for Player 1, 2 for Player 2, and 0 for an empty cell
+    def token_at(self, x, y):
+        """Returns the token at (x,y): 1 for Player 1, 2 for Player 2, and 0 for an empty cell"""
+        bit = 1 << (x * self.stride + y)
+        if self.bits[0] & bit:
+            return 1
+        if self.bits[1] & bit:
+            return 2
+        return 0
+
     # Check if a line of identical tokens exists starting at (x,y) in direction (dx,dy)
     #
     # PARAM [int] x:  the x coordinate of the starting cell
@@ -43,17 +251,16 @@ class Board(object):
     # RETURN [Bool]: True if n tokens of the same type have been found, False otherwise
     def is_line_at(self, x, y, dx, dy):
         """Return True if a line of identical tokens exists starting at (x,y) in direction (dx,dy)"""
+        line = self.lines.starts.get((x, y, dx, dy))
         # Avoid out-of-bounds errors
-        if ((x + (self.n-1) * dx >= self.w) or
-            (y + (self.n-1) * dy < 0) or (y + (self.n-1) * dy >= self.h)):
+        if line is None:
             return False
-        # Get token at (x,y)
-        t = self.board[y][x]
-        # Go through elements
-        for i in range(1, self.n):
-            if self.board[y + i*dy][x + i*dx] != t:
-                return False
-        return True
+        mask = self.lines.masks[line]
+        # Compare with the token at (x,y)
+        t = self.token_at(x, y)
+        if t == 0:
+            return (self.bits[0] | self.bits[1]) & mask == 0
+        return self.bits[t-1] & mask == mask
 
     # Check if a line of identical tokens exists starting at (x,y) in any direction
     #
@@ -67,16 +274,79 @@ class Board(object):
                 self.is_line_at(x, y, 1, 1) or # Diagonal up
                 self.is_line_at(x, y, 1, -1)) # Diagonal down
 
+    # Check if a bitboard contains n tokens in a row in any direction
+    #
+    # PARAM [int] bits: the bitboard of a player
+    # RETURN [Bool]: True if the bitboard contains a line of n tokens
+    def has_line(self, bits):
+        """Return True if the bitboard bits contains a line of n tokens"""
+        for step in (1,                # Vertical
+                     self.stride,      # Horizontal
+                     self.stride + 1,  # Diagonal up
+                     self.stride - 1): # Diagonal down
+            # m has a bit set wherever a run of k tokens starts; the run
+            # length is doubled at each step until it reaches n
+            m = bits
+            k = 1
+            while m and k < self.n:
+                s = min(k, self.n - k)
+                m &= m >> (s * step)
+                k += s
+            if m:
+                return True
+        return False
+
+    # Check if the token at (x,y) is part of a line of n identical tokens
+    #
+    # PARAM [int] x: the x coordinate of the cell
+    # PARAM [int] y: the y coordinate of the cell
+    # RETURN [Bool]: True if a line of n tokens passes through (x,y)
+    #
+    # NOTE: only the lines through (x,y) are looked at.
+    def is_win_at(self, x, y):
+        """Return True if the token at (x,y) is part of a line of n identical tokens"""
+        t = self.token_at(x, y)
+        if t == 0:
+            return False
+        bits = self.bits[t-1]
+        for mask in self.lines.cell_masks[x * self.stride + y]:
+            if bits & mask == mask:
+                return True
+        return False
+
+    # Calculate the game outcome by scanning the whole board.
+    #
+    # RETURN [int]: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    def scan_outcome(self):
+        """Returns the winner of the game, looking at the whole board"""
+        if self.has_line(self.bits[0]):
+            return 1
+        if self.has_line(self.bits[1]):
+            return 2
+        return 0
+
     # Calculate the game outcome.
     #
     # RETURN [int]: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    #
+    # NOTE: the outcome is cached and updated by add_token(), so this is O(1).
     def get_outcome(self):
         """Returns the winner of the game: 1 for Player 1, 2 for Player 2, and 0 for no winner"""
-        for x in range(self.w):
-            for y in range(self.h):
-                if (self.board[y][x] != 0) and self.is_any_line_at(x,y):
-                    return self.board[y][x]
-        return 0
+        return self.outcome
+
+    # Check if the board is full.
+    #
+    # RETURN [Bool]: True if no token can be added anymore
+    def is_full(self):
+        """Returns True if all the cells are occupied"""
+        return self.tokens == self.w * self.h
+
+    # Check if the game is over.
+    #
+    # RETURN [Bool]: True if a player won or the board is full
+    def is_over(self):
+        """Returns True if a player won or the board is full"""
+        return self.outcome != 0 or self.tokens == self.w * self.h
 
     # Adds a token for the current player at the given column
     #
@@ -85,23 +355,167 @@ class Board(object):
     # NOTE: This method switches the current player.
     def add_token(self, x):
         """Adds a token for the current player at column x; the column is assumed not full"""
+        self.play(x)
+
+    # Plays a move in place, so that it can be taken back with undo()
+    #
+    # PARAM [int] x: The column where the token must be added; the column is assumed not full.
+    #
+    # NOTE: This method switches the current player.
+    def play(self, x):
+        """Adds a token for the current player at column x and pushes the move on the move stack"""
+        self.history.append((x, self.outcome, self.last_move))
         # Find empty slot for token
-        y = 0
-        while self.board[y][x] != 0:
-            y = y + 1
-        self.board[y][x] = self.player
+        y = self.heights[x]
+        pos = x * self.stride + y
+        self.bits[self.player-1] |= 1 << pos
+        self.hash ^= self.zobrist[self.player-1][pos] ^ self.zobrist_side
+        self.mirror_hash ^= self.zobrist_mirror[self.player-1][pos] ^ self.zobrist_side
+        self.heights[x] = y + 1
+        self.tokens += 1
+        self.last_move = (x, y)
+        if self.scoring is not None:
+            self.count_token(pos, self.player - 1, 1)
+        # Only the lines through the new token can have changed the outcome
+        if self.outcome == 0 and self.is_win_at(x, y):
+            self.outcome = self.player
         # Switch player
         if self.player == 1:
             self.player = 2
         else:
             self.player = 1
 
+    # Takes back the last move played
+    #
+    # RETURN [int]: the column of the move taken back
+    #
+    # NOTE: This method switches the current player back.
+    def undo(self):
+        """Removes the last token added and restores the previous board state"""
+        (x, self.outcome, self.last_move) = self.history.pop()
+        # Switch player back
+        if self.player == 1:
+            self.player = 2
+        else:
+            self.player = 1
+        # Remove token
+        y = self.heights[x] - 1
+        pos = x * self.stride + y
+        self.bits[self.player-1] &= ~(1 << pos)
+        self.hash ^= self.zobrist[self.player-1][pos] ^ self.zobrist_side
+        self.mirror_hash ^= self.zobrist_mirror[self.player-1][pos] ^ self.zobrist_side
+        self.heights[x] = y
+        self.tokens -= 1
+        if self.scoring is not None:
+            self.count_token(pos, self.player - 1, -1)
+        return x
+
+    # Maintain the evaluation of the board as moves are played and taken back.
+    #
+    # The number of tokens of each player in every line of n cells is kept up
+    # to date, and with it the score of the board for each player, which is
+    # the sum of the profile's scores of all the lines, and the number of open
+    # threats of each player: the lines holding n-1 of the player's tokens and
+    # none of the opponent's. Reading them is then O(1), and play() and undo()
+    # only update the lines through the cell of the move.
+    #
+    # PARAM [function] profile: the scoring profile, see scoring.py
+    def enable_scoring(self, profile):
+        """Starts maintaining per-line token counts, scores and open threats"""
+        table = scoring.table(profile, self.n)
+        masks = self.lines.masks
+        self.line_counts = [[bin(self.bits[p] & mask).count("1") for mask in masks]
+                            for p in range(2)]
+        (c1, c2) = self.line_counts
+        self.scores = [sum(table[a][b] for a, b in zip(c1, c2)),
+                       sum(table[b][a] for a, b in zip(c1, c2))]
+        n1 = self.n - 1
+        self.threats = [sum(1 for a, b in zip(c1, c2) if a == n1 and b == 0),
+                        sum(1 for a, b in zip(c1, c2) if b == n1 and a == 0)]
+        self.profile = profile
+        self.scoring = table
+
+    # Stop maintaining the evaluation of the board.
+    def disable_scoring(self):
+        """Drops the per-line token counts, scores and open threats"""
+        self.profile = None
+        # Score of a line by token counts, None when the evaluation is not maintained
+        self.scoring = None
+        # Tokens of Player 1 and Player 2 in each line of self.lines
+        self.line_counts = None
+        # Scores of the board for Player 1 and Player 2
+        self.scores = None
+        # Open threats of Player 1 and Player 2
+        self.threats = None
+
+    # Update the evaluation for a token added or removed.
+    #
+    # PARAM [int] pos: the bit position of the token
+    # PARAM [int] p:   the player of the token, 0 for Player 1 and 1 for Player 2
+    # PARAM [int] d:   1 if the token was added, -1 if it was removed
+    def count_token(self, pos, p, d):
+        """Updates the line counts, scores and open threats of the lines through pos"""
+        mine = self.line_counts[p]
+        theirs = self.line_counts[1 - p]
+        table = self.scoring
+        n1 = self.n - 1
+        ds_mine = 0
+        ds_theirs = 0
+        dt_mine = 0
+        dt_theirs = 0
+        for i in self.lines.cell_lines[pos]:
+            a = mine[i]
+            b = theirs[i]
+            a2 = a + d
+            mine[i] = a2
+            ds_mine += table[a2][b] - table[a][b]
+            ds_theirs += table[b][a2] - table[b][a]
+            # Both apply when n is 1
+            if b == 0:
+                dt_mine += (a2 == n1) - (a == n1)
+            if b == n1:
+                dt_theirs += (a2 == 0) - (a == 0)
+        self.scores[p] += ds_mine
+        self.scores[1 - p] += ds_theirs
+        self.threats[p] += dt_mine
+        self.threats[1 - p] += dt_theirs
+
+    # Get the key shared by the position and its mirror image.
+    #
+    # RETURN [int]: the smaller of the hashes of the position and of its mirror image
+    def canonical_key(self):
+        """Returns the hash of the position or of its mirror image, whichever is smaller"""
+        return min(self.hash, self.mirror_hash)
+
+    # Check if the canonical key is the hash of the mirror image.
+    #
+    # RETURN [Bool]: True if moves must be mirrored to and from the canonical position
+    def is_mirrored(self):
+        """Returns True if the canonical position is the mirror image of this one"""
+        return self.mirror_hash < self.hash
+
+    # Convert a move to the canonical position.
+    #
+    # PARAM [int] x: a column of this position
+    # RETURN [int]: the same move in the position of canonical_key()
+    def canonical_move(self, x):
+        """Returns the column x as seen in the canonical position"""
+        return self.w - 1 - x if self.mirror_hash < self.hash else x
+
+    # Convert a move of the canonical position back to this position.
+    #
+    # PARAM [int] x: a column of the position of canonical_key()
+    # RETURN [int]: the same move in this position
+    def uncanonical_move(self, x):
+        """Returns the column x of the canonical position as seen in this position"""
+        return self.w - 1 - x if self.mirror_hash < self.hash else x
+
     # Returns a list of the columns with at least one free slot.
     #
     # RETURN [list of int]: the columns with at least one free slot
     def free_cols(self):
         """Returns a list of the columns with at least one free slot"""
-        return [x for x in range(self.w) if self.board[-1][x] == 0 ]
+        return [x for x in range(self.w) if self.heights[x] < self.h]
 
     # Prints the current board state.
     def print_it(self):
@@ -109,10 +523,11 @@ class Board(object):
         for y in range(self.h-1, -1, -1):
             print("|", sep='', end='')
             for x in range(self.w):
-                if self.board[y][x] == 0:
+                t = self.token_at(x, y)
+                if t == 0:
                     print(" ", end='')
                 else:
-                    print(self.board[y][x], end='')
+                    print(t, end='')
             print("|")
         print("+", "-" * self.w, "+", sep='')
         print(" ", end='')
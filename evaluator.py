@@ -0,0 +1,87 @@
+import numpy as np
+import board
+
+#######################
+# Windowed evaluation #
+#######################
+
+# Index arrays of the lines of board.line_table(), by board geometry
+_lines = {}
+
+# Get the bit positions of every line of n cells on a w*h board.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# PARAM [int] n: the number of tokens to line up to win
+# RETURN [2D numpy array of int]: one row of n bit positions per line
+def line_indices(w, h, n):
+    """Returns an array with the bit positions of every line of n cells"""
+    lines = _lines.get((w, h, n))
+    if lines is None:
+        rows = board.line_table(w, h, n).lines
+        lines = np.array(rows, dtype=np.intp).reshape(len(rows), n)
+        _lines[(w, h, n)] = lines
+    return lines
+
+class Evaluator(object):
+    """Scores boards by looking at all the lines of n cells at once"""
+
+    # Class constructor.
+    #
+    # PARAM [int]      w:          the board width
+    # PARAM [int]      h:          the board height
+    # PARAM [int]      n:          the number of tokens to line up to win
+    # PARAM [function] line_score: maps (own tokens, opponent tokens) in a line to its score
+    def __init__(self, w, h, n, line_score):
+        """Class constructor"""
+        # Board geometry
+        self.w = w
+        self.h = h
+        self.n = n
+        # Number of bits of a bitboard
+        self.size = w * (h + 1)
+        # Number of bytes of a bitboard
+        self.nbytes = (self.size + 7) // 8
+        # Bit positions of each line
+        self.lines = line_indices(w, h, n)
+        # Score of a line, by number of own and opponent tokens in it
+        self.table = np.array([[line_score(m, t) for t in range(n + 1)] for m in range(n + 1)],
+                              dtype=np.int64)
+
+    # Convert a bitboard to an array of cells.
+    #
+    # PARAM [int] bits: the bitboard
+    # RETURN [numpy array of uint8]: 1 for each bit set, 0 otherwise
+    def cells(self, bits):
+        """Returns the bitboard bits as an array of 0s and 1s"""
+        raw = np.frombuffer(bits.to_bytes(self.nbytes, 'little'), dtype=np.uint8)
+        return np.unpackbits(raw, bitorder='little')[:self.size]
+
+    # Score a board.
+    #
+    # PARAM [int] mine:   the bitboard of the player the score is for
+    # PARAM [int] theirs: the bitboard of the opponent
+    # RETURN [int]: the sum of the scores of all the lines
+    def score(self, mine, theirs):
+        """Returns the score of the position for the owner of the bitboard mine"""
+        m = self.cells(mine)[self.lines].sum(axis=-1)
+        t = self.cells(theirs)[self.lines].sum(axis=-1)
+        return int(self.table[m, t].sum())
+
+    # Score all the boards reachable from a board in one move.
+    #
+    # PARAM [int]         mine:   the bitboard of the player the score is for
+    # PARAM [int]         theirs: the bitboard of the opponent
+    # PARAM [list of int] pos:    the bit position of the token added in each child
+    # PARAM [Bool]        own:    True if the tokens are added to mine, False if to theirs
+    # RETURN [numpy array of int]: the score of each child
+    def score_children(self, mine, theirs, pos, own):
+        """Returns the scores of the boards obtained by adding a token at each position in pos"""
+        k = len(pos)
+        m = np.tile(self.cells(mine), (k, 1))
+        t = np.tile(self.cells(theirs), (k, 1))
+        if own:
+            m[np.arange(k), pos] = 1
+        else:
+            t[np.arange(k), pos] = 1
+        return self.table[m[:, self.lines].sum(axis=-1), t[:, self.lines].sum(axis=-1)].sum(axis=-1)
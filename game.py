@@ -1,5 +1,9 @@
 import board
 import agent
+import gc
+import stats
+import sys
+import threading
 import time
 
 ########
@@ -11,19 +15,54 @@ class Game(object):
 
     # Class constructor.
     #
-    # PARAM [int]         w:  the board width
-    # PARAM [int]         h:  the board height
-    # PARAM [int]         n:  the number of tokens to line up to win
-    # PARAM [agent.Agent] p1: the agent for Player 1
-    # PARAM [agent.Agent] p2: the agent for Player 2
-    def __init__(self, w, h, n, p1, p2):
+    # PARAM [int]                  w:        the board width
+    # PARAM [int]                  h:        the board height
+    # PARAM [int]                  n:        the number of tokens to line up to win
+    # PARAM [agent.Agent]          p1:       the agent for Player 1
+    # PARAM [agent.Agent]          p2:       the agent for Player 2
+    # PARAM [records.RecordWriter] recorder: where to record the game, None not to record it
+    # PARAM [Bool]                 ponder:   whether agents think on the opponent's time
+    # PARAM [profiling.Profiler]   profiler: the profiler of the agents' moves, None not to profile them
+    # PARAM [Bool]                 collect_between_moves: whether the garbage collector is
+    #                                        held off while a timed move is searched
+    #
+    # NOTE: pondering agents run in a thread, so with CPython's global
+    #       interpreter lock they take CPU time from the agent to move. In a
+    #       timed game, pondering stops halfway through the time limit, so
+    #       that the agent to move has the CPU to itself when it must stop.
+    # NOTE: a full collection of large agent tables can take longer than a
+    #       short time limit; with collect_between_moves, it waits for the
+    #       end of the move instead.
+    def __init__(self, w, h, n, p1, p2, recorder=None, ponder=False, profiler=None,
+                 collect_between_moves=False):
         """Class constructor"""
         # Create board
         self.board = board.Board([[0] * w for i in range(h)], w, h, n)
+        # Game record writer
+        self.recorder = recorder
+        # Time taken by each move of a timed game
+        self.times = []
+        # Pondering, and the agent pondering, its thread and the timer that
+        # stops it, if any
+        self.ponder = ponder
+        self.ponder_agent = None
+        self.ponder_thread = None
+        self.ponder_timer = None
+        # Profiler of the moves
+        self.profiler = profiler
+        # Whether the garbage collector is off during timed moves
+        self.collect_between_moves = collect_between_moves
+        # Search statistics of each player, added up over the game, and of each
+        # move as (player index, stats.SearchStats); only filled in for agents
+        # that collect them
+        self.stats = [stats.SearchStats(), stats.SearchStats()]
+        self.move_stats = []
         # Players
         self.players = [ p1, p2 ]
         p1.player = 1
         p2.player = 2
+        p1.new_game()
+        p2.new_game()
 
     # Execute the game.
     #
@@ -32,10 +71,16 @@ class Game(object):
     def go(self):
         # Current player
         p = 0
-        while self.board.free_cols() and self.board.get_outcome() == 0:
+        while not self.board.is_over():
             self.board.print_it()
             # Copy board so player can't modify it
-            x = self.players[p].go(self.board.copy())
+            brd = self.board.copy()
+            self.begin_profile(p)
+            x = self.players[p].go_by(brd, None)
+            self.end_profile()
+            # The opponent stops pondering once the move is known
+            self.end_ponder()
+            self.add_stats(p)
             print(self.players[p].name, "move:", x)
             if not x in self.board.free_cols():
                 print("Illegal move")
@@ -43,9 +88,10 @@ class Game(object):
                 if p == 0:
                     outcome = 2
                 print(self.players[outcome-1].name, "won!")
-                return outcome
+                return self.record(outcome)
             # Legal move, add token there
             self.board.add_token(x)
+            self.start_ponder(p)
             # Switch player
             if p == 0:
                 p = 1
@@ -59,7 +105,7 @@ class Game(object):
             print("It's a tie!")
         else:
             print(self.players[outcome-1].name, "won!")
-        return outcome
+        return self.record(outcome)
 
     # Execute a timed game.
     #
@@ -71,25 +117,125 @@ class Game(object):
     def timed_go(self, limit):
         # Current player
         p = 0
-        while self.board.free_cols() and self.board.get_outcome() == 0:
-            # Get start time
-            st = time.time()
-            # Make move and copy board so player can't modify it
-            x = self.players[p].go(self.board.copy())
-            # Get elapsed time
-            et = time.time() - st
+        while not self.board.is_over():
+            # Copy board so player can't modify it
+            brd = self.board.copy()
+            self.begin_profile(p)
+            # Hold the collector off during the move if asked to
+            collecting = self.collect_between_moves and gc.isenabled()
+            if collecting:
+                gc.disable()
+            try:
+                # Get start time
+                st = time.time()
+                # Make move, telling the player when its time runs out
+                x = self.players[p].go_by(brd, st + limit)
+                # Get elapsed time
+                et = time.time() - st
+            finally:
+                if collecting:
+                    gc.enable()
+            self.end_profile()
+            # The opponent stops pondering once the move is known
+            self.end_ponder()
+            self.add_stats(p)
             # Is the move legal and within the time limit?
             if (not x in self.board.free_cols()) or (et > limit):
                 outcome = 1
                 if p == 0:
                     outcome = 2
-                return outcome
+                return self.record(outcome)
             # Legal move, add token there
+            self.times.append(et)
             self.board.add_token(x)
+            self.start_ponder(p, limit / 2)
             # Switch player
             if p == 0:
                 p = 1
             else:
                 p = 0
         # Return game outcome
-        return self.board.get_outcome()
+        return self.record(self.board.get_outcome())
+
+    # Let a player think on its opponent's time, if pondering is on.
+    #
+    # PARAM [int]   p:     the index of the player who just moved, 0 or 1
+    # PARAM [float] limit: the time after which pondering stops, None for no limit
+    def start_ponder(self, p, limit=None):
+        """Starts the pondering thread of player p"""
+        if not self.ponder or self.board.is_over():
+            return
+        ag = self.players[p]
+        ag.stop_pondering = False
+        self.ponder_agent = ag
+        self.ponder_thread = threading.Thread(target=ag.ponder, args=(self.board.copy(),),
+                                              daemon=True)
+        self.ponder_thread.start()
+        if limit is not None:
+            self.ponder_timer = threading.Timer(limit, setattr, (ag, "stop_pondering", True))
+            self.ponder_timer.start()
+
+    # Stop the pondering player, if any, and wait for it.
+    def end_ponder(self):
+        """Stops the pondering thread"""
+        if self.ponder_thread is not None:
+            if self.ponder_timer is not None:
+                self.ponder_timer.cancel()
+                self.ponder_timer = None
+            self.ponder_agent.stop_pondering = True
+            self.ponder_thread.join()
+            self.ponder_thread = None
+            self.ponder_agent = None
+
+    # Start profiling the move of a player, if profiling is on.
+    #
+    # PARAM [int] p: the index of the player to move, 0 or 1
+    def begin_profile(self, p):
+        """Tells the profiler that player p starts thinking"""
+        if self.profiler is not None:
+            # The agent is called from the frame of go() or timed_go()
+            self.profiler.begin_move(self.players[p].name, p + 1, self.board.tokens,
+                                     sys._getframe(1))
+
+    # Stop profiling the move of a player, if profiling is on.
+    def end_profile(self):
+        """Tells the profiler that the player to move made its move"""
+        if self.profiler is not None:
+            self.profiler.end_move()
+
+    # Add the statistics of the last move of a player, if it collected them.
+    #
+    # PARAM [int] p: the index of the player, 0 or 1
+    def add_stats(self, p):
+        """Adds the last move's search statistics of player p to the game's"""
+        s = self.players[p].last_stats
+        if s is not None:
+            self.stats[p].add(s)
+            self.move_stats.append((p, s))
+
+    # Get the search statistics of every move as dictionaries.
+    #
+    # RETURN [list of dict]: one dictionary per move, ready for stats.write_json_lines()
+    def stats_rows(self):
+        """Returns the search statistics of each move"""
+        return [s.as_dict(agent=self.players[p].name, player=p + 1, ply=i)
+                for i, (p, s) in enumerate(self.move_stats)]
+
+    # Get the moves played so far.
+    #
+    # RETURN [list of int]: the column of each move, in order
+    def moves(self):
+        """Returns the moves played so far"""
+        return [m[0] for m in self.board.history]
+
+    # Record the game, if a record writer was given.
+    #
+    # PARAM [int] outcome: the game outcome
+    # RETURN [int]: the game outcome
+    def record(self, outcome):
+        """Writes the game to the record writer and returns its outcome"""
+        if self.recorder is not None:
+            times = self.times if len(self.times) == len(self.board.history) else None
+            self.recorder.write(self.players[0].name, self.players[1].name,
+                                self.moves(), outcome, times)
+        return outcome
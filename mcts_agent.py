@@ -0,0 +1,257 @@
+import math
+import random
+import time
+import agent
+import stats
+try:
+    import numpy as np
+    import selfplay
+except ImportError:
+    # NumPy is not available, only single rollouts can be used
+    np = None
+
+####################
+# Monte Carlo tree #
+####################
+
+class Node(object):
+    """Node of the Monte Carlo search tree"""
+
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins", "key", "outcome")
+
+    # Class constructor.
+    #
+    # PARAM [int]                move:   the column played to reach this node, None for the root
+    # PARAM [mcts_agent.Node]    parent: the parent node, None for the root
+    # PARAM [board.Board]        brd:    the board at this node
+    def __init__(self, move, parent, brd):
+        """Class constructor"""
+        self.move = move
+        self.parent = parent
+        self.children = []
+        # Moves not expanded yet, the centre ones last so that they are expanded first
+        centre = (brd.w - 1) / 2
+        self.untried = sorted(brd.free_cols(), key=lambda col: -abs(col - centre))
+        if brd.is_over():
+            self.untried = []
+        # Number of playouts through this node
+        self.visits = 0
+        # Results of these playouts for the player who made the move to this node,
+        # counting 1 for a win and 0.5 for a tie
+        self.wins = 0.0
+        # Hash of the position, to find it again when the tree is reused
+        self.key = brd.hash
+        # Game outcome if the game is over at this node, None otherwise
+        self.outcome = brd.outcome if brd.is_over() else None
+
+    # Pick the child to explore.
+    #
+    # PARAM [float] c: the exploration constant
+    # RETURN [mcts_agent.Node]: the child with the highest upper confidence bound
+    def select(self, c):
+        """Returns the child maximizing the UCT value"""
+        log = math.log(self.visits)
+        best = None
+        best_value = -1.0
+        for child in self.children:
+            value = child.wins / child.visits + c * math.sqrt(log / child.visits)
+            if value > best_value:
+                best = child
+                best_value = value
+        return best
+
+#################################
+# Monte Carlo Tree Search Agent #
+#################################
+
+class MCTSAgent(agent.Agent):
+    """Agent that uses Monte Carlo tree search with UCT"""
+
+    # Class constructor.
+    #
+    # PARAM [string] name:        the name of this player
+    # PARAM [int]    playouts:    the maximum number of playouts per move, None for no limit
+    # PARAM [float]  max_time:    the maximum time per move in seconds, None for no limit
+    # PARAM [float]  exploration: the UCT exploration constant
+    # PARAM [int]    batch:       the number of playouts run at once from each new node;
+    #                             more than 1 plays them in lockstep with NumPy
+    #
+    # NOTE: without playouts, max_time or a deadline set by game.Game.timed_go(),
+    #       the search is limited to 10000 playouts.
+    def __init__(self, name, playouts=None, max_time=None, exploration=1.4, batch=1):
+        super().__init__(name)
+        # Search budget
+        self.playouts = playouts
+        self.max_time = max_time
+        # UCT exploration constant
+        self.exploration = exploration
+        # Playouts per expanded node
+        self.batch = batch if np is not None else 1
+        # Search tree, kept from one move to the next
+        self.root = None
+        # Number of playouts made for the last move
+        self.last_playouts = 0
+
+    # Prepare for a new game.
+    def new_game(self):
+        """Drops the search tree"""
+        self.root = None
+
+    # Pick a column.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int]: the column where the token must be added
+    def go(self, brd):
+        """Search for the best move (choice of column for the token)"""
+        start = time.time()
+        stop_time = self.stop_time()
+        limit = self.playouts
+        if limit is None and stop_time is None:
+            limit = 10000
+        self.root = self.find_root(brd)
+        self.root.parent = None
+        rng = np.random.default_rng(random.getrandbits(32)) if self.batch > 1 else None
+        done = 0
+        iterations = 0
+        while limit is None or done < limit:
+            if iterations & 15 == 0 and stop_time is not None and time.time() > stop_time:
+                break
+            done += self.iterate(brd, rng)
+            iterations += 1
+        self.last_playouts = done
+        if self.collect_stats:
+            # Playouts stand for the nodes of a tree search
+            self.last_stats = stats.SearchStats()
+            self.last_stats.moves = 1
+            self.last_stats.time = time.time() - start
+            self.last_stats.nodes = done
+        else:
+            self.last_stats = None
+        # Play the most visited move
+        best = max(self.root.children, key=lambda child: child.visits, default=None)
+        if best is None:
+            return random.choice(brd.free_cols())
+        return best.move
+
+    # Grow the tree while the opponent thinks.
+    #
+    # PARAM [board.Board] brd: the board after this agent's move
+    def ponder(self, brd):
+        """Runs playouts from the opponent's position until told to stop"""
+        self.last_stats = None
+        self.root = self.find_root(brd)
+        self.root.parent = None
+        rng = np.random.default_rng(random.getrandbits(32)) if self.batch > 1 else None
+        while not self.stop_pondering:
+            self.iterate(brd, rng)
+
+    # Get the time at which the search stops.
+    #
+    # RETURN [float]: the time, or None for no limit
+    def stop_time(self):
+        now = time.time()
+        budget = self.max_time
+        if self.deadline is not None:
+            # Leave a margin for the game to copy the board and check the move
+            left = (self.deadline - now) * 0.8 - 0.01
+            if budget is None or left < budget:
+                budget = left
+        if budget is None:
+            return None
+        return now + budget
+
+    # Find the node of the current position in the tree kept from the last move.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [mcts_agent.Node]: the node of the position, or a new root
+    def find_root(self, brd):
+        if self.root is not None:
+            if self.root.key == brd.hash:
+                return self.root
+            # A single move, after pondering, or our last move and the opponent's reply
+            for child in self.root.children:
+                if child.key == brd.hash:
+                    return child
+            for child in self.root.children:
+                for grandchild in child.children:
+                    if grandchild.key == brd.hash:
+                        return grandchild
+        return Node(None, None, brd)
+
+    # Run one selection, expansion, simulation and backpropagation step.
+    #
+    # PARAM [board.Board]            brd: the current board state, modified in place and restored
+    # PARAM [numpy.random.Generator] rng: the generator for batched playouts, or None
+    # RETURN [int]: the number of playouts made
+    def iterate(self, brd, rng):
+        node = self.root
+        played = 0
+        # Selection
+        while not node.untried and node.children:
+            node = node.select(self.exploration)
+            brd.play(node.move)
+            played += 1
+        # Expansion
+        if node.untried:
+            col = node.untried.pop()
+            brd.play(col)
+            played += 1
+            child = Node(col, node, brd)
+            node.children.append(child)
+            node = child
+        # Simulation
+        if node.outcome is not None:
+            results = [(node.outcome, 1)]
+        elif rng is not None:
+            (outcomes, moves) = selfplay.lockstep_playouts(brd, self.batch, rng)
+            counts = np.bincount(outcomes, minlength=3)
+            results = [(o, int(counts[o])) for o in range(3) if counts[o]]
+        else:
+            results = [(rollout(brd), 1)]
+        # Backpropagation
+        total = sum(k for (o, k) in results)
+        while node is not None:
+            # The player who made the move to this node
+            mover = brd.player ^ 3
+            node.visits += total
+            for (o, k) in results:
+                if o == mover:
+                    node.wins += k
+                elif o == 0:
+                    node.wins += 0.5 * k
+            if played > 0:
+                brd.undo()
+                played -= 1
+            node = node.parent
+        return total
+
+# Play a random game to its end.
+#
+# The game is played on plain integers rather than on a board.Board.
+#
+# PARAM [board.Board] brd: the starting position, left untouched
+# RETURN [int]: 1 for Player 1, 2 for Player 2, and 0 for no winner
+def rollout(brd):
+    bits = brd.bits[:]
+    heights = brd.heights[:]
+    (h, stride) = (brd.h, brd.stride)
+    cell_masks = brd.lines.cell_masks
+    free = [col for col in range(brd.w) if heights[col] < h]
+    p = brd.player - 1
+    rnd = random.random
+    while free:
+        i = int(rnd() * len(free))
+        col = free[i]
+        y = heights[col]
+        pos = col * stride + y
+        b = bits[p] | (1 << pos)
+        bits[p] = b
+        for mask in cell_masks[pos]:
+            if b & mask == mask:
+                return p + 1
+        if y + 1 == h:
+            free[i] = free[-1]
+            free.pop()
+        heights[col] = y + 1
+        p ^= 1
+    return 0
@@ -0,0 +1,260 @@
+import argparse
+import mmap
+import struct
+import board
+import records
+import alpha_beta_agent as aba
+
+################
+# Opening book #
+################
+
+# An opening book file starts with a header:
+#
+#   magic "CNOB", format version (uint8), w, h, n (uint8 each), number of entries (uint32)
+#
+# followed by the entries, sorted by key:
+#
+#   position hash (uint64), move (uint8), score (int32)
+#
+# The key is board.Board.canonical_key() of the position, so that a
+# position and its mirror image share an entry, and the move is a column of
+# the canonical position. The score is from the point of view of the player
+# to move. All the numbers are little-endian.
+
+MAGIC = b"CNOB"
+VERSION = 2
+
+_HEADER = struct.Struct("<4sBBBBI")
+_ENTRY = struct.Struct("<QBi")
+
+class OpeningBook(object):
+    """Best moves of the first positions of a game, read from a book file"""
+
+    # Class constructor.
+    #
+    # The file is only opened and memory-mapped at the first lookup.
+    #
+    # PARAM [string] path: the path of the book file
+    def __init__(self, path):
+        """Class constructor"""
+        self.path = path
+        # Memory map of the file, None until the first lookup
+        self.map = None
+        # Board geometry and number of entries
+        self.w = None
+        self.h = None
+        self.n = None
+        self.count = 0
+
+    # Open and map the file.
+    def load(self):
+        """Memory-maps the book file"""
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.w, self.h, self.n, self.count) = _HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(self.path + " is not an opening book file")
+        if version != VERSION:
+            raise ValueError("%s: unsupported format version %d" % (self.path, version))
+
+    # Look up a position hash.
+    #
+    # PARAM [int] key: the hash of the position
+    # RETURN [(int, int) or None]: the move and its score, or None if the position is not in the book
+    def lookup(self, key):
+        """Returns (move, score) for the position hash key, or None"""
+        if self.map is None:
+            self.load()
+        # Binary search of the sorted entries
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (k, move, score) = _ENTRY.unpack_from(self.map, _HEADER.size + mid * _ENTRY.size)
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return (move, score)
+        return None
+
+    # Get the book move for a board.
+    #
+    # PARAM [board.Board] brd: the current board state
+    # RETURN [int or None]: the column to play, or None if the position is not in the book
+    def probe(self, brd):
+        """Returns the book move for the board, or None"""
+        if self.map is None:
+            self.load()
+        if (brd.w, brd.h, brd.n) != (self.w, self.h, self.n):
+            return None
+        entry = self.lookup(brd.canonical_key())
+        if entry is None or entry[0] >= brd.w:
+            return None
+        col = brd.uncanonical_move(entry[0])
+        if brd.heights[col] >= brd.h:
+            return None
+        return col
+
+    # Release the memory map.
+    def close(self):
+        """Closes the book file"""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    # Get the state to pickle.
+    #
+    # RETURN [dict]: the attributes, without the memory map
+    def __getstate__(self):
+        """Returns the state to pickle"""
+        state = self.__dict__.copy()
+        state["map"] = None
+        return state
+
+# Write a book file.
+#
+# PARAM [string]                 path:    the path of the book file
+# PARAM [int]                    w:       the board width
+# PARAM [int]                    h:       the board height
+# PARAM [int]                    n:       the number of tokens to line up to win
+# PARAM [dict of int:(int, int)] entries: the move and score by canonical position key
+def write_book(path, w, h, n, entries):
+    """Writes the entries to a book file"""
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, w, h, n, len(entries)))
+        for key in sorted(entries):
+            (move, score) = entries[key]
+            f.write(_ENTRY.pack(key, move, score))
+
+#################
+# Book building #
+#################
+
+# List the positions reachable from the empty board in a few moves.
+#
+# PARAM [int] w:     the board width
+# PARAM [int] h:     the board height
+# PARAM [int] n:     the number of tokens to line up to win
+# PARAM [int] plies: the maximum number of moves played
+# RETURN [list of board.Board]: one board per distinct unfinished position,
+#                               counting mirror images as the same position
+def opening_positions(w, h, n, plies):
+    """Returns the distinct unfinished positions reachable in at most plies moves"""
+    seen = set()
+    result = []
+    frontier = [board.Board([[0] * w for i in range(h)], w, h, n)]
+    for ply in range(plies + 1):
+        following = []
+        for brd in frontier:
+            key = brd.canonical_key()
+            if key in seen or brd.is_over():
+                continue
+            seen.add(key)
+            result.append(brd)
+            if ply < plies:
+                for col in brd.free_cols():
+                    nb = brd.copy()
+                    nb.play(col)
+                    following.append(nb)
+        frontier = following
+    return result
+
+# Build book entries by searching every opening position.
+#
+# PARAM [int]   w:        the board width
+# PARAM [int]   h:        the board height
+# PARAM [int]   n:        the number of tokens to line up to win
+# PARAM [int]   plies:    the number of moves covered by the book
+# PARAM [int]   depth:    the search depth
+# PARAM [float] max_time: the maximum search time per position, None for no limit
+# RETURN [dict of int:(int, int)]: the move and score by canonical position key
+def entries_from_search(w, h, n, plies, depth, max_time=None):
+    """Searches every position of the first plies moves and returns the book entries"""
+    entries = {}
+    searcher = aba.AlphaBetaAgent("book", depth, max_time=max_time)
+    for brd in opening_positions(w, h, n, plies):
+        searcher.player = brd.player
+        searcher.new_game()
+        move = searcher.go(brd)
+        entry = searcher.tt.probe_board(brd)
+        score = entry[0] if entry is not None else 0
+        entries[brd.canonical_key()] = (brd.canonical_move(move),
+                                        max(-(1 << 31), min((1 << 31) - 1, score)))
+    return entries
+
+# Build book entries from recorded games.
+#
+# For every position of the first moves, the move with the best average
+# result for the player who made it is kept, as long as it was played in
+# enough games. The score is the average result in thousandths: 1000 for
+# always winning, 0 for always losing.
+#
+# PARAM [list of string] paths:     the game record files
+# PARAM [int]            plies:     the number of moves covered by the book
+# PARAM [int]            min_games: the minimum number of games a move must have been played in
+# RETURN [(int, int, int, dict of int:(int, int))]: the board geometry, and the move
+#                                                   and score by canonical position key
+def entries_from_records(paths, plies, min_games=10):
+    """Builds book entries from the first plies moves of recorded games"""
+    geometry = None
+    # Number of games and sum of the results, by canonical position key and move
+    stats = {}
+    for path in paths:
+        reader = records.RecordReader(path)
+        if geometry is None:
+            geometry = (reader.w, reader.h, reader.n)
+        elif geometry != (reader.w, reader.h, reader.n):
+            raise ValueError(path + ": all the record files must be for the same geometry")
+        (w, h, n) = geometry
+        empty = board.Board([[0] * w for i in range(h)], w, h, n)
+        for r in reader:
+            brd = empty.copy()
+            for move in r.moves[:plies]:
+                if brd.is_over():
+                    break
+                # Result for the player making the move: 2 for a win, 1 for a tie
+                if r.outcome == 0:
+                    result = 1
+                elif r.outcome == brd.player:
+                    result = 2
+                else:
+                    result = 0
+                s = stats.setdefault(brd.canonical_key(), {}).setdefault(brd.canonical_move(move), [0, 0])
+                s[0] += 1
+                s[1] += result
+                brd.play(move)
+    entries = {}
+    for key, moves in stats.items():
+        best = None
+        for move, (games, total) in moves.items():
+            if games >= min_games and (best is None or total * best[1] > best[2] * games):
+                best = (move, games, total)
+        if best is not None:
+            entries[key] = (best[0], best[2] * 500 // best[1])
+    if geometry is None:
+        raise ValueError("no record files given")
+    return geometry + (entries,)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a ConnectN opening book")
+    parser.add_argument("book", help="the book file to write")
+    parser.add_argument("--plies", type=int, default=4, help="number of moves covered by the book")
+    parser.add_argument("--size", type=int, nargs=3, default=[7, 6, 4], metavar=("W", "H", "N"),
+                        help="board geometry, when searching")
+    parser.add_argument("--depth", type=int, default=8, help="search depth, when searching")
+    parser.add_argument("--max-time", type=float, default=None, help="search time per position")
+    parser.add_argument("--records", nargs="+", default=None,
+                        help="game record files to build the book from, instead of searching")
+    parser.add_argument("--min-games", type=int, default=10,
+                        help="minimum number of games a book move must have been played in")
+    args = parser.parse_args()
+    if args.records:
+        (w, h, n, entries) = entries_from_records(args.records, args.plies, args.min_games)
+    else:
+        (w, h, n) = args.size
+        entries = entries_from_search(w, h, n, args.plies, args.depth, args.max_time)
+    write_book(args.book, w, h, n, entries)
+    print(len(entries), "positions written to", args.book)
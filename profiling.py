@@ -0,0 +1,346 @@
+import collections
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import stats
+
+#############
+# Profiling #
+#############
+
+# Profiling modes: deterministic with cProfile, or statistical, with a
+# thread sampling the stack of the agent to move at a fixed interval
+MODES = ["cprofile", "sample"]
+
+class _RawStats(object):
+    """cProfile statistics received from another process, in the form pstats reads"""
+
+    # Class constructor.
+    #
+    # PARAM [dict] stats: the stats attribute of a cProfile.Profile
+    def __init__(self, stats):
+        """Class constructor"""
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class Profiler(object):
+    """Profiles the moves of the agents of games, by agent and by move"""
+
+    # Class constructor.
+    #
+    # PARAM [string] mode:     "cprofile" or "sample", see MODES
+    # PARAM [float]  interval: the time between two stack samples in seconds, in sample mode
+    def __init__(self, mode="sample", interval=0.005):
+        """Class constructor"""
+        if mode not in MODES:
+            raise ValueError("unknown profiling mode %r, expected one of %s" % (mode, ", ".join(MODES)))
+        self.mode = mode
+        self.interval = interval
+        # Number of samples of each collapsed stack, by agent name
+        self.stacks = {}
+        # Profile of the moves made in this process, by agent name
+        self.profiles = {}
+        # cProfile statistics received from other processes, by agent name
+        self.received = {}
+        # One row per move: agent, player, ply, seconds and, in sample mode, samples
+        self.moves = []
+        # Move being profiled: (agent name, thread id, frame calling the agent, row)
+        self.current = None
+        # Sampling thread and the event that stops it
+        self.sampler = None
+        self.stopping = None
+        # Interpreter switch interval to restore when sampling stops
+        self.switch_interval = None
+
+    # Get an empty profiler with the same settings.
+    #
+    # RETURN [profiling.Profiler]: the new profiler
+    def fresh(self):
+        """Returns an empty profiler with the same mode and interval"""
+        return Profiler(self.mode, self.interval)
+
+    # Start profiling a move.
+    #
+    # Everything below the frame, up to end_move(), is attributed to the agent.
+    #
+    # PARAM [string] name:   the name of the agent to move
+    # PARAM [int]    player: the player of the agent, 1 or 2
+    # PARAM [int]    ply:    the number of moves made before this one
+    # PARAM [frame]  frame:  the frame that calls the agent, None for the caller's
+    def begin_move(self, name, player, ply, frame=None):
+        """Starts attributing the time spent to the agent's move"""
+        row = {"agent": name, "player": player, "ply": ply, "seconds": time.perf_counter()}
+        if self.mode == "cprofile":
+            prof = self.profiles.get(name)
+            if prof is None:
+                prof = cProfile.Profile()
+                self.profiles[name] = prof
+            self.current = (name, None, None, row)
+            prof.enable()
+        else:
+            row["samples"] = 0
+            self.stacks.setdefault(name, collections.Counter())
+            if self.sampler is None:
+                # The sampling thread needs the GIL on time, or the samples
+                # fall where the agent releases it, such as in NumPy
+                self.switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self.switch_interval, self.interval / 10))
+                self.stopping = threading.Event()
+                self.sampler = threading.Thread(target=self.sample, daemon=True)
+                self.sampler.start()
+            if frame is None:
+                frame = sys._getframe(1)
+            self.current = (name, threading.get_ident(), frame, row)
+
+    # Stop profiling the move started by begin_move().
+    def end_move(self):
+        """Stops attributing the time spent to the agent's move"""
+        (name, tid, base, row) = self.current
+        if self.mode == "cprofile":
+            self.profiles[name].disable()
+        self.current = None
+        row["seconds"] = time.perf_counter() - row["seconds"]
+        self.moves.append(row)
+
+    # Sample the stack of the move being profiled until close() is called.
+    def sample(self):
+        """Body of the sampling thread"""
+        while not self.stopping.wait(self.interval):
+            current = self.current
+            if current is None:
+                continue
+            (name, tid, base, row) = current
+            frame = sys._current_frames().get(tid)
+            stack = []
+            while frame is not None and frame is not base:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+                frame = frame.f_back
+            if frame is None:
+                # The move ended while the stack was walked
+                continue
+            stack.reverse()
+            self.stacks[name][";".join(stack)] += 1
+            row["samples"] += 1
+
+    # Stop the sampling thread.
+    def close(self):
+        """Stops the sampling thread, if any"""
+        if self.sampler is not None:
+            self.stopping.set()
+            self.sampler.join()
+            self.sampler = None
+            sys.setswitchinterval(self.switch_interval)
+
+    # Get all the cProfile statistics as plain data.
+    #
+    # RETURN [dict of string:list of dict]: the statistics received from other
+    #                                       processes and those of this process, by agent name
+    def raw_stats(self):
+        """Returns the cProfile statistics by agent, in a form that can be pickled"""
+        raw = dict((name, list(r)) for name, r in self.received.items())
+        for name, prof in self.profiles.items():
+            prof.create_stats()
+            raw.setdefault(name, []).append(prof.stats)
+        return raw
+
+    # Get the state to pickle.
+    #
+    # The profiles of this process are converted to plain statistics, so that
+    # a profiler can be sent back from a worker process and merged.
+    #
+    # RETURN [dict]: the attributes, without the sampling thread
+    def __getstate__(self):
+        """Returns the state to pickle"""
+        state = self.__dict__.copy()
+        state["received"] = self.raw_stats()
+        state["profiles"] = {}
+        state["current"] = None
+        state["sampler"] = None
+        state["stopping"] = None
+        state["switch_interval"] = None
+        return state
+
+    # Add the results of another profiler.
+    #
+    # PARAM [profiling.Profiler] other: a profiler of other games, such as one sent
+    #                                   back from a worker process
+    def merge(self, other):
+        """Adds the samples, statistics and moves of other to this profiler"""
+        for name, counts in other.stacks.items():
+            self.stacks.setdefault(name, collections.Counter()).update(counts)
+        for name, raw in other.raw_stats().items():
+            self.received.setdefault(name, []).extend(raw)
+        self.moves.extend(other.moves)
+
+    # Get the names of the agents profiled.
+    #
+    # RETURN [list of string]: the names, in the order they first moved
+    def agents(self):
+        """Returns the names of the agents that made moves"""
+        names = []
+        for row in self.moves:
+            if row["agent"] not in names:
+                names.append(row["agent"])
+        return names
+
+    # Get the cProfile statistics of an agent.
+    #
+    # PARAM [string] name: the name of the agent
+    # RETURN [pstats.Stats]: the statistics of all its moves, or None if there are none
+    def pstats(self, name):
+        """Returns the combined cProfile statistics of the agent"""
+        sources = [_RawStats(raw) for raw in self.received.get(name, [])]
+        if name in self.profiles:
+            sources.append(self.profiles[name])
+        if not sources:
+            return None
+        result = pstats.Stats(sources[0])
+        for s in sources[1:]:
+            result.add(s)
+        return result
+
+    # Get the hottest functions of an agent.
+    #
+    # In sample mode, a function's self share is the fraction of the samples
+    # it was running in, and its total share the fraction of the samples it
+    # was on the stack in. In cprofile mode, the shares are of the time spent
+    # in all the functions.
+    #
+    # PARAM [string] name: the name of the agent
+    # PARAM [int]    top:  the number of functions
+    # RETURN [list of (float, float, string)]: the self and total shares and the
+    #                                          function, by decreasing self share
+    def hot_functions(self, name, top=20):
+        """Returns the functions where the agent spends the most time"""
+        own = collections.Counter()
+        total = collections.Counter()
+        if self.mode == "sample":
+            counts = self.stacks.get(name, {})
+            whole = sum(counts.values())
+            for stack, k in counts.items():
+                frames = stack.split(";")
+                own[frames[-1]] += k
+                for f in set(frames):
+                    total[f] += k
+        else:
+            st = self.pstats(name)
+            if st is None:
+                return []
+            whole = st.total_tt
+            for (path, line, func), (cc, nc, tt, ct, callers) in st.stats.items():
+                label = "%s (%s:%d)" % (func, os.path.basename(path), line)
+                own[label] += tt
+                total[label] += ct
+        if not whole:
+            return []
+        return [(own[f] / whole, total[f] / whole, f) for f, v in own.most_common(top)]
+
+    # Get a summary of the profiles.
+    #
+    # PARAM [int] top: the number of functions listed per agent
+    # RETURN [list of string]: the lines of the summary
+    def summary(self, top=20):
+        """Returns the time and the hottest functions of every agent, as lines of text"""
+        lines = []
+        for name in self.agents():
+            rows = [r for r in self.moves if r["agent"] == name]
+            seconds = sum(r["seconds"] for r in rows)
+            head = "%s: %d moves, %.3f s" % (name, len(rows), seconds)
+            if self.mode == "sample":
+                head += ", %d samples" % sum(r["samples"] for r in rows)
+            lines.append(head)
+            lines.append("   self  total  function")
+            for (own, total, f) in self.hot_functions(name, top):
+                lines.append("  %4.1f%% %5.1f%%  %s" % (100 * own, 100 * total, f))
+        return lines
+
+    # Write the profiles to a directory.
+    #
+    # The directory gets moves.jsonl, with the time (and samples) of every
+    # move, and summary.txt. In sample mode, it also gets the collapsed stacks
+    # of each agent in <agent>.collapsed and of all of them in all.collapsed,
+    # with the agent as the root frame, ready for flamegraph.pl or
+    # speedscope. In cprofile mode, it gets <agent>.prof, for pstats or
+    # snakeviz.
+    #
+    # PARAM [string] directory: the directory, created if needed
+    # PARAM [int]    top:       the number of functions listed per agent in the summary
+    # RETURN [list of string]: the paths of the files written
+    def write(self, directory, top=20):
+        """Writes the profiles, the move times and the summary to the directory"""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        def path_of(filename):
+            paths.append(os.path.join(directory, filename))
+            return paths[-1]
+        with open(path_of("moves.jsonl"), "w") as f:
+            stats.write_json_lines(f, self.moves)
+        with open(path_of("summary.txt"), "w") as f:
+            f.write("\n".join(self.summary(top)) + "\n")
+        for name in self.agents():
+            safe = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+            if self.mode == "sample":
+                with open(path_of(safe + ".collapsed"), "w") as f:
+                    for stack, k in sorted(self.stacks.get(name, {}).items()):
+                        f.write("%s %d\n" % (stack, k))
+            else:
+                st = self.pstats(name)
+                if st is not None:
+                    st.dump_stats(path_of(safe + ".prof"))
+        if self.mode == "sample":
+            with open(path_of("all.collapsed"), "w") as f:
+                for name in self.agents():
+                    for stack, k in sorted(self.stacks.get(name, {}).items()):
+                        f.write("%s;%s %d\n" % (name, stack, k))
+        return paths
+
+#################
+# Command lines #
+#################
+
+# Add the profiling options to a command line parser.
+#
+# PARAM [argparse.ArgumentParser] parser: the parser
+def add_arguments(parser):
+    """Adds the --profile options to the parser"""
+    parser.add_argument("--profile", choices=MODES, default=None,
+                        help="profile the agents' moves, with cProfile or by sampling stacks")
+    parser.add_argument("--profile-dir", default="profile",
+                        help="directory the profiles are written to (default: profile)")
+    parser.add_argument("--profile-interval", type=float, default=0.005,
+                        help="time between stack samples in seconds (default: 0.005)")
+    parser.add_argument("--profile-top", type=int, default=20,
+                        help="number of hot functions listed per agent (default: 20)")
+
+# Create the profiler asked for on the command line.
+#
+# PARAM [argparse.Namespace] args: the parsed options of add_arguments()
+# RETURN [profiling.Profiler]: the profiler, or None if profiling is off
+def from_arguments(args):
+    """Returns the profiler of the command line options, or None"""
+    if args.profile is None:
+        return None
+    return Profiler(args.profile, args.profile_interval)
+
+# Write and print the results of the profiler of the command line.
+#
+# PARAM [profiling.Profiler]  profiler: the profiler, or None if profiling is off
+# PARAM [argparse.Namespace]  args:     the parsed options of add_arguments()
+def report(profiler, args):
+    """Writes the profiles to the profile directory and prints the summary"""
+    if profiler is None:
+        return
+    profiler.close()
+    paths = profiler.write(args.profile_dir, args.profile_top)
+    print("\nPROFILE:")
+    for line in profiler.summary(args.profile_top):
+        print(line)
+    print("Profiles written to", ", ".join(paths))
@@ -0,0 +1,266 @@
+import math
+import random
+import tournament
+import agent
+import alpha_beta_agent as aba
+
+##################
+# Rating results #
+##################
+
+# Elo points per natural logit: a difference of d Elo means an expected
+# score of 1 / (1 + 10^(-d/400)).
+ELO_PER_LOGIT = 400 / math.log(10)
+
+# Get the expected score for an Elo difference.
+#
+# PARAM [float] elo: the Elo difference
+# RETURN [float]: the expected score, between 0 and 1
+def expected_score(elo):
+    """Returns the expected score of a player elo points stronger than its opponent"""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+class Results(object):
+    """Wins, draws and losses between each pair of players"""
+
+    # Class constructor.
+    #
+    # PARAM [list of string] names: the names of the players
+    def __init__(self, names):
+        """Class constructor"""
+        self.names = list(names)
+        k = len(self.names)
+        # Games won by i against j, and drawn between i and j
+        self.wins = [[0] * k for i in range(k)]
+        self.draws = [[0] * k for i in range(k)]
+
+    # Add the result of a game.
+    #
+    # PARAM [int] i:       the index of the player who played first
+    # PARAM [int] j:       the index of the player who played second
+    # PARAM [int] outcome: 1 if i won, 2 if j won, and 0 for no winner
+    def add(self, i, j, outcome):
+        """Counts the game between i and j"""
+        if outcome == 1:
+            self.wins[i][j] += 1
+        elif outcome == 2:
+            self.wins[j][i] += 1
+        else:
+            self.draws[i][j] += 1
+            self.draws[j][i] += 1
+
+    # Get the number of games between two players.
+    #
+    # PARAM [int] i: the index of a player
+    # PARAM [int] j: the index of another player
+    # RETURN [int]: the number of games between them
+    def games(self, i, j):
+        """Returns the number of games between i and j"""
+        return self.wins[i][j] + self.wins[j][i] + self.draws[i][j]
+
+    # Get the score of a player.
+    #
+    # PARAM [int] i: the index of the player
+    # RETURN [(float, int)]: the points (1 per win, 0.5 per draw) and the number of games
+    def score(self, i):
+        """Returns the points and the number of games of player i"""
+        points = 0.0
+        games = 0
+        for j in range(len(self.names)):
+            points += self.wins[i][j] + 0.5 * self.draws[i][j]
+            games += self.games(i, j)
+        return (points, games)
+
+##################
+# Rating fitting #
+##################
+
+# Fit Bradley-Terry ratings to the results.
+#
+# As in BayesElo, every pair of players that met gets a few virtual draws,
+# which keeps the ratings finite when a player won or lost all its games.
+# The ratings are found with the minorization-maximization iteration, and
+# their standard errors from the diagonal of the Fisher information.
+#
+# PARAM [rating.Results] results: the games played
+# PARAM [float]          prior:   the number of virtual draws per pair of players that met
+# PARAM [int]            iterations: the maximum number of iterations
+# PARAM [float]          tolerance:  the largest change of a log-rating at which to stop
+# RETURN [(list of float, list of float)]: the Elo rating of each player,
+#                                          averaging 0, and its standard error
+def fit(results, prior=2.0, iterations=1000, tolerance=1e-9):
+    """Returns the Elo ratings and their standard errors"""
+    k = len(results.names)
+    games = [[results.games(i, j) for j in range(k)] for i in range(k)]
+    n = [[games[i][j] + (prior if games[i][j] else 0) for j in range(k)] for i in range(k)]
+    won = [sum(results.wins[i][j] + 0.5 * results.draws[i][j] +
+               (0.5 * prior if games[i][j] else 0) for j in range(k))
+           for i in range(k)]
+    gamma = [1.0] * k
+    for it in range(iterations):
+        change = 0.0
+        for i in range(k):
+            d = sum(n[i][j] / (gamma[i] + gamma[j]) for j in range(k) if j != i and n[i][j])
+            if d > 0 and won[i] > 0:
+                g = won[i] / d
+                change = max(change, abs(math.log(g / gamma[i])))
+                gamma[i] = g
+        # Keep the geometric mean at 1
+        mean = math.exp(sum(math.log(g) for g in gamma) / k)
+        gamma = [g / mean for g in gamma]
+        if change < tolerance:
+            break
+    ratings = [math.log(g) * ELO_PER_LOGIT for g in gamma]
+    errors = []
+    for i in range(k):
+        info = 0.0
+        for j in range(k):
+            if j != i and n[i][j]:
+                p = gamma[i] / (gamma[i] + gamma[j])
+                info += n[i][j] * p * (1 - p)
+        errors.append(ELO_PER_LOGIT / math.sqrt(info) if info > 0 else math.inf)
+    return (ratings, errors)
+
+########
+# SPRT #
+########
+
+# Sequential probability ratio test of a pair of players.
+#
+# The hypotheses are that the first player is elo_margin stronger than the
+# second, or elo_margin weaker. Each game counts as a trial won with the
+# expected score of the hypothesis, a draw as half a win and half a loss.
+#
+# PARAM [rating.Results] results:    the games played
+# PARAM [int]            i:          the index of the first player
+# PARAM [int]            j:          the index of the second player
+# PARAM [float]          elo_margin: the Elo difference of the hypotheses
+# RETURN [float]: the log-likelihood ratio, positive if i is likely stronger
+def llr(results, i, j, elo_margin):
+    """Returns the log-likelihood ratio of 'i is stronger' against 'j is stronger'"""
+    points = results.wins[i][j] + 0.5 * results.draws[i][j]
+    lost = results.games(i, j) - points
+    s0 = expected_score(-elo_margin)
+    s1 = expected_score(elo_margin)
+    return points * math.log(s1 / s0) + lost * math.log((1 - s1) / (1 - s0))
+
+# Get the bounds of the SPRT.
+#
+# PARAM [float] alpha: the probability of deciding that i is stronger when it is weaker
+# PARAM [float] beta:  the probability of deciding that i is weaker when it is stronger
+# RETURN [(float, float)]: the log-likelihood ratios below and above which the test stops
+def sprt_bounds(alpha, beta):
+    """Returns the lower and upper bounds of the log-likelihood ratio"""
+    return (math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha))
+
+###############
+# Rating mode #
+###############
+
+# Rate agents, playing the most informative games first.
+#
+# Every pair of agents first plays a match (a game with each agent moving
+# first). Then, until max_games games are played, the pair whose result is
+# the most uncertain among the pairs the SPRT has not decided yet plays
+# another match. The most uncertain pair is the one with the largest
+# variance of the rating difference, weighted by how close the expected
+# score is to 1/2.
+#
+# PARAM [int]                  w:          the board width
+# PARAM [int]                  h:          the board height
+# PARAM [int]                  n:          the number of tokens to line up to win
+# PARAM [int]                  l:          the time limit for a move in seconds
+# PARAM [list of agent.Agent]  ps:         the agents to rate
+# PARAM [int]                  max_games:  the maximum number of games
+# PARAM [float]                elo_margin: the Elo difference the SPRT must tell apart
+# PARAM [float]                alpha:      the probability of the SPRT wrongly deciding
+#                                          that the first agent of a pair is stronger
+# PARAM [float]                beta:       the probability of the SPRT wrongly deciding
+#                                          that it is weaker
+# PARAM [float]                prior:      the number of virtual draws per pair of agents
+# PARAM [records.RecordWriter] recorder:   where to record the games, None not to record them
+# RETURN [rating.Results]: the games played
+def play_rating(w, h, n, l, ps, max_games=200, elo_margin=50, alpha=0.05, beta=0.05,
+                prior=2.0, recorder=None):
+    print("RATING START")
+    results = Results([p.name for p in ps])
+    pairs = [(i, j) for i in range(0, len(ps)-1) for j in range(i + 1, len(ps))]
+    (lower, upper) = sprt_bounds(alpha, beta)
+    played = 0
+    # Pairs still undecided
+    open_pairs = list(pairs)
+    # One match per pair to start with
+    queue = list(pairs)
+    while played + 2 <= max_games and open_pairs:
+        if queue:
+            (i, j) = queue.pop(0)
+        else:
+            (ratings, errors) = fit(results, prior)
+            def uncertainty(pair):
+                (a, b) = pair
+                p = expected_score(ratings[a] - ratings[b])
+                return (errors[a] ** 2 + errors[b] ** 2) * p * (1 - p)
+            (i, j) = max(open_pairs, key=uncertainty)
+        play_rated_match(w, h, n, l, ps, i, j, results, recorder)
+        played += 2
+        x = llr(results, i, j, elo_margin)
+        if (x <= lower or x >= upper) and (i, j) in open_pairs:
+            open_pairs.remove((i, j))
+            print("    SPRT:", ps[i].name, "stronger than" if x >= upper else "weaker than",
+                  ps[j].name, "(LLR %.2f)" % x)
+    print("RATING END")
+    print_ratings(results, prior)
+    return results
+
+# Play a match between two agents and count its games.
+#
+# PARAM [int]                  w:        the board width
+# PARAM [int]                  h:        the board height
+# PARAM [int]                  n:        the number of tokens to line up to win
+# PARAM [int]                  l:        the time limit for a move in seconds
+# PARAM [list of agent.Agent]  ps:       the agents
+# PARAM [int]                  i:        the index of the agent moving first in the first game
+# PARAM [int]                  j:        the index of the other agent
+# PARAM [rating.Results]       results:  the games played, updated in place
+# PARAM [records.RecordWriter] recorder: where to record the games, None not to record them
+def play_rated_match(w, h, n, l, ps, i, j, results, recorder=None):
+    print("  MATCH:", ps[i].name, "vs.", ps[j].name)
+    o1 = tournament.play_game(w, h, n, l, ps[i], ps[j], recorder)
+    o2 = tournament.play_game(w, h, n, l, ps[j], ps[i], recorder)
+    results.add(i, j, o1)
+    results.add(j, i, o2)
+
+# Print the ratings, best first.
+#
+# PARAM [rating.Results] results: the games played
+# PARAM [float]          prior:   the number of virtual draws per pair of agents
+def print_ratings(results, prior=2.0):
+    (ratings, errors) = fit(results, prior)
+    print("\nRATINGS:")
+    for i in sorted(range(len(ratings)), key=lambda i: -ratings[i]):
+        (points, games) = results.score(i)
+        print("%6.0f +/- %3.0f  %s (%g/%d)" % (ratings[i], 1.96 * errors[i],
+                                               results.names[i], points, games))
+
+###################
+# Rate the agents #
+###################
+
+if __name__ == "__main__":
+    # Set random seed for reproducibility
+    random.seed(1)
+
+    # Construct list of agents to rate
+    agents = [
+        aba.AlphaBetaAgent("aba2", 2),
+        aba.AlphaBetaAgent("aba1", 1),
+        agent.RandomAgent("random1"),
+        agent.RandomAgent("random2")
+    ]
+
+    # Run!
+    play_rating(7,      # board width
+                6,      # board height
+                4,      # tokens in a row to win
+                15,     # time limit in seconds
+                agents) # player list
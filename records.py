@@ -0,0 +1,234 @@
+import mmap
+import os
+import struct
+
+#####################
+# Game record files #
+#####################
+
+# A game record file is append-only. It starts with a header:
+#
+#   magic "CNGR", format version (uint8), w, h, n (uint8 each)
+#
+# followed by any number of chunks, each starting with a one-byte tag:
+#
+#   'P' player:  id (uint16), name length (uint16), name (UTF-8)
+#   'G' game:    Player 1 id (uint16), Player 2 id (uint16), outcome (int8),
+#                flags (uint8), number of moves (uint16), the moves packed
+#                on as few bits as the board width needs, and, if flag 1 is
+#                set, the time of each move (float32)
+#
+# All the numbers are little-endian. A player chunk comes before the first
+# game that player appears in.
+
+MAGIC = b"CNGR"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBBBB")
+_PLAYER = struct.Struct("<HH")
+_GAME = struct.Struct("<HHbBH")
+
+# The game chunk contains the time of each move
+FLAG_TIMES = 1
+
+# Get the number of bits needed to store a move.
+#
+# PARAM [int] w: the board width
+# RETURN [int]: the number of bits per move
+def move_bits(w):
+    """Returns the number of bits needed to store a column of a board of width w"""
+    return max(1, (w - 1).bit_length())
+
+# Pack a sequence of moves.
+#
+# PARAM [list of int] moves: the columns of the moves
+# PARAM [int]         bits:  the number of bits per move
+# RETURN [bytes]: the packed moves
+def pack_moves(moves, bits):
+    """Packs the moves on bits bits each"""
+    v = 0
+    for i, x in enumerate(moves):
+        v |= x << (i * bits)
+    return v.to_bytes((len(moves) * bits + 7) // 8, 'little')
+
+# Unpack a sequence of moves.
+#
+# PARAM [bytes] data:  the packed moves
+# PARAM [int]   count: the number of moves
+# PARAM [int]   bits:  the number of bits per move
+# RETURN [bytes]: the columns of the moves
+def unpack_moves(data, count, bits):
+    """Unpacks count moves of bits bits each"""
+    v = int.from_bytes(data, 'little')
+    mask = (1 << bits) - 1
+    return bytes((v >> (i * bits)) & mask for i in range(count))
+
+class Record(object):
+    """A game read from a record file"""
+
+    # Class constructor.
+    #
+    # PARAM [string]             p1:      the name of Player 1
+    # PARAM [string]             p2:      the name of Player 2
+    # PARAM [bytes]              moves:   the column of each move, in order
+    # PARAM [int]                outcome: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    # PARAM [tuple of float]     times:   the time taken by each move in seconds, or None
+    def __init__(self, p1, p2, moves, outcome, times=None):
+        """Class constructor"""
+        self.p1 = p1
+        self.p2 = p2
+        self.moves = moves
+        self.outcome = outcome
+        self.times = times
+
+#################
+# Record writer #
+#################
+
+class RecordWriter(object):
+    """Appends games to a record file"""
+
+    # Class constructor.
+    #
+    # Opens the file for appending, creating it if needed. An existing file
+    # must be for the same board geometry.
+    #
+    # PARAM [string] path: the path of the record file
+    # PARAM [int]    w:    the board width
+    # PARAM [int]    h:    the board height
+    # PARAM [int]    n:    the number of tokens to line up to win
+    def __init__(self, path, w, h, n):
+        """Class constructor"""
+        self.w = w
+        self.h = h
+        self.n = n
+        self.bits = move_bits(w)
+        # Player ids by name
+        self.ids = {}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            reader = RecordReader(path)
+            if (reader.w, reader.h, reader.n) != (w, h, n):
+                raise ValueError("%s holds %dx%d boards with n=%d" % (path, reader.w, reader.h, reader.n))
+            for r in reader:
+                pass
+            self.ids = dict((name, i) for i, name in enumerate(reader.names))
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            self.file.write(_HEADER.pack(MAGIC, VERSION, w, h, n))
+
+    # Get the id of a player, writing a player chunk for new names.
+    #
+    # PARAM [string] name: the name of the player
+    # RETURN [int]: the id of the player
+    def player_id(self, name):
+        """Returns the id of the player with the given name"""
+        i = self.ids.get(name)
+        if i is None:
+            i = len(self.ids)
+            self.ids[name] = i
+            data = name.encode("utf-8")
+            self.file.write(b"P" + _PLAYER.pack(i, len(data)) + data)
+        return i
+
+    # Append a game.
+    #
+    # PARAM [string]        p1:      the name of Player 1
+    # PARAM [string]        p2:      the name of Player 2
+    # PARAM [list of int]   moves:   the column of each move, in order
+    # PARAM [int]           outcome: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    # PARAM [list of float] times:   the time taken by each move in seconds, or None
+    def write(self, p1, p2, moves, outcome, times=None):
+        """Appends a game to the file"""
+        i1 = self.player_id(p1)
+        i2 = self.player_id(p2)
+        flags = 0 if times is None else FLAG_TIMES
+        chunk = [b"G", _GAME.pack(i1, i2, outcome, flags, len(moves)),
+                 pack_moves(moves, self.bits)]
+        if times is not None:
+            chunk.append(struct.pack("<%df" % len(times), *times))
+        self.file.write(b"".join(chunk))
+
+    # Write the buffered data to the file.
+    def flush(self):
+        """Flushes the file"""
+        self.file.flush()
+
+    # Close the file.
+    def close(self):
+        """Closes the file"""
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#################
+# Record reader #
+#################
+
+class RecordReader(object):
+    """Reads the games of a record file one at a time"""
+
+    # Class constructor.
+    #
+    # PARAM [string] path: the path of the record file
+    def __init__(self, path):
+        """Class constructor"""
+        self.path = path
+        with open(path, "rb") as f:
+            (magic, version, self.w, self.h, self.n) = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(path + " is not a game record file")
+        if version != VERSION:
+            raise ValueError("%s: unsupported format version %d" % (path, version))
+        self.bits = move_bits(self.w)
+        # Player names by id, filled in as the file is read
+        self.names = []
+
+    # Iterate over the games.
+    #
+    # The file is memory-mapped, so only the pages being read are loaded.
+    #
+    # RETURN [generator of records.Record]: the games, in file order
+    def __iter__(self):
+        """Yields the games of the file in order"""
+        self.names = []
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                pos = _HEADER.size
+                while pos < size:
+                    tag = m[pos:pos+1]
+                    pos += 1
+                    if tag == b"P":
+                        (i, length) = _PLAYER.unpack_from(m, pos)
+                        pos += _PLAYER.size
+                        name = m[pos:pos+length].decode("utf-8")
+                        pos += length
+                        if i != len(self.names):
+                            raise ValueError("%s: bad player id %d" % (self.path, i))
+                        self.names.append(name)
+                    elif tag == b"G":
+                        (i1, i2, outcome, flags, count) = _GAME.unpack_from(m, pos)
+                        pos += _GAME.size
+                        length = (count * self.bits + 7) // 8
+                        moves = unpack_moves(m[pos:pos+length], count, self.bits)
+                        pos += length
+                        times = None
+                        if flags & FLAG_TIMES:
+                            times = struct.unpack_from("<%df" % count, m, pos)
+                            pos += 4 * count
+                        yield Record(self.names[i1], self.names[i2], moves, outcome, times)
+                    else:
+                        raise ValueError("%s: bad chunk tag %r at offset %d" % (self.path, tag, pos - 1))
+
+# Iterate over the games of a record file.
+#
+# PARAM [string] path: the path of the record file
+# RETURN [generator of records.Record]: the games, in file order
+def read_records(path):
+    """Yields the games of a record file in order"""
+    return iter(RecordReader(path))
@@ -1,55 +1,65 @@
+import argparse
 import random
 import game
 import agent
 import alpha_beta_agent as aba
+import profiling
 
-# Set random seed for reproducibility
-random.seed(1)
-
-#
-# Random vs. Random
-#
-g = game.Game(7, # width
-              6, # height
-              4, # tokens in a row to win
-              agent.RandomAgent("random1"),       # player 1
-              agent.RandomAgent("random2"))       # player 2
-
-#
-# Human vs. Random
-#
-# g = game.Game(7, # width
-#               6, # height
-#               4, # tokens in a row to win
-#               agent.InteractiveAgent("human"),    # player 1
-#               agent.RandomAgent("random"))        # player 2
-
-#
-# Random vs. AlphaBeta
-#
-# g = game.Game(7, # width
-#               6, # height
-#               4, # tokens in a row to win
-#               agent.RandomAgent("random"),        # player 1
-#               aba.AlphaBetaAgent("alphabeta", 4)) # player 2
-
-#
-# Human vs. AlphaBeta
-#
-# g = game.Game(7, # width
-#               6, # height
-#               4, # tokens in a row to win
-#               agent.InteractiveAgent("human"),    # player 1
-#               aba.AlphaBetaAgent("alphabeta", 4)) # player 2
-
-#
-# Human vs. Human
-#
-# g = game.Game(7, # width
-#               6, # height
-#               4, # tokens in a row to win
-#               agent.InteractiveAgent("human1"),   # player 1
-#               agent.InteractiveAgent("human2"))   # player 2
-
-# Execute the game
-outcome = g.go()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a ConnectN game")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiler = profiling.from_arguments(args)
+
+    # Set random seed for reproducibility
+    random.seed(1)
+
+    #
+    # Random vs. Random
+    #
+    g = game.Game(7, # width
+                  6, # height
+                  4, # tokens in a row to win
+                  agent.RandomAgent("random1"),       # player 1
+                  agent.RandomAgent("random2"),       # player 2
+                  profiler=profiler)
+
+    #
+    # Human vs. Random
+    #
+    # g = game.Game(7, # width
+    #               6, # height
+    #               4, # tokens in a row to win
+    #               agent.InteractiveAgent("human"),    # player 1
+    #               agent.RandomAgent("random"))        # player 2
+
+    #
+    # Random vs. AlphaBeta
+    #
+    # g = game.Game(7, # width
+    #               6, # height
+    #               4, # tokens in a row to win
+    #               agent.RandomAgent("random"),        # player 1
+    #               aba.AlphaBetaAgent("alphabeta", 4)) # player 2
+
+    #
+    # Human vs. AlphaBeta
+    #
+    # g = game.Game(7, # width
+    #               6, # height
+    #               4, # tokens in a row to win
+    #               agent.InteractiveAgent("human"),    # player 1
+    #               aba.AlphaBetaAgent("alphabeta", 4)) # player 2
+
+    #
+    # Human vs. Human
+    #
+    # g = game.Game(7, # width
+    #               6, # height
+    #               4, # tokens in a row to win
+    #               agent.InteractiveAgent("human1"),   # player 1
+    #               agent.InteractiveAgent("human2"))   # player 2
+
+    # Execute the game
+    outcome = g.go()
+    profiling.report(profiler, args)
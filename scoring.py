@@ -0,0 +1,138 @@
+import json
+import os
+
+####################
+# Scoring profiles #
+####################
+
+# A scoring profile maps the number of tokens of a player and of its
+# opponent in a line of n cells to the score of the line for that player.
+# The score of a board is the sum of the scores of all its lines.
+
+# Score a line the classic way.
+#
+# PARAM [int] mine:   the number of tokens of the player in the line
+# PARAM [int] theirs: the number of tokens of the opponent in the line
+# RETURN [int]: 10^(k-1) for k tokens of a single player, signed by player, 0 for a shared line
+def classic(mine, theirs):
+    """Scores a line by powers of 10 of the tokens of the only player in it"""
+    if theirs == 0 and mine > 0:
+        return 10 ** (mine - 1)
+    if mine == 0 and theirs > 0:
+        return -(10 ** (theirs - 1))
+    return 0
+
+# Score a line by its number of tokens.
+#
+# PARAM [int] mine:   the number of tokens of the player in the line
+# PARAM [int] theirs: the number of tokens of the opponent in the line
+# RETURN [int]: k for k tokens of a single player, signed by player, 0 for a shared line
+def linear(mine, theirs):
+    """Scores a line by the number of tokens of the only player in it"""
+    if theirs == 0:
+        return mine
+    if mine == 0:
+        return -theirs
+    return 0
+
+class WeightedProfile(object):
+    """Scoring profile giving a weight to each number of tokens in a line"""
+
+    # Class constructor.
+    #
+    # PARAM [list of int] weights: the score of a line holding k tokens of a single
+    #                              player at [k], for k from 0; lines with more
+    #                              tokens than listed score the last weight
+    def __init__(self, weights):
+        """Class constructor"""
+        self.weights = tuple(weights)
+
+    # Score a line.
+    #
+    # PARAM [int] mine:   the number of tokens of the player in the line
+    # PARAM [int] theirs: the number of tokens of the opponent in the line
+    # RETURN [int]: the weight of k tokens of a single player, signed by player, 0 for a shared line
+    def __call__(self, mine, theirs):
+        """Scores a line by the weight of the tokens of the only player in it"""
+        last = len(self.weights) - 1
+        if theirs == 0:
+            return self.weights[min(mine, last)]
+        if mine == 0:
+            return -self.weights[min(theirs, last)]
+        return 0
+
+    # Profiles with the same weights are the same, even across processes.
+    def __eq__(self, other):
+        return isinstance(other, WeightedProfile) and self.weights == other.weights
+
+    def __hash__(self):
+        return hash(self.weights)
+
+    def __repr__(self):
+        return "WeightedProfile(%r)" % (list(self.weights),)
+
+# Profiles by name
+PROFILES = {
+    "classic": classic,
+    "linear": linear,
+}
+
+# Get a scoring profile.
+#
+# PARAM [string or function] profile: the name of a profile, the path of a weight
+#                                     file written by tune.py, or the profile itself
+# RETURN [function]: the profile
+def get_profile(profile):
+    """Returns the scoring profile called profile"""
+    if callable(profile):
+        return profile
+    if profile in PROFILES:
+        return PROFILES[profile]
+    if os.path.isfile(profile):
+        return load_weights(profile)
+    raise ValueError("unknown scoring profile %r, expected a weight file or one of %s" %
+                     (profile, ", ".join(sorted(PROFILES))))
+
+# Tabulate a scoring profile.
+#
+# PARAM [function] profile: the profile
+# PARAM [int]      n:       the number of tokens to line up to win
+# RETURN [list of list of int]: the score of a line with a tokens of the player and
+#                               b of the opponent at [a][b]
+def table(profile, n):
+    """Returns the scores of the profile for every pair of token counts"""
+    return [[profile(a, b) for b in range(n + 1)] for a in range(n + 1)]
+
+################
+# Weight files #
+################
+
+# A weight file is a JSON object with the weights of a WeightedProfile under
+# "weights", and whatever else the tuning recorded about them, such as the
+# board geometry and the number of positions.
+
+# Write a weight file.
+#
+# PARAM [string]      path:    the path of the file
+# PARAM [list of int] weights: the score of a line holding k tokens of a single player at [k]
+# PARAM [dict]        info:    other fields to record
+def save_weights(path, weights, **info):
+    """Writes the weights and the information about them to a file"""
+    data = dict(info)
+    data["weights"] = list(weights)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+        f.write("\n")
+
+# Read a weight file.
+#
+# PARAM [string] path: the path of the file
+# RETURN [scoring.WeightedProfile]: the profile with the weights of the file
+def load_weights(path):
+    """Returns the scoring profile of a weight file"""
+    with open(path) as f:
+        data = json.load(f)
+    weights = data.get("weights") if isinstance(data, dict) else None
+    if not isinstance(weights, list) or not weights:
+        raise ValueError(path + " is not a weight file")
+    return WeightedProfile(weights)
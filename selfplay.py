@@ -0,0 +1,290 @@
+import array
+import random
+import time
+import board
+import agent
+
+###################
+# Batch self-play #
+###################
+
+class GameRecord(object):
+    """Compact record of a finished game"""
+
+    # Class constructor.
+    #
+    # PARAM [bytes]            moves:   the column of each move, in order
+    # PARAM [int]              outcome: 1 for Player 1, 2 for Player 2, and 0 for no winner
+    # PARAM [array.array of f] times:   the time taken by each move in seconds, or None
+    def __init__(self, moves, outcome, times=None):
+        """Class constructor"""
+        self.moves = moves
+        self.outcome = outcome
+        self.times = times
+
+class SelfPlayResult(object):
+    """Records of a batch of games and how long they took to play"""
+
+    # Class constructor.
+    #
+    # PARAM [list of selfplay.GameRecord] records: the game records
+    # PARAM [float]                       elapsed: the wall time taken in seconds
+    def __init__(self, records, elapsed):
+        """Class constructor"""
+        self.records = records
+        self.elapsed = elapsed
+
+    # Get the playing speed.
+    #
+    # RETURN [float]: the number of games played per second
+    def games_per_second(self):
+        """Returns the number of games played per second"""
+        if self.elapsed == 0:
+            return float("inf")
+        return len(self.records) / self.elapsed
+
+    # Count the outcomes.
+    #
+    # RETURN [(int, int, int)]: the number of ties, Player 1 wins and Player 2 wins
+    def outcomes(self):
+        """Returns the number of ties, Player 1 wins and Player 2 wins"""
+        counts = [0, 0, 0]
+        for r in self.records:
+            counts[r.outcome] += 1
+        return tuple(counts)
+
+# Play a batch of games between two agents, without printing anything.
+#
+# Unlike game.Game, the agents are handed the game board itself rather than a
+# copy; they may play and undo moves on it but must leave it as they found
+# it. An agent that returns an illegal move loses, as in game.Game.
+#
+# PARAM [int]         w:     the board width
+# PARAM [int]         h:     the board height
+# PARAM [int]         n:     the number of tokens to line up to win
+# PARAM [agent.Agent] p1:    the agent for Player 1
+# PARAM [agent.Agent] p2:    the agent for Player 2
+# PARAM [int]         games: the number of games to play
+# PARAM [int]         seed:  the random seed, None to leave the generator as is
+# PARAM [Bool]        timed: True to record the time taken by each move
+# RETURN [selfplay.SelfPlayResult]: the records of the games
+def play_games(w, h, n, p1, p2, games, seed=None, timed=True):
+    if seed is not None:
+        random.seed(seed)
+    empty = board.Board([[0] * w for i in range(h)], w, h, n)
+    players = (p1, p2)
+    p1.player = 1
+    p2.player = 2
+    clock = time.perf_counter
+    records = []
+    start = clock()
+    for g in range(games):
+        p1.new_game()
+        p2.new_game()
+        brd = empty.copy()
+        moves = bytearray()
+        times = array.array('f') if timed else None
+        outcome = 0
+        p = 0
+        while not brd.is_over():
+            key = brd.hash
+            if timed:
+                st = clock()
+                x = players[p].go(brd)
+                times.append(clock() - st)
+            else:
+                x = players[p].go(brd)
+            if brd.hash != key:
+                raise RuntimeError(players[p].name + " modified the board")
+            # Illegal move: the other player wins
+            if not (0 <= x < w and brd.heights[x] < h):
+                outcome = 2 - p
+                break
+            brd.play(x)
+            moves.append(x)
+            p = 1 - p
+        else:
+            outcome = brd.outcome
+        records.append(GameRecord(bytes(moves), outcome, times))
+    return SelfPlayResult(records, clock() - start)
+
+# Lines through each cell, by board geometry
+_cell_lines = {}
+
+# Get the lines through each cell as an index array.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# PARAM [int] n: the number of tokens to line up to win
+# RETURN [3D numpy array of int]: for each bit position, the bit positions of
+#                                 the lines through it, padded with a line made
+#                                 of the always-empty sentinel cell of the first column
+def cell_lines(w, h, n):
+    """Returns an index array of the lines through each cell"""
+    import numpy as np
+    result = _cell_lines.get((w, h, n))
+    if result is None:
+        table = board.line_table(w, h, n)
+        size = w * (h + 1)
+        most = max(1, max(len(m) for m in table.cell_masks))
+        through = [[] for i in range(size)]
+        for line in table.lines:
+            for pos in line:
+                through[pos].append(list(line))
+        pad = [h] * n
+        result = np.array([t + [pad] * (most - len(t)) for t in through],
+                          dtype=np.intp).reshape(size, most, n)
+        _cell_lines[(w, h, n)] = result
+    return result
+
+# Play random games from a position, all boards in lockstep.
+#
+# Every step plays one random move on every unfinished board at once. The
+# moves are drawn from a NumPy generator, so they differ from those of
+# agent.RandomAgent. The boards are kept as one int64 bitboard per player
+# and game, and wins are found by shifting and masking them, as in
+# board.Board.has_line(); boards with more than 63 bit positions are
+# stored cell by cell instead, see cell_playouts().
+#
+# PARAM [board.Board]               brd:    the starting position, not finished
+# PARAM [int]                       games:  the number of games to play
+# PARAM [numpy.random.Generator]    rng:    the random generator
+# PARAM [Bool]                      record: True to return the moves played
+# RETURN [(numpy array of int8, 2D numpy array of int8)]: the outcome of each game, and
+#                                                        the moves played in each game
+#                                                        (-1 after its end), or None
+def lockstep_playouts(brd, games, rng, record=False):
+    """Plays games random games from brd at once and returns their outcomes"""
+    import numpy as np
+    (w, h, n, stride) = (brd.w, brd.h, brd.n, brd.stride)
+    if w * stride > 63:
+        return cell_playouts(brd, games, rng, record)
+    # Shifts of the runs of tokens, doubled until they reach n, in each direction
+    runs = []
+    for step in (1, stride, stride + 1, stride - 1):
+        shifts = []
+        k = 1
+        while k < n:
+            s = min(k, n - k)
+            shifts.append(s * step)
+            k += s
+        runs.append(shifts)
+    # Bitboards of the player to move and of the other player, and column
+    # heights, of every unfinished game
+    mine = np.full(games, brd.bits[brd.player - 1], dtype=np.int64)
+    theirs = np.full(games, brd.bits[2 - brd.player], dtype=np.int64)
+    heights = np.tile(np.array(brd.heights, dtype=np.int64), (games, 1))
+    outcome = np.zeros(games, dtype=np.int8)
+    left = w * h - brd.tokens
+    moves = np.full((games, left), -1, dtype=np.int8) if record else None
+    active = np.arange(games)
+    rows = np.arange(games)
+    player = brd.player
+    for ply in range(left):
+        k = len(active)
+        if k == 0:
+            break
+        # Pick a random free column on every board
+        r = rng.random((k, w))
+        r[heights == h] = -1.0
+        cols = r.argmax(axis=1)
+        y = heights[rows[:k], cols]
+        heights[rows[:k], cols] = y + 1
+        if record:
+            moves[active, ply] = cols
+        b = mine | (1 << (cols * stride + y))
+        # Look for a line of n tokens in each direction
+        lines = 0
+        for shifts in runs:
+            m = b
+            for shift in shifts:
+                m = m & (m >> shift)
+            lines = lines | m
+        won = lines != 0
+        if won.any():
+            outcome[active[won]] = player
+            keep = ~won
+            active = active[keep]
+            b = b[keep]
+            theirs = theirs[keep]
+            heights = heights[keep]
+        (mine, theirs) = (theirs, b)
+        player = 3 - player
+    return (outcome, moves)
+
+# Play random games from a position, all boards in lockstep, cell by cell.
+#
+# This is lockstep_playouts() for boards too large for an int64 bitboard:
+# every cell of every game is an element of one NumPy array, and the lines
+# through each new token are read from it.
+#
+# PARAM [board.Board]               brd:    the starting position, not finished
+# PARAM [int]                       games:  the number of games to play
+# PARAM [numpy.random.Generator]    rng:    the random generator
+# PARAM [Bool]                      record: True to return the moves played
+# RETURN [(numpy array of int8, 2D numpy array of int8)]: the outcome of each game, and
+#                                                        the moves played in each game
+#                                                        (-1 after its end), or None
+def cell_playouts(brd, games, rng, record=False):
+    """Plays games random games from brd at once and returns their outcomes"""
+    import numpy as np
+    (w, h, stride) = (brd.w, brd.h, brd.stride)
+    size = w * stride
+    lines = cell_lines(w, h, brd.n)
+    # Board state of every game
+    start = np.zeros(size, dtype=np.int8)
+    for p in range(2):
+        for pos in range(size):
+            if brd.bits[p] >> pos & 1:
+                start[pos] = p + 1
+    cells = np.tile(start, (games, 1))
+    heights = np.tile(np.array(brd.heights, dtype=np.intp), (games, 1))
+    outcome = np.zeros(games, dtype=np.int8)
+    left = w * h - brd.tokens
+    moves = np.full((games, left), -1, dtype=np.int8) if record else None
+    active = np.arange(games)
+    player = brd.player
+    for ply in range(left):
+        if len(active) == 0:
+            break
+        # Pick a random free column on every active board
+        free = heights[active] < h
+        r = rng.random((len(active), w)) * free
+        cols = r.argmax(axis=1)
+        pos = cols * stride + heights[active, cols]
+        cells[active, pos] = player
+        heights[active, cols] += 1
+        if record:
+            moves[active, ply] = cols
+        # Check the lines through the new tokens
+        won = (cells[active[:, None, None], lines[pos]] == player).all(axis=2).any(axis=1)
+        outcome[active[won]] = player
+        active = active[~won]
+        player = 3 - player
+    return (outcome, moves)
+
+# Play a batch of games between two random agents, all boards in lockstep.
+#
+# PARAM [int]  w:     the board width
+# PARAM [int]  h:     the board height
+# PARAM [int]  n:     the number of tokens to line up to win
+# PARAM [int]  games: the number of games to play
+# PARAM [int]  seed:  the random seed
+# RETURN [selfplay.SelfPlayResult]: the records of the games
+def play_random_lockstep(w, h, n, games, seed=None):
+    import numpy as np
+    start = time.perf_counter()
+    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+    (outcome, moves) = lockstep_playouts(brd, games, np.random.default_rng(seed), True)
+    records = [GameRecord(m[m >= 0].astype(np.uint8).tobytes(), int(o))
+               for (m, o) in zip(moves, outcome)]
+    return SelfPlayResult(records, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    result = play_games(7, 6, 4, agent.RandomAgent("random1"), agent.RandomAgent("random2"),
+                        10000, seed=1)
+    print("RandomAgent vs. RandomAgent:", round(result.games_per_second() * 60), "games/min",
+          "(ties, P1 wins, P2 wins):", result.outcomes())
+    result = play_random_lockstep(7, 6, 4, 100000, seed=1)
+    print("Lockstep random play:", round(result.games_per_second() * 60), "games/min",
+          "(ties, P1 wins, P2 wins):", result.outcomes())
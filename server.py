@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import random
+import time
+import board
+import agent
+import records
+
+###############
+# Game server #
+###############
+
+# The server speaks a line-based text protocol, so a human can play with a
+# plain TCP client such as netcat. Columns are numbered from 0.
+#
+#   client -> server   HELLO <name>          ask for a game
+#   server -> client   START <player> <w> <h> <n> <limit> <opponent>
+#                                            the game starts; player is 1 or 2
+#   server -> client   GO <move> <move> ...  the moves so far; reply with a column
+#   client -> server   <column>              the move, within limit seconds of GO
+#   server -> client   END <outcome> <reason>
+#                                            1 for Player 1, 2 for Player 2, 0 for
+#                                            no winner; the reason is one of win,
+#                                            tie, illegal, timeout, disconnect
+#   server -> client   ERROR <message>       the line was not understood
+#
+# After END, the client may send HELLO again to play another game. Clients
+# are paired in the order they ask for a game.
+
+class Connection(object):
+    """A client connected to the game server"""
+
+    # Class constructor.
+    #
+    # PARAM [asyncio.StreamReader] reader: the stream to read from
+    # PARAM [asyncio.StreamWriter] writer: the stream to write to
+    def __init__(self, reader, writer):
+        """Class constructor"""
+        self.reader = reader
+        self.writer = writer
+        # Player name, given by HELLO
+        self.name = None
+        # Set when the game the client is playing ends
+        self.done = asyncio.Event()
+        # Task reading ahead while the client waits for an opponent, which
+        # notices the client leaving
+        self.watch = None
+
+    # Send a line.
+    #
+    # PARAM [string] line: the line, without the end of line
+    async def send(self, line):
+        """Sends a line to the client"""
+        self.writer.write((line + "\n").encode("utf-8"))
+        await self.writer.drain()
+
+    # Receive a line.
+    #
+    # PARAM [float] timeout: the time to wait in seconds, None for no limit
+    # RETURN [string]: the line, without the end of line, or None at the end of the stream
+    async def receive(self, timeout=None):
+        """Returns the next line from the client"""
+        data = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not data:
+            return None
+        return data.decode("utf-8", "replace").strip()
+
+    # Start reading ahead, while the client waits for an opponent.
+    def start_watching(self):
+        """Starts reading the next line, to notice the client leaving"""
+        self.watch = asyncio.ensure_future(self.reader.readline())
+
+    # Stop reading ahead.
+    #
+    # A line the client sent while waiting is dropped.
+    #
+    # RETURN [bool]: True if the client is still connected
+    async def stop_watching(self):
+        """Stops reading ahead and returns whether the client is still there"""
+        watch = self.watch
+        self.watch = None
+        if watch is not None:
+            watch.cancel()
+            try:
+                if not await watch:
+                    return False
+            except asyncio.CancelledError:
+                pass
+            except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+                return False
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+class GameServer(object):
+    """Hosts games between the clients connected to it"""
+
+    # Class constructor.
+    #
+    # PARAM [int]                  w:        the board width
+    # PARAM [int]                  h:        the board height
+    # PARAM [int]                  n:        the number of tokens to line up to win
+    # PARAM [float]                limit:    the time limit for a move in seconds
+    # PARAM [records.RecordWriter] recorder: where to record the games, None not to record them
+    def __init__(self, w, h, n, limit, recorder=None):
+        """Class constructor"""
+        self.w = w
+        self.h = h
+        self.n = n
+        self.limit = limit
+        self.recorder = recorder
+        # Client waiting for an opponent, if any
+        self.waiting = None
+        # Number of games being played, and played to the end
+        self.playing = 0
+        self.played = 0
+
+    # Serve a client, from connection to disconnection.
+    #
+    # PARAM [asyncio.StreamReader] reader: the stream to read from
+    # PARAM [asyncio.StreamWriter] writer: the stream to write to
+    async def handle(self, reader, writer):
+        """Pairs the client with others until it disconnects"""
+        conn = Connection(reader, writer)
+        try:
+            while True:
+                line = await conn.receive()
+                if line is None:
+                    break
+                words = line.split(None, 1)
+                if not words or words[0] != "HELLO":
+                    await conn.send("ERROR expected HELLO <name>")
+                    continue
+                conn.name = words[1] if len(words) > 1 else "anonymous"
+                conn.done.clear()
+                other = await self.take_waiting()
+                if other is None:
+                    if not await self.wait_for_opponent(conn):
+                        break
+                else:
+                    await self.play(other, conn)
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if self.waiting is conn:
+                self.waiting = None
+            if conn.watch is not None:
+                conn.watch.cancel()
+            writer.close()
+
+    # Take the client waiting for an opponent.
+    #
+    # Clients that left while waiting are dropped.
+    #
+    # RETURN [server.Connection]: the client, or None if no client is waiting
+    async def take_waiting(self):
+        """Returns the waiting client, if it is still connected"""
+        while self.waiting is not None:
+            other = self.waiting
+            self.waiting = None
+            if await other.stop_watching():
+                return other
+            # Let its handler see that it left
+            other.done.set()
+        return None
+
+    # Wait for an opponent to play a game with.
+    #
+    # The client is read from while it waits, since asyncio only notices it
+    # leaving on a read.
+    #
+    # PARAM [server.Connection] conn: the client
+    # RETURN [bool]: True once the game was played, False if the client left first
+    async def wait_for_opponent(self, conn):
+        """Waits until the client has played a game against the next client"""
+        self.waiting = conn
+        done = asyncio.ensure_future(conn.done.wait())
+        try:
+            while self.waiting is conn:
+                conn.start_watching()
+                await asyncio.wait({done, conn.watch}, return_when=asyncio.FIRST_COMPLETED)
+                if self.waiting is conn:
+                    # The client sent a line or left before an opponent came
+                    if not await conn.stop_watching():
+                        self.waiting = None
+                        return False
+                    await conn.send("ERROR wait for START")
+            await done
+        finally:
+            done.cancel()
+        return True
+
+    # Play a game between two clients.
+    #
+    # PARAM [server.Connection] c1: the client for Player 1
+    # PARAM [server.Connection] c2: the client for Player 2
+    # RETURN [int]: the game outcome
+    async def play(self, c1, c2):
+        """Plays a game, enforcing the time limit on every move"""
+        self.playing += 1
+        conns = [c1, c2]
+        brd = board.Board([[0] * self.w for i in range(self.h)], self.w, self.h, self.n)
+        moves = []
+        times = []
+        outcome = None
+        reason = None
+        try:
+            try:
+                for p in range(2):
+                    await conns[p].send("START %d %d %d %d %g %s" % (p + 1, self.w, self.h, self.n,
+                                                                     self.limit, conns[1 - p].name))
+                p = 0
+                while not brd.is_over():
+                    await conns[p].send(" ".join(["GO"] + [str(x) for x in moves]))
+                    st = time.time()
+                    try:
+                        line = await conns[p].receive(self.limit)
+                    except asyncio.TimeoutError:
+                        (outcome, reason) = (2 - p, "timeout")
+                        break
+                    except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+                        # The connection broke, or the line is longer than the stream limit
+                        line = None
+                    et = time.time() - st
+                    if line is None:
+                        (outcome, reason) = (2 - p, "disconnect")
+                        break
+                    try:
+                        x = int(line)
+                    except ValueError:
+                        x = None
+                    if not x in brd.free_cols():
+                        (outcome, reason) = (2 - p, "illegal")
+                        break
+                    brd.play(x)
+                    moves.append(x)
+                    times.append(et)
+                    p = 1 - p
+                if outcome is None:
+                    outcome = brd.get_outcome()
+                    reason = "win" if outcome != 0 else "tie"
+            except ConnectionError:
+                # A client went away while a line was sent to it
+                outcome = 2 - p if conns[p].writer.is_closing() else p + 1
+                reason = "disconnect"
+            self.played += 1
+            if self.recorder is not None:
+                self.recorder.write(c1.name, c2.name, moves, outcome, times)
+                # The server may be stopped at any time
+                self.recorder.flush()
+            for conn in conns:
+                try:
+                    await conn.send("END %d %s" % (outcome, reason))
+                except ConnectionError:
+                    pass
+        finally:
+            self.playing -= 1
+            # Never leave a client waiting for the end of the game
+            c1.done.set()
+            c2.done.set()
+        return outcome
+
+    # Accept clients until cancelled.
+    #
+    # PARAM [string] host: the address to listen on
+    # PARAM [int]    port: the port to listen on, 0 for any free port
+    # RETURN [asyncio.Server]: the listening server
+    async def start(self, host="127.0.0.1", port=7777):
+        """Starts listening for clients"""
+        return await asyncio.start_server(self.handle, host, port)
+
+###################
+# Stand-in client #
+###################
+
+# Play games on a server with an agent.
+#
+# The agent's go_by() runs in a thread, so that a slow agent does not block
+# the other clients of the event loop.
+#
+# PARAM [agent.Agent] ag:    the agent
+# PARAM [string]      host:  the address of the server
+# PARAM [int]         port:  the port of the server
+# PARAM [int]         games: the number of games to play
+# RETURN [list of int]: the outcome of each game, from the agent's point of
+#                       view: 1 for a win, -1 for a loss, and 0 for a tie
+async def run_client(ag, host="127.0.0.1", port=7777, games=1):
+    """Plays games with the agent and returns their results"""
+    loop = asyncio.get_running_loop()
+    (reader, writer) = await asyncio.open_connection(host, port)
+    conn = Connection(reader, writer)
+    results = []
+    try:
+        for g in range(games):
+            await conn.send("HELLO " + ag.name)
+            brd = None
+            limit = None
+            while True:
+                line = await conn.receive()
+                if line is None:
+                    return results
+                words = line.split()
+                if words[0] == "START":
+                    (ag.player, w, h, n) = [int(x) for x in words[1:5]]
+                    limit = float(words[5])
+                    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+                    ag.new_game()
+                elif words[0] == "GO":
+                    for x in words[1 + brd.tokens:]:
+                        brd.play(int(x))
+                    # Keep a margin for the network
+                    deadline = time.time() + limit * 0.9
+                    x = await loop.run_in_executor(None, ag.go_by, brd.copy(), deadline)
+                    await conn.send(str(x))
+                elif words[0] == "END":
+                    outcome = int(words[1])
+                    results.append(0 if outcome == 0 else (1 if outcome == ag.player else -1))
+                    break
+    finally:
+        writer.close()
+    return results
+
+# Play games between local agents through a server, all in one process.
+#
+# PARAM [int]                 w:     the board width
+# PARAM [int]                 h:     the board height
+# PARAM [int]                 n:     the number of tokens to line up to win
+# PARAM [float]               limit: the time limit for a move in seconds
+# PARAM [list of agent.Agent] ps:    the agents, each one a client
+# PARAM [int]                 games: the number of games played by each agent
+# RETURN [dict of string:list of int]: the results of each agent, by name
+async def simulate(w, h, n, limit, ps, games=1):
+    """Connects every agent to a local server and plays the games"""
+    srv = GameServer(w, h, n, limit)
+    server = await srv.start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        results = await asyncio.gather(*[run_client(ag, "127.0.0.1", port, games) for ag in ps])
+    return dict((ag.name, r) for ag, r in zip(ps, results))
+
+###################
+# Run the server! #
+###################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ConnectN game server")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=7777, help="port to listen on")
+    parser.add_argument("--size", type=int, nargs=3, default=[7, 6, 4], metavar=("W", "H", "N"),
+                        help="board geometry")
+    parser.add_argument("--limit", type=float, default=15, help="time limit for a move in seconds")
+    parser.add_argument("--record", default=None, help="game record file to append the games to")
+    parser.add_argument("--simulate", type=int, default=0, metavar="CLIENTS",
+                        help="play games between this many local random agents, then exit")
+    parser.add_argument("--games", type=int, default=1, help="games per simulated client")
+    args = parser.parse_args()
+    (w, h, n) = args.size
+    if args.simulate:
+        random.seed(1)
+        ps = [agent.RandomAgent("random%d" % i) for i in range(args.simulate)]
+        st = time.time()
+        results = asyncio.run(simulate(w, h, n, args.limit, ps, args.games))
+        played = sum(len(r) for r in results.values()) // 2
+        print(played, "games in %.2f s" % (time.time() - st))
+    else:
+        recorder = None
+        if args.record is not None:
+            recorder = records.RecordWriter(args.record, w, h, n)
+        async def main():
+            srv = GameServer(w, h, n, args.limit, recorder)
+            server = await srv.start(args.host, args.port)
+            print("Listening on %s:%d" % (args.host, args.port))
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if recorder is not None:
+                recorder.close()
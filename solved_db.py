@@ -0,0 +1,524 @@
+import argparse
+import concurrent.futures
+import math
+import mmap
+import os
+import struct
+import time
+import numpy as np
+import board
+
+##################
+# Position index #
+##################
+
+# Every position of a small board gets its own slot, numbered in three
+# parts: the number of tokens t, the heights of the columns among all the
+# ways of stacking t tokens in w columns of at most h, and the cells of
+# Player 1 among the t tokens, as a combination of ceil(t/2) cells out of t.
+# The slots of the positions with t tokens follow those with t-1 tokens.
+# This perfect hash only spans the positions with legal token counts, of
+# which the reachable positions are a good fraction: 5x5 takes 172M slots
+# and 6x5 9.9G.
+
+class PositionIndex(object):
+    """Ranking of the positions of a board geometry"""
+
+    # Class constructor.
+    #
+    # PARAM [int] w: the board width
+    # PARAM [int] h: the board height
+    def __init__(self, w, h):
+        """Class constructor"""
+        self.w = w
+        self.h = h
+        self.stride = h + 1
+        cells = w * h
+        # Number of ways columns x .. w-1 hold s tokens, at [x][s]
+        ways = [[0] * (cells + 1) for x in range(w + 1)]
+        ways[w][0] = 1
+        for x in range(w - 1, -1, -1):
+            for s in range(cells + 1):
+                ways[x][s] = sum(ways[x + 1][s - k] for k in range(min(h, s) + 1))
+        # Rank of the column heights gained by a column of height k, with s tokens
+        # in that column and the next ones, at [x][s][k]; too high a column is
+        # out of reach of any rank
+        self.skip = [[[0] * (h + 1) for s in range(cells + 1)] for x in range(w)]
+        for x in range(w):
+            for s in range(cells + 1):
+                for k in range(1, h + 1):
+                    if k > s:
+                        self.skip[x][s][k] = 1 << 62
+                    else:
+                        self.skip[x][s][k] = self.skip[x][s][k - 1] + ways[x + 1][s - k + 1]
+        # Binomial coefficients, C(a, b) at [a][b], 0 if b > a
+        self.binom = [[math.comb(a, b) for b in range(cells + 2)] for a in range(cells + 2)]
+        # Number of Player 1 cell sets of a position with t tokens
+        self.combinations = [self.binom[t][(t + 1) // 2] for t in range(cells + 1)]
+        # First slot of the positions with t tokens, at [t], and the number of slots at [cells + 1]
+        self.offsets = [0]
+        for t in range(cells + 1):
+            self.offsets.append(self.offsets[-1] + ways[0][t] * self.combinations[t])
+        self.slots = self.offsets[-1]
+        # The same tables, for the computations on arrays of positions
+        self.skip_array = np.array(self.skip, dtype=np.int64)
+        self.binom_array = np.array(self.binom, dtype=np.int64)
+        self.combinations_array = np.array(self.combinations, dtype=np.int64)
+        self.offsets_array = np.array(self.offsets, dtype=np.int64)
+
+    # Get the index of a position.
+    #
+    # PARAM [board.Board] brd: the position, of the geometry of the index
+    # RETURN [int]: the slot of the position
+    def index(self, brd):
+        """Returns the slot of the position"""
+        t = brd.tokens
+        left = t
+        heights_rank = 0
+        # Player 1 cells, packed one column on top of the other
+        packed = 0
+        shift = 0
+        for x in range(self.w):
+            k = brd.heights[x]
+            heights_rank += self.skip[x][left][k]
+            left -= k
+            packed |= ((brd.bits[0] >> (x * self.stride)) & ((1 << k) - 1)) << shift
+            shift += k
+        cells_rank = 0
+        ones = 0
+        for p in range(t):
+            if (packed >> p) & 1:
+                ones += 1
+                cells_rank += self.binom[p][ones]
+        return self.offsets[t] + heights_rank * self.combinations[t] + cells_rank
+
+    # Get the indices of positions.
+    #
+    # PARAM [numpy array of uint64]   bits1:   the bitboards of Player 1
+    # PARAM [2D numpy array of int64] heights: the height of every column of each position
+    # RETURN [numpy array of int64]: the slots of the positions
+    def encode(self, bits1, heights):
+        """Returns the slots of the positions"""
+        t = heights.sum(axis=1)
+        left = t.copy()
+        heights_rank = np.zeros(len(t), dtype=np.int64)
+        packed = np.zeros(len(t), dtype=np.uint64)
+        shift = np.zeros(len(t), dtype=np.uint64)
+        for x in range(self.w):
+            k = heights[:, x]
+            heights_rank += self.skip_array[x, left, k]
+            left -= k
+            k = k.astype(np.uint64)
+            mask = np.left_shift(np.uint64(1), k) - np.uint64(1)
+            packed |= ((bits1 >> np.uint64(x * self.stride)) & mask) << shift
+            shift += k
+        cells_rank = np.zeros(len(t), dtype=np.int64)
+        ones = np.zeros(len(t), dtype=np.int64)
+        for p in range(self.w * self.h):
+            bit = ((packed >> np.uint64(p)) & np.uint64(1)).astype(np.int64)
+            ones += bit
+            cells_rank += bit * self.binom_array[p, ones]
+        return self.offsets_array[t] + heights_rank * self.combinations_array[t] + cells_rank
+
+    # Get the positions of indices.
+    #
+    # PARAM [numpy array of int64] indices: the slots of the positions, all holding t tokens
+    # PARAM [int]                  t:       the number of tokens of the positions
+    # RETURN [(numpy array of uint64, numpy array of uint64, 2D numpy array of int64)]:
+    #        the bitboards of Player 1 and Player 2, and the height of every column
+    def decode(self, indices, t):
+        """Returns the bitboards and column heights of the positions"""
+        (heights_rank, cells_rank) = np.divmod(indices - self.offsets[t], self.combinations[t])
+        count = len(indices)
+        heights = np.zeros((count, self.w), dtype=np.int64)
+        left = np.full(count, t, dtype=np.int64)
+        for x in range(self.w):
+            # The height is the number of heights whose rank is not above the rest
+            skip = self.skip_array[x, left]
+            k = (skip[:, 1:] <= heights_rank[:, None]).sum(axis=1)
+            heights_rank -= skip[np.arange(count), k]
+            heights[:, x] = k
+            left -= k
+        # Player 1 cells, found from the highest
+        packed = np.zeros(count, dtype=np.uint64)
+        ones = (t + 1) // 2
+        if ones > 0:
+            need = np.full(count, ones, dtype=np.int64)
+            for p in range(t - 1, -1, -1):
+                step = self.binom_array[p, need]
+                bit = (need > 0) & (step <= cells_rank)
+                cells_rank -= np.where(bit, step, 0)
+                need -= bit
+                packed |= bit.astype(np.uint64) << np.uint64(p)
+        bits1 = np.zeros(count, dtype=np.uint64)
+        bits2 = np.zeros(count, dtype=np.uint64)
+        shift = np.zeros(count, dtype=np.uint64)
+        for x in range(self.w):
+            k = heights[:, x].astype(np.uint64)
+            full = np.left_shift(np.uint64(1), k) - np.uint64(1)
+            c = (packed >> shift) & full
+            bits1 |= c << np.uint64(x * self.stride)
+            bits2 |= (full ^ c) << np.uint64(x * self.stride)
+            shift += k
+        return (bits1, bits2, heights)
+
+# Position index of each board geometry
+_indices = {}
+
+# Get the position index of a board geometry.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# RETURN [solved_db.PositionIndex]: the index, shared by all the callers
+def position_index_of(w, h):
+    """Returns the position index of a w*h board"""
+    index = _indices.get((w, h))
+    if index is None:
+        index = PositionIndex(w, h)
+        _indices[(w, h)] = index
+    return index
+
+# Get the number of slots of a board geometry.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# RETURN [int]: the number of position indices
+def slot_count(w, h):
+    """Returns the number of position indices of a w*h board"""
+    return position_index_of(w, h).slots
+
+# Get the index of a position.
+#
+# PARAM [board.Board] brd: the position
+# RETURN [int]: the slot of the position
+def position_index(brd):
+    """Returns the slot of the position in a solved database"""
+    return position_index_of(brd.w, brd.h).index(brd)
+
+# Check bitboards for lines of n tokens, as board.Board.has_line() does.
+#
+# PARAM [numpy array of uint64] bits:   the bitboards
+# PARAM [int]                   stride: the number of bits per column
+# PARAM [int]                   n:      the number of tokens to line up to win
+# RETURN [numpy array of bool]: True for the bitboards holding a line
+def has_lines(bits, stride, n):
+    """Returns which bitboards contain a line of n tokens"""
+    result = np.zeros(len(bits), dtype=bool)
+    for step in (1, stride, stride + 1, stride - 1):
+        m = bits.copy()
+        k = 1
+        while k < n:
+            s = min(k, n - k)
+            m &= m >> np.uint64(s * step)
+            k += s
+        result |= m != 0
+    return result
+
+# Get the children of positions.
+#
+# All the positions have the same number of tokens, so the same player to move.
+#
+# PARAM [solved_db.PositionIndex] index:   the position index
+# PARAM [numpy array of uint64]   bits1:   the bitboards of Player 1
+# PARAM [2D numpy array of int64] heights: the height of every column of each position
+# PARAM [int]                     player:  the player to move, 1 or 2
+# RETURN [list of (numpy array of bool, numpy array of int64)]: for each column,
+#        which positions can play in it and the slots after the move
+def children(index, bits1, heights, player):
+    """Returns the slots of the positions after each move"""
+    result = []
+    for x in range(index.w):
+        legal = heights[:, x] < index.h
+        after = heights[legal]
+        after[:, x] += 1
+        child_bits = bits1[legal]
+        if player == 1:
+            child_bits |= np.left_shift(np.uint64(1), (x * index.stride + heights[legal, x]).astype(np.uint64))
+        slots = np.zeros(len(heights), dtype=np.int64)
+        slots[legal] = index.encode(child_bits, after)
+        result.append((legal, slots))
+    return result
+
+#######################
+# Retrograde analysis #
+#######################
+
+# A database file starts with a header:
+#
+#   magic "CNDB", format version (uint8), w, h, n (uint8 each)
+#
+# followed by one signed byte per slot of the position index: the score of
+# the position for the player to move, as computed by solver.Solver, or
+# UNKNOWN for the slots of positions that cannot be reached.
+
+MAGIC = b"CNDB"
+VERSION = 2
+
+_HEADER = struct.Struct("<4sBBBB")
+
+# Score of the slots of unreachable positions
+UNKNOWN = -128
+
+# Mark of the slots of reachable positions not scored yet, while building
+REACHABLE = 127
+
+# Database opened by each worker process, by path
+_worker_maps = {}
+
+# Open a database file being built in a worker process.
+#
+# PARAM [string] path: the path of the file
+# RETURN [numpy array of int8]: the scores, by slot, writable
+def _scores_of(path):
+    scores = _worker_maps.get(path)
+    if scores is None:
+        scores = np.memmap(path, dtype=np.int8, mode="r+", offset=_HEADER.size)
+        _worker_maps[path] = scores
+    return scores
+
+# Get the positions marked reachable in a range of slots.
+#
+# PARAM [numpy array of int8] scores: the scores, by slot
+# PARAM [int]                 start:  the first slot
+# PARAM [int]                 stop:   the slot after the last one
+# RETURN [numpy array of int64]: the slots marked REACHABLE
+def _reachable(scores, start, stop):
+    return np.flatnonzero(scores[start:stop] == REACHABLE).astype(np.int64) + start
+
+# Mark the children of the unfinished positions in a range of slots as reachable.
+#
+# PARAM [string] path:   the database file
+# PARAM [int]    w:      the board width
+# PARAM [int]    h:      the board height
+# PARAM [int]    n:      the number of tokens to line up to win
+# PARAM [int]    tokens: the number of tokens of the positions in the range
+# PARAM [int]    start:  the first slot of the range
+# PARAM [int]    stop:   the slot after the last one
+# RETURN [int]: the number of reachable positions in the range
+def expand(path, w, h, n, tokens, start, stop):
+    """Marks the positions reached in one move from the unfinished positions of the range"""
+    scores = _scores_of(path)
+    index = position_index_of(w, h)
+    indices = _reachable(scores, start, stop)
+    if tokens == w * h or len(indices) == 0:
+        return len(indices)
+    (bits1, bits2, heights) = index.decode(indices, tokens)
+    # Only the player who just moved can have won
+    if tokens > 0:
+        live = ~has_lines(bits2 if tokens % 2 == 0 else bits1, h + 1, n)
+        (bits1, heights) = (bits1[live], heights[live])
+    for (legal, slots) in children(index, bits1, heights, 1 + tokens % 2):
+        scores[slots[legal]] = REACHABLE
+    return len(indices)
+
+# Score the reachable positions of a range of slots from the scores of their children.
+#
+# PARAM [string] path:   the database file, holding the scores of the positions
+#                        with one more token
+# PARAM [int]    w:      the board width
+# PARAM [int]    h:      the board height
+# PARAM [int]    n:      the number of tokens to line up to win
+# PARAM [int]    tokens: the number of tokens of the positions in the range
+# PARAM [int]    start:  the first slot of the range
+# PARAM [int]    stop:   the slot after the last one
+# RETURN [int]: the number of positions scored
+def score(path, w, h, n, tokens, start, stop):
+    """Scores the positions of the range by negamax over their children"""
+    scores = _scores_of(path)
+    index = position_index_of(w, h)
+    indices = _reachable(scores, start, stop)
+    if len(indices) == 0:
+        return 0
+    (bits1, bits2, heights) = index.decode(indices, tokens)
+    if tokens > 0:
+        lost = has_lines(bits2 if tokens % 2 == 0 else bits1, h + 1, n)
+    else:
+        lost = np.zeros(len(indices), dtype=bool)
+    if tokens == w * h:
+        best = np.zeros(len(indices), dtype=np.int64)
+    else:
+        best = np.full(len(indices), -(1 << 30), dtype=np.int64)
+        for (legal, slots) in children(index, bits1, heights, 1 + tokens % 2):
+            value = np.full(len(indices), -(1 << 30), dtype=np.int64)
+            value[legal] = -scores[slots[legal]].astype(np.int64)
+            np.maximum(best, value, out=best)
+    # A finished game scores as in solver.Solver.final_score()
+    best[lost] = -(w * h + 1 - tokens)
+    scores[indices] = best.astype(np.int8)
+    return len(indices)
+
+# Solve every position of a small board and write the database file.
+#
+# The positions are found forwards, one layer per number of tokens, by
+# marking the slots of the children of each layer as reachable in the file.
+# They are then scored backwards from the full boards, each layer from the
+# scores of the next one. Each layer is split into ranges of slots handed to
+# a process pool; the workers read and write the memory-mapped file, so the
+# memory used does not grow with the number of positions: each worker holds
+# arrays of about 200 bytes per slot of its range, 200 MB with the default
+# chunk, besides the pages of the file cached by the system. The file takes
+# one byte per slot, 9.9 GB for 6x5.
+#
+# PARAM [string] path:      the path of the file to write
+# PARAM [int]    w:         the board width
+# PARAM [int]    h:         the board height
+# PARAM [int]    n:         the number of tokens to line up to win
+# PARAM [int]    workers:   the number of processes, 1 to work in this process
+# PARAM [int]    chunk:     the number of slots per task
+# PARAM [int]    max_slots: the largest number of slots allowed, so of bytes of the file
+# RETURN [int]: the number of positions solved
+def build(path, w, h, n, workers=None, chunk=1 << 20, max_slots=1 << 34):
+    """Solves every position reachable on a w*h board and writes them to a database file"""
+    if w * (h + 1) > 64:
+        raise ValueError("a %dx%d board does not fit a 64-bit bitboard" % (w, h))
+    index = position_index_of(w, h)
+    slots = index.slots
+    if slots > max_slots:
+        raise ValueError("a %dx%d board needs %d slots, more than the limit of %d" %
+                         (w, h, slots, max_slots))
+    # A map of an earlier file at this path would see it truncated
+    _worker_maps.pop(path, None)
+    if workers != 1:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    def run(fn, tokens):
+        (first, last) = (index.offsets[tokens], index.offsets[tokens + 1])
+        tasks = [(path, w, h, n, tokens, i, min(i + chunk, last)) for i in range(first, last, chunk)]
+        if workers == 1 or len(tasks) <= 1:
+            return sum(fn(*task) for task in tasks)
+        return sum(pool.map(fn, *zip(*tasks)))
+    try:
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, w, h, n))
+            block = bytes([UNKNOWN & 0xff]) * (1 << 20)
+            left = slots
+            while left > 0:
+                f.write(block[:min(left, len(block))])
+                left -= len(block)
+        # Forwards: mark the reachable positions, by number of tokens
+        empty = board.Board([[0] * w for i in range(h)], w, h, n)
+        scores = _scores_of(path)
+        scores[position_index(empty)] = REACHABLE
+        count = 0
+        for tokens in range(w * h + 1):
+            count += run(expand, tokens)
+        # Backwards: the scores, from the full boards to the empty board
+        for tokens in range(w * h, -1, -1):
+            run(score, tokens)
+        scores.flush()
+    finally:
+        _worker_maps.pop(path, None)
+        if workers != 1:
+            pool.shutdown()
+    return count
+
+###########################
+# Solved position lookups #
+###########################
+
+class SolvedDatabase(object):
+    """Exact scores of every position of a small board, read from a database file"""
+
+    # Class constructor.
+    #
+    # The file is only opened and memory-mapped at the first lookup.
+    #
+    # PARAM [string] path: the path of the database file
+    def __init__(self, path):
+        """Class constructor"""
+        self.path = path
+        # Memory map of the file, None until the first lookup
+        self.map = None
+        # Board geometry
+        self.w = None
+        self.h = None
+        self.n = None
+
+    # Open and map the file.
+    def load(self):
+        """Memory-maps the database file"""
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.w, self.h, self.n) = _HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(self.path + " is not a solved position database")
+        if version != VERSION:
+            raise ValueError("%s: unsupported format version %d" % (self.path, version))
+
+    # Look up a position index.
+    #
+    # PARAM [int] index: the slot of the position
+    # RETURN [int or None]: the score for the player to move, or None if the position is unknown
+    def lookup(self, index):
+        """Returns the score stored in slot index, or None"""
+        if self.map is None:
+            self.load()
+        s = self.map[_HEADER.size + index]
+        if s >= 128:
+            s -= 256
+        return None if s == UNKNOWN else s
+
+    # Get the exact score of a board.
+    #
+    # PARAM [board.Board] brd: the position
+    # RETURN [int or None]: the score for the player to move, as computed by
+    #                       solver.Solver, or None if the database does not hold it
+    def probe(self, brd):
+        """Returns the exact score of the board, or None"""
+        if self.map is None:
+            self.load()
+        if (brd.w, brd.h, brd.n) != (self.w, self.h, self.n):
+            return None
+        return self.lookup(position_index(brd))
+
+    # Get the best move of a board.
+    #
+    # PARAM [board.Board] brd: the position, modified in place and restored
+    # RETURN [int or None]: the column with the best score, the most central
+    #                       one among equals, or None if the database does not hold it
+    def best_move(self, brd):
+        """Returns the best column of the board, or None"""
+        if self.probe(brd) is None or brd.is_over():
+            return None
+        best = None
+        best_score = None
+        centre = (brd.w - 1) / 2
+        for col in sorted(brd.free_cols(), key=lambda col: abs(col - centre)):
+            brd.play(col)
+            s = self.lookup(position_index(brd))
+            brd.undo()
+            if s is not None and (best is None or -s > best_score):
+                best = col
+                best_score = -s
+        return best
+
+    # Release the memory map.
+    def close(self):
+        """Closes the database file"""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    # Get the state to pickle.
+    #
+    # RETURN [dict]: the attributes, without the memory map
+    def __getstate__(self):
+        """Returns the state to pickle"""
+        state = self.__dict__.copy()
+        state["map"] = None
+        return state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve every position of a small ConnectN board")
+    parser.add_argument("database", help="the database file to write")
+    parser.add_argument("--size", type=int, nargs=3, default=[5, 4, 3], metavar=("W", "H", "N"),
+                        help="board geometry")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes solving the positions (default: one per core)")
+    parser.add_argument("--max-slots", type=int, default=1 << 34,
+                        help="largest database allowed, in bytes (default: 16 GiB)")
+    args = parser.parse_args()
+    (w, h, n) = args.size
+    st = time.time()
+    count = build(args.database, w, h, n, args.workers or os.cpu_count(), max_slots=args.max_slots)
+    print("%d positions solved in %.1f s, %d bytes" % (count, time.time() - st,
+                                                        os.path.getsize(args.database)))
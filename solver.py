@@ -0,0 +1,265 @@
+import time
+import transposition as tt
+
+##################
+# Endgame solver #
+##################
+
+# Scores are from the point of view of the player to move. A game won with
+# the k-th token of the board scores w*h+1-k for the winner and -(w*h+1-k)
+# for the loser, so quicker wins score higher; a tie scores 0.
+
+class SolverTimeout(Exception):
+    """Raised inside the solver when the time allotted has run out"""
+    pass
+
+class Solver(object):
+    """Exact solver for Connect-N positions of any geometry"""
+
+    # Class constructor.
+    #
+    # PARAM [int] tt_size: the number of entries of the transposition table
+    def __init__(self, tt_size=1 << 20):
+        """Class constructor"""
+        # Transposition table of proven bounds
+        self.tt = tt.TranspositionTable(tt_size)
+        # Number of nodes visited by the last call to solve()
+        self.nodes = 0
+        # Time at which solving is aborted, None for no limit
+        self.stop_time = None
+
+    # Solve a position.
+    #
+    # The score is found by a sequence of null-window searches, each of which
+    # only tells whether the score is above or below a given value.
+    #
+    # PARAM [board.Board] brd:       the board, modified in place and restored
+    # PARAM [float]       stop_time: the time (as returned by time.time()) at which
+    #                                to give up, None for no limit
+    # RETURN [(int, int)]: the score of the position and the best column, or
+    #                      None for the column if the game is over
+    def solve(self, brd, stop_time=None):
+        """Returns the exact score of the position and the best column"""
+        self.nodes = 0
+        self.stop_time = stop_time
+        if brd.is_over():
+            return (self.final_score(brd), None)
+        best = self.max_score(brd)
+        lo = -best
+        hi = best
+        moves_before = len(brd.history)
+        try:
+            while lo < hi:
+                # Probe around 0 first, where most scores are
+                med = lo + (hi - lo) // 2
+                if med <= 0 and int(lo / 2) < med:
+                    med = int(lo / 2)
+                elif med >= 0 and int(hi / 2) > med:
+                    med = int(hi / 2)
+                r = self.negamax(brd, med, med + 1)
+                if r <= med:
+                    hi = r
+                else:
+                    lo = r
+            return (lo, self.best_move(brd, lo))
+        except SolverTimeout:
+            while len(brd.history) > moves_before:
+                brd.undo()
+            raise
+
+    # Find a move that reaches a known score.
+    #
+    # PARAM [board.Board] brd:   the board, modified in place and restored
+    # PARAM [int]         score: the score of the position
+    # RETURN [int]: the first column, in search order, whose score is score
+    def best_move(self, brd, score):
+        """Returns a column that achieves the given score"""
+        mine = brd.bits[brd.player - 1]
+        for col in self.ordered_moves(brd, None):
+            if self.wins_at(brd, mine, col):
+                return col
+        for col in self.ordered_moves(brd, None):
+            brd.play(col)
+            if brd.is_over():
+                r = -self.final_score(brd)
+            else:
+                r = -self.negamax(brd, -score, -score + 1)
+            brd.undo()
+            if r >= score:
+                return col
+        return self.ordered_moves(brd, None)[0]
+
+    # Convert a score into the outcome and the distance to it.
+    #
+    # PARAM [board.Board] brd:   the board the score is for
+    # PARAM [int]         score: the score of the position
+    # RETURN [(int, int)]: 1 for a win, -1 for a loss and 0 for a tie of the
+    #                      player to move, and the number of moves until then
+    def outcome(self, brd, score):
+        """Returns the proven result for the player to move and its distance in moves"""
+        cells = brd.w * brd.h
+        if score > 0:
+            return (1, cells + 1 - score - brd.tokens)
+        if score < 0:
+            return (-1, cells + 1 + score - brd.tokens)
+        return (0, cells - brd.tokens)
+
+    # Get the score of a finished game.
+    #
+    # PARAM [board.Board] brd: the board
+    # RETURN [int]: the score for the player to move
+    def final_score(self, brd):
+        """Returns the score of a finished game for the player to move"""
+        if brd.outcome == 0:
+            return 0
+        s = brd.w * brd.h + 1 - brd.tokens
+        return s if brd.outcome == brd.player else -s
+
+    # Get the best score the player to move could reach.
+    #
+    # PARAM [board.Board] brd: the board
+    # RETURN [int]: the score of a win with the next token
+    def max_score(self, brd):
+        """Returns the score of an immediate win"""
+        return brd.w * brd.h - brd.tokens
+
+    # Get the cells that would complete a line.
+    #
+    # PARAM [board.Board] brd:  the board
+    # PARAM [int]         bits: the bitboard of a player
+    # RETURN [int]: the bitboard of the empty cells that complete a line of that player
+    def threats(self, brd, bits):
+        """Returns the empty cells where a token would complete a line of bits"""
+        empty = ~(brd.bits[0] | brd.bits[1])
+        n = brd.n
+        result = 0
+        for mask in brd.lines.masks:
+            missing = mask & ~bits
+            # A single missing cell, which is empty
+            if missing & (missing - 1) == 0 and missing & empty:
+                if bin(bits & mask).count("1") == n - 1:
+                    result |= missing
+        return result
+
+    # Check if a column wins immediately.
+    #
+    # PARAM [board.Board] brd:  the board
+    # PARAM [int]         bits: the bitboard of the player to move
+    # PARAM [int]         col:  the column
+    # RETURN [Bool]: True if a token in col completes a line
+    def wins_at(self, brd, bits, col):
+        """Returns True if the player to move wins by playing col"""
+        pos = col * brd.stride + brd.heights[col]
+        b = bits | (1 << pos)
+        for mask in brd.lines.cell_masks[pos]:
+            if b & mask == mask:
+                return True
+        return False
+
+    # Order the moves to search.
+    #
+    # Moves that leave more cells completing a line of the player come first,
+    # then moves closer to the centre.
+    #
+    # PARAM [board.Board] brd:   the board
+    # PARAM [int]         first: a column to search first, or None
+    # PARAM [list of int] cols:  the columns to order, None for all the free columns
+    # RETURN [list of int]: the columns, best first
+    def ordered_moves(self, brd, first, cols=None):
+        """Returns the columns, most promising first"""
+        if cols is None:
+            cols = brd.free_cols()
+        if len(cols) < 2:
+            return cols
+        centre = (brd.w - 1) / 2
+        mine = brd.bits[brd.player - 1]
+        def key(col):
+            if col == first:
+                return (0, 0, 0)
+            after = mine | (1 << (col * brd.stride + brd.heights[col]))
+            return (1, -bin(self.threats(brd, after)).count("1"), abs(col - centre))
+        return sorted(cols, key=key)
+
+    # Null-window capable negamax search.
+    #
+    # PARAM [board.Board] brd:   the board, not finished
+    # PARAM [int]         alpha: the lower bound of the window
+    # PARAM [int]         beta:  the upper bound of the window
+    # RETURN [int]: the score, or a bound on it if outside (alpha, beta)
+    def negamax(self, brd, alpha, beta):
+        """Returns the score of the position, within the bounds (alpha, beta)"""
+        self.nodes += 1
+        # Read the clock every 256 nodes, about 6 ms at the solver's speed
+        if (self.nodes & 255 == 0 and self.stop_time is not None and
+            time.time() > self.stop_time):
+            raise SolverTimeout()
+        cells = brd.w * brd.h
+        mine = brd.bits[brd.player - 1]
+        theirs = brd.bits[2 - brd.player]
+        cols = brd.free_cols()
+        # Win now if possible
+        for col in cols:
+            if self.wins_at(brd, mine, col):
+                return cells - brd.tokens
+        # The last empty cell: a tie
+        if brd.tokens == cells - 1:
+            return 0
+        # Threats of the opponent
+        threats = self.threats(brd, theirs)
+        playable = [col for col in cols if (threats >> (col * brd.stride + brd.heights[col])) & 1]
+        if len(playable) > 1:
+            # Two threats can't both be blocked
+            return -(cells - brd.tokens - 1)
+        if playable:
+            cols = playable
+        # Don't play right under a threat of the opponent
+        safe = [col for col in cols
+                if brd.heights[col] + 1 >= brd.h or
+                   not (threats >> (col * brd.stride + brd.heights[col] + 1)) & 1]
+        if not safe:
+            return -(cells - brd.tokens - 1)
+        # The opponent can't win with their next token
+        lower = min(0, -(cells - brd.tokens - 3))
+        if alpha < lower:
+            alpha = lower
+            if alpha >= beta:
+                return alpha
+        # We can't win with this token, as checked above
+        upper = cells - brd.tokens - 2
+        first = None
+        entry = self.tt.probe_board(brd)
+        if entry is not None:
+            (value, depth, bound, first) = entry
+            if bound == tt.UPPER:
+                upper = min(upper, value)
+            elif bound == tt.LOWER:
+                alpha = max(alpha, value)
+                # The position is known to be worth at least beta
+                if alpha >= beta:
+                    return alpha
+            else:
+                return value
+        if beta > upper:
+            beta = upper
+            if alpha >= beta:
+                return beta
+        alpha_orig = alpha
+        best = -cells
+        best_col = None
+        for col in self.ordered_moves(brd, first, safe):
+            brd.play(col)
+            score = -self.negamax(brd, -beta, -alpha)
+            brd.undo()
+            if score > best:
+                best = score
+                best_col = col
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.tt.store_board(brd, score, 0, tt.LOWER, col)
+                        return score
+        if best > alpha_orig:
+            self.tt.store_board(brd, best, 0, tt.EXACT, best_col)
+        else:
+            self.tt.store_board(brd, best, 0, tt.UPPER, best_col)
+        return best
@@ -0,0 +1,139 @@
+import json
+
+#####################
+# Search statistics #
+#####################
+
+# An instance describes a single move, as filled in by the agent, or the sum
+# of several moves, as added up by game.Game or the tournament.
+
+class SearchStats(object):
+    """Counters and timings of the searches made by an agent"""
+
+    # Counters added up by add()
+    COUNTERS = ("moves", "time", "nodes", "leaves", "cutoffs", "first_cutoffs",
+                "tt_probes", "tt_hits", "depth", "branching", "branching_moves",
+                "book_moves", "solved_moves")
+
+    # Class constructor.
+    def __init__(self):
+        """Class constructor"""
+        # Number of moves
+        self.moves = 0
+        # Search time in seconds
+        self.time = 0.0
+        # Nodes visited, and the nodes among them that were evaluated
+        self.nodes = 0
+        self.leaves = 0
+        # Cutoffs, and cutoffs caused by the first move searched
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        # Transposition table lookups, and lookups that found the position
+        self.tt_probes = 0
+        self.tt_hits = 0
+        # Sum of the depths of the last completed iterations
+        self.depth = 0
+        # Sum of the effective branching factors, and number of moves that
+        # have one, as it takes two completed iterations
+        self.branching = 0.0
+        self.branching_moves = 0
+        # Moves played from the opening book, and moves found by the endgame solver
+        self.book_moves = 0
+        self.solved_moves = 0
+        # (depth, seconds, nodes) of each iteration, for a single move
+        self.iterations = []
+
+    # Add up the counters of other statistics.
+    #
+    # PARAM [stats.SearchStats] other: the statistics to add
+    # RETURN [stats.SearchStats]: these statistics
+    def add(self, other):
+        """Adds the counters of other to these statistics"""
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    # Record a completed iteration of a single move.
+    #
+    # The effective branching factor of the move is the ratio of the nodes of
+    # the last two iterations.
+    #
+    # PARAM [int]   depth:   the depth of the iteration
+    # PARAM [float] seconds: the time the iteration took
+    # PARAM [int]   nodes:   the nodes visited by the iteration
+    def add_iteration(self, depth, seconds, nodes):
+        """Records the depth, time and nodes of an iteration"""
+        self.iterations.append((depth, seconds, nodes))
+        self.depth = depth
+        if len(self.iterations) > 1 and self.iterations[-2][2] > 0:
+            self.branching = nodes / self.iterations[-2][2]
+            self.branching_moves = 1
+
+    # Nodes visited per second.
+    @property
+    def nps(self):
+        return self.nodes / self.time if self.time > 0 else 0.0
+
+    # Fraction of the cutoffs caused by the first move, a measure of the move ordering.
+    @property
+    def first_cutoff_rate(self):
+        return self.first_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    # Fraction of the transposition table lookups that found the position.
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    # Average depth of the searched moves.
+    @property
+    def mean_depth(self):
+        searched = self.moves - self.book_moves - self.solved_moves
+        return self.depth / searched if searched > 0 else 0.0
+
+    # Average effective branching factor of the moves that completed two iterations.
+    @property
+    def mean_branching(self):
+        return self.branching / self.branching_moves if self.branching_moves > 0 else 0.0
+
+    # Get the statistics as a dictionary.
+    #
+    # PARAM [dict] extra: more entries, such as the agent name
+    # RETURN [dict]: the counters and the derived rates, ready for json
+    def as_dict(self, **extra):
+        """Returns the counters and rates as a dictionary"""
+        d = dict(extra)
+        for name in self.COUNTERS:
+            d[name] = getattr(self, name)
+        d["nps"] = self.nps
+        d["first_cutoff_rate"] = self.first_cutoff_rate
+        d["tt_hit_rate"] = self.tt_hit_rate
+        d["mean_depth"] = self.mean_depth
+        d["mean_branching"] = self.mean_branching
+        if self.iterations:
+            d["iterations"] = [list(it) for it in self.iterations]
+        return d
+
+# Add up the statistics of several moves or games.
+#
+# PARAM [iterable of stats.SearchStats] items: the statistics, None entries are skipped
+# RETURN [stats.SearchStats]: the sum
+def total(items):
+    """Returns the sum of the statistics"""
+    result = SearchStats()
+    for s in items:
+        if s is not None:
+            result.add(s)
+    return result
+
+# Write statistics as JSON lines.
+#
+# PARAM [string or file] out:  the path of the file to append to, or an open text file
+# PARAM [list of dict]   rows: the rows to write, one per line
+def write_json_lines(out, rows):
+    """Appends one JSON object per row to out"""
+    if isinstance(out, str):
+        with open(out, "a") as f:
+            write_json_lines(f, rows)
+        return
+    for row in rows:
+        out.write(json.dumps(row, sort_keys=True) + "\n")
@@ -0,0 +1,29 @@
+import os
+import random
+import sys
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import board
+
+# Play random moves from the empty board.
+#
+# PARAM [int]           w:     the board width
+# PARAM [int]           h:     the board height
+# PARAM [int]           n:     the number of tokens to line up to win
+# PARAM [int]           moves: the largest number of moves to play
+# PARAM [random.Random] rng:   the random number generator
+# RETURN [board.Board]: the board, after moves moves or at the end of the game
+def play_random(w, h, n, moves, rng):
+    """Returns a board reached by random moves"""
+    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+    while brd.tokens < moves and not brd.is_over():
+        brd.play(rng.choice(brd.free_cols()))
+    return brd
+
+@pytest.fixture
+def rng():
+    """A random number generator with a fixed seed"""
+    return random.Random(1)
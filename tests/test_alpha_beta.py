@@ -0,0 +1,107 @@
+import time
+import pytest
+import alpha_beta_agent
+from conftest import play_random
+
+# Search a board with plain minimax, using the agent's heuristic at the leaves.
+#
+# PARAM [alpha_beta_agent.AlphaBetaAgent] ag:    the agent, whose player is to move at the root
+# PARAM [board.Board]                     brd:   the board, modified in place and restored
+# PARAM [int]                             depth: the number of moves left to search
+# PARAM [bool]                            mine:  whether the agent is to move
+# RETURN [int]: the minimax value of the board for the agent
+def minimax(ag, brd, depth, mine=True):
+    """Returns the value of the board, searched without pruning"""
+    if depth == 0 or brd.is_over():
+        return ag.heuristic(brd)
+    values = []
+    for col in brd.free_cols():
+        brd.play(col)
+        values.append(minimax(ag, brd, depth - 1, not mine))
+        brd.undo()
+    return max(values) if mine else min(values)
+
+# Search a board to each depth in turn, as AlphaBetaAgent.deepen() does.
+#
+# The agent starts a new game with the board.
+#
+# PARAM [alpha_beta_agent.AlphaBetaAgent] ag:    the agent
+# PARAM [board.Board]                     brd:   the board
+# PARAM [int]                             depth: the depth of the last iteration
+# RETURN [list of (int, int)]: the value and best column of each iteration
+def iterations(ag, brd, depth):
+    """Returns the root value and best column of each iteration"""
+    # The tables hold values for the agent's player, so the board starts a new game
+    ag.new_game()
+    ag.player = brd.player
+    if ag.incremental:
+        brd.enable_scoring(ag.profile)
+    ag.start_search(brd)
+    ag.pv = []
+    ag.pv_moves = {}
+    results = []
+    for d in range(1, depth + 1):
+        ag.depth = d
+        results.append(ag.search_root(brd))
+        ag.pv = ag.principal_variation(brd)
+    return results
+
+@pytest.mark.parametrize("w,h,n", [(5, 4, 3), (7, 6, 4)])
+@pytest.mark.parametrize("incremental", [False, True])
+def test_alpha_beta_matches_minimax(w, h, n, incremental, rng):
+    """Every iteration finds the minimax value, and a move that reaches it"""
+    for game in range(6):
+        brd = play_random(w, h, n, rng.randrange(w * h // 2), rng)
+        if brd.is_over():
+            continue
+        ag = alpha_beta_agent.AlphaBetaAgent("ab", 4, incremental=incremental)
+        for d, (value, col) in enumerate(iterations(ag, brd, 4), 1):
+            assert value == minimax(ag, brd, d)
+            brd.play(col)
+            assert minimax(ag, brd, d - 1, False) == value
+            brd.undo()
+
+def test_parallel_search_matches_serial(rng):
+    """The root-parallel search finds the same values as the serial search"""
+    serial = alpha_beta_agent.AlphaBetaAgent("serial", 5)
+    parallel = alpha_beta_agent.AlphaBetaAgent("parallel", 5, workers=2)
+    try:
+        for game in range(3):
+            brd = play_random(7, 6, 4, rng.randrange(12), rng)
+            if brd.is_over():
+                continue
+            expected = iterations(serial, brd, 5)
+            found = iterations(parallel, brd, 5)
+            assert [v for (v, c) in found] == [v for (v, c) in expected]
+            # Moves as good as the best may be picked, but not worse ones
+            for d, (value, col) in enumerate(found, 1):
+                brd.play(col)
+                assert minimax(serial, brd, d - 1, False) == value
+                brd.undo()
+    finally:
+        parallel.close()
+
+def test_timed_search_returns_a_legal_move(rng):
+    """A search out of time still plays a legal move, without going over"""
+    ag = alpha_beta_agent.AlphaBetaAgent("ab", 20, max_time=0.05)
+    ag.player = 1
+    brd = play_random(7, 6, 4, 0, rng)
+    st = time.time()
+    col = ag.go(brd)
+    assert time.time() - st < 0.5
+    assert col in brd.free_cols()
+    assert brd.tokens == 0
+    assert ag.completed_depth >= 1
+
+def test_solver_is_off_by_default(rng):
+    """Only agents given solve_below solve the end of the game exactly"""
+    brd = play_random(5, 4, 3, 0, rng)
+    while brd.w * brd.h - brd.tokens > 8 or brd.is_over():
+        brd = play_random(5, 4, 3, 12, rng)
+    searcher = alpha_beta_agent.AlphaBetaAgent("search", 3)
+    solving = alpha_beta_agent.AlphaBetaAgent("solve", 3, solve_below=8)
+    for ag in (searcher, solving):
+        ag.player = brd.player
+        assert ag.go(brd) in brd.free_cols()
+    assert searcher.proven is None
+    assert solving.proven is not None
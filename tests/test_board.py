@@ -0,0 +1,146 @@
+import pytest
+import board
+import scoring
+from conftest import play_random
+
+GEOMETRIES = [(7, 6, 4), (5, 4, 3), (6, 5, 5), (5, 2, 1), (3, 3, 1), (4, 4, 2)]
+
+# Find the winner of a grid by looking at every cell in every direction.
+#
+# PARAM [2D list of int] grid: the tokens, row-major, row 0 at the bottom
+# PARAM [int]            n:    the number of tokens to line up to win
+# RETURN [set of int]: the players with n tokens in a row
+def naive_winners(grid, n):
+    """Returns the players who have a line of n tokens on the grid"""
+    h = len(grid)
+    w = len(grid[0])
+    winners = set()
+    for y in range(h):
+        for x in range(w):
+            t = grid[y][x]
+            if t == 0:
+                continue
+            for (dx, dy) in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                cells = [(x + i * dx, y + i * dy) for i in range(n)]
+                if all(0 <= cx < w and 0 <= cy < h and grid[cy][cx] == t for (cx, cy) in cells):
+                    winners.add(t)
+    return winners
+
+@pytest.mark.parametrize("w,h,n", GEOMETRIES)
+def test_board_matches_naive_scan(w, h, n, rng):
+    """The bitboards, heights and outcome agree with a plain grid"""
+    for game in range(50):
+        brd = board.Board([[0] * w for i in range(h)], w, h, n)
+        grid = [[0] * w for i in range(h)]
+        heights = [0] * w
+        while not brd.is_over():
+            x = rng.choice(brd.free_cols())
+            grid[heights[x]][x] = brd.player
+            heights[x] += 1
+            brd.add_token(x)
+            assert brd.board == grid
+            assert brd.heights == heights
+            assert brd.free_cols() == [c for c in range(w) if heights[c] < h]
+            winners = naive_winners(grid, n)
+            assert len(winners) <= 1
+            assert brd.scan_outcome() == (winners.pop() if winners else 0)
+        assert brd.is_over() == (brd.get_outcome() != 0 or brd.is_full())
+
+@pytest.mark.parametrize("w,h,n", GEOMETRIES)
+def test_board_from_grid_matches_played_board(w, h, n, rng):
+    """A board built from a grid equals the board the moves were played on"""
+    for game in range(20):
+        played = play_random(w, h, n, w * h, rng)
+        built = board.Board(played.board, w, h, n)
+        assert built.bits == played.bits
+        assert built.heights == played.heights
+        assert built.tokens == played.tokens
+        assert built.get_outcome() == played.get_outcome()
+
+@pytest.mark.parametrize("w,h,n", GEOMETRIES)
+def test_cached_outcome_matches_full_scan(w, h, n, rng):
+    """The outcome kept from the last move equals a scan of the whole board"""
+    for game in range(50):
+        brd = board.Board([[0] * w for i in range(h)], w, h, n)
+        while not brd.is_over():
+            brd.add_token(rng.choice(brd.free_cols()))
+            winners = naive_winners(brd.board, n)
+            assert brd.get_outcome() == (winners.pop() if winners else 0)
+            assert brd.get_outcome() == brd.scan_outcome()
+
+@pytest.mark.parametrize("w,h,n", GEOMETRIES)
+def test_undo_restores_the_board(w, h, n, rng):
+    """play() then undo() gives back the same board and outcome"""
+    for game in range(20):
+        brd = play_random(w, h, n, rng.randrange(w * h), rng)
+        before = (list(brd.bits), list(brd.heights), brd.tokens, brd.player,
+                  brd.outcome, brd.last_move)
+        moves = []
+        while not brd.is_over() and len(moves) < 6:
+            moves.append(rng.choice(brd.free_cols()))
+            brd.play(moves[-1])
+        for x in reversed(moves):
+            assert brd.undo() == x
+        assert (brd.bits, brd.heights, brd.tokens, brd.player,
+                brd.outcome, brd.last_move) == before
+
+@pytest.mark.parametrize("w,h,n", GEOMETRIES)
+def test_hash_depends_only_on_the_position(w, h, n, rng):
+    """Boards built from a grid, reached by undo() or by other move orders share their hash"""
+    for game in range(20):
+        played = play_random(w, h, n, w * h, rng)
+        # A board built from a grid has Player 1 to move
+        if played.player == 1:
+            built = board.Board(played.board, w, h, n)
+            assert (built.hash, built.mirror_hash) == (played.hash, played.mirror_hash)
+        before = (played.hash, played.mirror_hash)
+        moves = [played.undo() for i in range(min(played.tokens, 4))]
+        for x in reversed(moves):
+            played.play(x)
+        assert (played.hash, played.mirror_hash) == before
+    # Two move orders reaching the same position
+    a = play_random(w, h, n, 0, rng)
+    b = play_random(w, h, n, 0, rng)
+    if w >= 3:
+        for x in (0, 1, 2):
+            a.play(x)
+        for x in (2, 1, 0):
+            b.play(x)
+        assert a.hash == b.hash
+        assert a.hash != play_random(w, h, n, 0, rng).hash
+
+def test_mirror_hash_is_the_hash_of_the_mirror_image(rng):
+    """A position and its mirror image share their canonical key"""
+    (w, h, n) = (7, 6, 4)
+    for game in range(20):
+        brd = play_random(w, h, n, rng.randrange(w * h), rng)
+        mirror = board.Board([[0] * w for i in range(h)], w, h, n)
+        for entry in brd.history:
+            mirror.play(w - 1 - entry[0])
+        assert mirror.board == [row[::-1] for row in brd.board]
+        assert mirror.hash == brd.mirror_hash
+        assert mirror.mirror_hash == brd.hash
+        assert mirror.canonical_key() == brd.canonical_key()
+        for x in range(w):
+            assert brd.uncanonical_move(brd.canonical_move(x)) == x
+            # Symmetric positions keep their moves as they are
+            if brd.hash != brd.mirror_hash:
+                assert mirror.canonical_move(w - 1 - x) == brd.canonical_move(x)
+
+@pytest.mark.parametrize("w,h,n", GEOMETRIES)
+@pytest.mark.parametrize("profile", [scoring.classic, scoring.linear])
+def test_incremental_scoring_matches_scratch(w, h, n, profile, rng):
+    """The counts kept up to date by play() and undo() equal those computed from scratch"""
+    for game in range(30):
+        brd = board.Board([[0] * w for i in range(h)], w, h, n)
+        brd.enable_scoring(profile)
+        while brd.free_cols() and rng.random() < 0.95:
+            if brd.history and rng.random() < 0.3:
+                brd.undo()
+            else:
+                brd.play(rng.choice(brd.free_cols()))
+            fresh = board.Board(brd.board, w, h, n)
+            fresh.enable_scoring(profile)
+            assert brd.line_counts == fresh.line_counts
+            assert brd.scores == fresh.scores
+            assert brd.threats == fresh.threats
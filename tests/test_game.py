@@ -0,0 +1,53 @@
+import gc
+import time
+import agent
+import alpha_beta_agent
+import game
+
+class WatchingAgent(agent.RandomAgent):
+    """Random agent that remembers its deadlines and whether the collector was on"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.deadlines = []
+        self.collecting = []
+
+    def go(self, brd):
+        self.deadlines.append(self.deadline - time.time())
+        self.collecting.append(gc.isenabled())
+        return super().go(brd)
+
+def test_timed_moves_get_their_deadline():
+    """Agents are told when their time runs out, and keep the collector by default"""
+    p1 = WatchingAgent("p1")
+    p2 = WatchingAgent("p2")
+    game.Game(5, 4, 3, p1, p2).timed_go(2)
+    assert p1.deadlines and p2.deadlines
+    assert all(1.5 < d <= 2 for d in p1.deadlines + p2.deadlines)
+    assert all(p1.collecting + p2.collecting)
+    assert gc.isenabled()
+
+def test_collector_is_held_off_only_when_asked():
+    """With collect_between_moves the collector is off during moves, and left as it was"""
+    p1 = WatchingAgent("p1")
+    p2 = WatchingAgent("p2")
+    game.Game(5, 4, 3, p1, p2, collect_between_moves=True).timed_go(2)
+    assert not any(p1.collecting + p2.collecting)
+    assert gc.isenabled()
+    gc.disable()
+    try:
+        game.Game(5, 4, 3, p1, p2, collect_between_moves=True).timed_go(2)
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
+
+def test_pondering_games_stay_in_time():
+    """Agents pondering on the opponent's time neither forfeit nor change the game"""
+    p1 = alpha_beta_agent.AlphaBetaAgent("ab1", 20)
+    p2 = alpha_beta_agent.AlphaBetaAgent("ab2", 2)
+    g = game.Game(5, 4, 3, p1, p2, ponder=True)
+    outcome = g.timed_go(0.2)
+    assert len(g.times) == g.board.tokens
+    assert max(g.times) <= 0.2
+    assert outcome == g.board.get_outcome()
+    assert g.ponder_thread is None or not g.ponder_thread.is_alive()
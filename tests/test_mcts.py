@@ -0,0 +1,67 @@
+import random
+import pytest
+import board
+import mcts_agent
+from conftest import play_random
+
+# Build a board from the columns of its moves.
+#
+# PARAM [list of int] moves: the columns played, Player 1 first
+# RETURN [board.Board]: the 7x6 board with n=4 after the moves
+def board_after(moves):
+    """Returns the board reached by the moves"""
+    brd = board.Board([[0] * 7 for i in range(6)], 7, 6, 4)
+    for x in moves:
+        brd.play(x)
+    return brd
+
+@pytest.mark.parametrize("batch", [1, 64])
+def test_mcts_wins_and_blocks(batch):
+    """The agent completes its own line, and otherwise blocks the opponent's"""
+    random.seed(1)
+    # Player 1 to move, with three in a row on the bottom row
+    brd = board_after([1, 1, 2, 2, 3, 6])
+    ag = mcts_agent.MCTSAgent("mcts", playouts=3000, batch=batch)
+    ag.player = 1
+    assert ag.go(brd) in (0, 4)
+    # Player 2 to move, facing three in a column
+    brd = board_after([3, 0, 3, 1, 3])
+    ag = mcts_agent.MCTSAgent("mcts", playouts=3000, batch=batch)
+    ag.player = 2
+    assert ag.go(brd) == 3
+    assert ag.last_playouts >= 3000
+    assert brd.tokens == 5
+
+def test_mcts_reuses_its_tree(rng):
+    """The subtree of the position reached is kept for the next move"""
+    random.seed(1)
+    brd = play_random(7, 6, 4, 0, rng)
+    ag = mcts_agent.MCTSAgent("mcts", playouts=500)
+    ag.player = 1
+    col = ag.go(brd)
+    brd.play(col)
+    brd.play(3)
+    expected = [c for c in ag.root.children if c.move == col][0]
+    expected = [c for c in expected.children if c.move == 3]
+    ag.go(brd)
+    assert expected and ag.root is expected[0]
+
+@pytest.mark.parametrize("w,h,n", [(7, 6, 4), (5, 4, 3), (4, 4, 1), (9, 7, 4)])
+def test_lockstep_playouts_are_legal_games(w, h, n, rng):
+    """The batched playouts play legal games to their real outcome, from any position"""
+    np = pytest.importorskip("numpy")
+    import selfplay
+    generator = np.random.default_rng(1)
+    for start in range(5):
+        brd = play_random(w, h, n, rng.randrange(w * h // 2), rng)
+        if brd.is_over():
+            continue
+        for playouts in (selfplay.lockstep_playouts, selfplay.cell_playouts):
+            (outcomes, moves) = playouts(brd, 50, generator, True)
+            for (o, m) in zip(outcomes, moves):
+                end = brd.copy()
+                for x in m[m >= 0]:
+                    assert not end.is_over()
+                    end.play(int(x))
+                assert end.is_over()
+                assert o == end.get_outcome()
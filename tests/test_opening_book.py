@@ -0,0 +1,60 @@
+import alpha_beta_agent
+import board
+import opening_book
+import records
+
+# Write games to a record file.
+#
+# PARAM [string]                   path:  the record file
+# PARAM [list of (list of int, int)] games: the moves and outcome of each game
+def write_games(path, games):
+    """Writes the games between two fixed players on 5x4 boards with n=3"""
+    with records.RecordWriter(path, 5, 4, 3) as writer:
+        for (moves, outcome) in games:
+            writer.write("p1", "p2", moves, outcome)
+
+def test_book_keeps_the_move_with_the_best_results(tmp_path):
+    """The book plays the opening move that scored best, on the board and its mirror image"""
+    path = str(tmp_path / "games.cngr")
+    write_games(path, [([1, 0, 1, 0], 1)] * 10 + [([2, 1, 2, 1], 2)] * 10 +
+                      [([0, 4], 2)] * 3)
+    (w, h, n, entries) = opening_book.entries_from_records([path], 2, min_games=5)
+    assert (w, h, n) == (5, 4, 3)
+    book_path = str(tmp_path / "book.cnob")
+    opening_book.write_book(book_path, w, h, n, entries)
+    book = opening_book.OpeningBook(book_path)
+    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+    # 1 won every game, 2 lost every game, 0 was played too rarely
+    assert book.probe(brd) == 1
+    brd.play(2)
+    assert book.probe(brd) == 1
+    brd.undo()
+    brd.play(1)
+    assert book.probe(brd) == 0
+    brd.undo()
+    # The mirror image of a position gets the mirrored move
+    brd.play(3)
+    assert book.probe(brd) == 4
+    brd.undo()
+    # Other geometries are not in the book
+    assert book.probe(board.Board([[0] * 7 for i in range(6)], 7, 6, 4)) is None
+    book.close()
+
+def test_agent_plays_from_the_book(tmp_path):
+    """AlphaBetaAgent plays the book move while the position is in the book"""
+    entries = opening_book.entries_from_search(5, 4, 3, 2, 4)
+    path = str(tmp_path / "book.cnob")
+    opening_book.write_book(path, 5, 4, 3, entries)
+    book = opening_book.OpeningBook(path)
+    ag = alpha_beta_agent.AlphaBetaAgent("ab", 4, book=book)
+    ag.player = 1
+    brd = board.Board([[0] * 5 for i in range(4)], 5, 4, 3)
+    col = ag.go(brd)
+    assert ag.from_book
+    assert col == book.probe(brd)
+    for x in (col, 0, 0):
+        brd.play(x)
+    assert book.probe(brd) is None
+    ag.go(brd)
+    assert not ag.from_book
+    book.close()
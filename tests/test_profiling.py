@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import pickle
+import pytest
+import alpha_beta_agent
+import game
+import profiling
+
+# Play a game of two alpha-beta agents under a profiler.
+#
+# PARAM [profiling.Profiler] profiler: the profiler
+# RETURN [game.Game]: the finished game
+def profiled_game(profiler):
+    """Returns a game played with its moves profiled"""
+    p1 = alpha_beta_agent.AlphaBetaAgent("first", 4)
+    p2 = alpha_beta_agent.AlphaBetaAgent("second", 3)
+    g = game.Game(7, 6, 4, p1, p2, profiler=profiler)
+    g.go()
+    profiler.close()
+    return g
+
+@pytest.mark.parametrize("mode", profiling.MODES)
+def test_profiler_records_every_move(mode, capsys):
+    """Each move gets a row for its agent, and the agents' time goes to their search"""
+    profiler = profiling.Profiler(mode, 0.001)
+    g = profiled_game(profiler)
+    capsys.readouterr()
+    assert profiler.agents() == ["first", "second"]
+    assert len(profiler.moves) == g.board.tokens
+    for (ply, row) in enumerate(profiler.moves):
+        assert (row["agent"], row["player"], row["ply"]) == (["first", "second"][ply % 2], ply % 2 + 1, ply)
+        assert row["seconds"] >= 0
+    assert profiler.sampler is None
+    for name in profiler.agents():
+        hot = profiler.hot_functions(name)
+        assert hot
+        for (own, total, f) in hot:
+            assert 0 <= own <= total + 1e-9
+    if mode == "sample":
+        # The stacks start at the agent, below the game
+        for counts in profiler.stacks.values():
+            assert counts
+            assert all(s.startswith("go_by (") for s in counts)
+        assert sum(row["samples"] for row in profiler.moves) == sum(
+            sum(c.values()) for c in profiler.stacks.values())
+    else:
+        assert any("alpha_beta_agent.py" in f for (own, total, f) in profiler.hot_functions("first"))
+        assert profiler.pstats("first").total_calls > 0
+        assert profiler.pstats("nobody") is None
+
+@pytest.mark.parametrize("mode", profiling.MODES)
+def test_profilers_merge_across_processes(mode, capsys):
+    """A profiler pickled as from a worker process merges into a fresh one"""
+    profiler = profiling.Profiler(mode, 0.001)
+    played = [profiled_game(profiler.fresh()) for i in range(2)]
+    capsys.readouterr()
+    merged = profiler.fresh()
+    assert (merged.mode, merged.interval) == (mode, 0.001)
+    for g in played:
+        merged.merge(pickle.loads(pickle.dumps(g.profiler)))
+    assert len(merged.moves) == sum(g.board.tokens for g in played)
+    assert merged.hot_functions("first")
+    if mode == "cprofile":
+        assert len(merged.received["first"]) == 2
+    assert profiler.moves == []
+
+def test_unknown_mode_is_refused():
+    """Only the modes of MODES are accepted"""
+    with pytest.raises(ValueError):
+        profiling.Profiler("trace")
+
+@pytest.mark.parametrize("mode", profiling.MODES)
+def test_report_writes_the_profiles(mode, tmp_path, capsys):
+    """The command line options make a profiler whose report is written to the directory"""
+    parser = argparse.ArgumentParser()
+    profiling.add_arguments(parser)
+    assert profiling.from_arguments(parser.parse_args([])) is None
+    directory = str(tmp_path / "profile")
+    args = parser.parse_args(["--profile", mode, "--profile-dir", directory,
+                              "--profile-interval", "0.001", "--profile-top", "5"])
+    profiler = profiling.from_arguments(args)
+    assert (profiler.mode, profiler.interval) == (mode, 0.001)
+    g = profiled_game(profiler)
+    capsys.readouterr()
+    profiling.report(profiler, args)
+    out = capsys.readouterr().out
+    assert "PROFILE:" in out
+    files = sorted(os.listdir(directory))
+    if mode == "sample":
+        assert files == ["all.collapsed", "first.collapsed", "moves.jsonl",
+                         "second.collapsed", "summary.txt"]
+        with open(os.path.join(directory, "all.collapsed")) as f:
+            lines = f.read().splitlines()
+        assert lines and all(l.split(";")[0] in ("first", "second") for l in lines)
+    else:
+        assert files == ["first.prof", "moves.jsonl", "second.prof", "summary.txt"]
+    with open(os.path.join(directory, "moves.jsonl")) as f:
+        rows = [json.loads(l) for l in f]
+    assert len(rows) == g.board.tokens
+    with open(os.path.join(directory, "summary.txt")) as f:
+        summary = f.read()
+    assert summary.startswith("first: %d moves" % ((g.board.tokens + 1) // 2))
@@ -0,0 +1,64 @@
+import random
+import pytest
+import agent
+import alpha_beta_agent
+import rating
+
+# Fill in results with the expected scores of given ratings.
+#
+# PARAM [list of float] elos:  the true Elo rating of each player
+# PARAM [int]           games: the number of games per pair of players
+# RETURN [rating.Results]: the results, without draws
+def expected_results(elos, games):
+    """Returns results where every pair scored as its rating difference predicts"""
+    results = rating.Results(["p%d" % i for i in range(len(elos))])
+    for i in range(len(elos)):
+        for j in range(len(elos)):
+            if i != j:
+                won = round(games / 2 * rating.expected_score(elos[i] - elos[j]))
+                results.wins[i][j] = won
+    return results
+
+def test_fit_recovers_the_ratings():
+    """Bradley-Terry ratings fitted to many games are the true differences"""
+    elos = [200, 0, -100, -100]
+    (ratings, errors) = rating.fit(expected_results(elos, 20000), prior=0)
+    for i in range(len(elos)):
+        assert ratings[i] - ratings[1] == pytest.approx(elos[i], abs=2)
+        assert 0 < errors[i] < 10
+    assert sum(ratings) == pytest.approx(0)
+    # The prior keeps a player who won every game at a finite rating
+    results = rating.Results(["a", "b"])
+    results.add(0, 1, 1)
+    (ratings, errors) = rating.fit(results)
+    assert 0 < ratings[0] < 400
+
+def test_sprt_stops_on_clear_results():
+    """The log-likelihood ratio crosses the upper bound after enough wins, and the lower after losses"""
+    (lower, upper) = rating.sprt_bounds(0.05, 0.05)
+    assert lower == pytest.approx(-upper)
+    results = rating.Results(["a", "b"])
+    wins = 0
+    while rating.llr(results, 0, 1, 50) < upper:
+        results.add(0, 1, 1)
+        wins += 1
+    assert 5 < wins < 20
+    assert rating.llr(results, 1, 0, 50) <= lower
+    # Draws tell nothing apart
+    draws = rating.Results(["a", "b"])
+    for k in range(100):
+        draws.add(0, 1, 0)
+    assert rating.llr(draws, 0, 1, 50) == pytest.approx(0)
+
+def test_rating_mode_stops_when_decided(capsys):
+    """A searching agent is found stronger than random agents before max_games"""
+    random.seed(1)
+    ps = [alpha_beta_agent.AlphaBetaAgent("ab", 3), agent.RandomAgent("r1"),
+          agent.RandomAgent("r2")]
+    results = rating.play_rating(5, 4, 3, 1, ps, max_games=200)
+    out = capsys.readouterr().out
+    assert "SPRT: ab stronger than r1" in out
+    assert "SPRT: ab stronger than r2" in out
+    assert results.games(0, 1) < 60 and results.games(0, 2) < 60
+    (ratings, errors) = rating.fit(results)
+    assert ratings[0] > max(ratings[1], ratings[2])
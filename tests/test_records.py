@@ -0,0 +1,74 @@
+import pytest
+import records
+
+GAMES = [
+    ("alpha", "beta", [3, 3, 2, 4, 1], 1, [0.5, 0.25, 0.125, 1.5, 2.0]),
+    ("beta", "gamma", [0, 1, 2, 3, 4, 5, 6, 0], 0, None),
+    ("gamma", "alpha", [6], 2, [0.0]),
+    ("delta", "beta", [], 0, None),
+]
+
+# Check a record against the game written.
+#
+# PARAM [records.Record] r:    the record read
+# PARAM [tuple]          game: (p1, p2, moves, outcome, times) as written
+def check(r, game):
+    """Asserts that the record holds the game"""
+    (p1, p2, moves, outcome, times) = game
+    assert (r.p1, r.p2, list(r.moves), r.outcome) == (p1, p2, moves, outcome)
+    if times is None:
+        assert r.times is None
+    else:
+        assert r.times == pytest.approx(times)
+
+def test_records_round_trip(tmp_path):
+    """The games written are read back in order, with their players and times"""
+    path = str(tmp_path / "games.cngr")
+    with records.RecordWriter(path, 7, 6, 4) as writer:
+        for game in GAMES:
+            writer.write(*game)
+    reader = records.RecordReader(path)
+    assert (reader.w, reader.h, reader.n) == (7, 6, 4)
+    read = list(reader)
+    assert len(read) == len(GAMES)
+    for r, game in zip(read, GAMES):
+        check(r, game)
+    assert reader.names == ["alpha", "beta", "gamma", "delta"]
+
+def test_records_append(tmp_path):
+    """A writer reopening a file appends to it and reuses the player ids"""
+    path = str(tmp_path / "games.cngr")
+    with records.RecordWriter(path, 7, 6, 4) as writer:
+        writer.write(*GAMES[0])
+    with records.RecordWriter(path, 7, 6, 4) as writer:
+        for game in GAMES[1:]:
+            writer.write(*game)
+    read = list(records.read_records(path))
+    assert len(read) == len(GAMES)
+    for r, game in zip(read, GAMES):
+        check(r, game)
+
+@pytest.mark.parametrize("w", [2, 3, 4, 5, 8, 9, 16, 17])
+def test_moves_pack_on_few_bits(w):
+    """Moves of every column of any width survive packing"""
+    bits = records.move_bits(w)
+    assert 1 << bits >= w
+    moves = [(i * 7) % w for i in range(37)]
+    data = records.pack_moves(moves, bits)
+    assert len(data) == (len(moves) * bits + 7) // 8
+    assert list(records.unpack_moves(data, len(moves), bits)) == moves
+
+def test_records_reject_other_geometries(tmp_path):
+    """A file is only appended to with the geometry it was created with"""
+    path = str(tmp_path / "games.cngr")
+    with records.RecordWriter(path, 7, 6, 4) as writer:
+        writer.write(*GAMES[0])
+    with pytest.raises(ValueError):
+        records.RecordWriter(path, 5, 4, 3)
+
+def test_records_reject_other_files(tmp_path):
+    """Files that are not game records are refused"""
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"CNDB\x01\x07\x06\x04")
+    with pytest.raises(ValueError):
+        records.RecordReader(str(path))
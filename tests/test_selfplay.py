@@ -0,0 +1,58 @@
+import pytest
+import agent
+import board
+import selfplay
+
+# Replay a game record on an empty board.
+#
+# PARAM [selfplay.GameRecord] r: the game record
+# PARAM [int]                 w: the board width
+# PARAM [int]                 h: the board height
+# PARAM [int]                 n: the number of tokens to line up to win
+# RETURN [board.Board]: the board at the end of the game
+def replay(r, w, h, n):
+    """Returns the board the moves of the record lead to"""
+    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+    for x in r.moves:
+        assert not brd.is_over()
+        brd.play(x)
+    return brd
+
+class IllegalAgent(agent.Agent):
+    """Agent that plays outside the board"""
+
+    def go(self, brd):
+        return brd.w
+
+def test_self_play_records_finished_games():
+    """Every record replays to a finished game with the recorded outcome"""
+    result = selfplay.play_games(5, 4, 3, agent.RandomAgent("a"), agent.RandomAgent("b"),
+                                 200, seed=1)
+    assert len(result.records) == 200
+    for r in result.records:
+        brd = replay(r, 5, 4, 3)
+        assert brd.is_over()
+        assert r.outcome == brd.get_outcome()
+        assert len(r.times) == len(r.moves)
+    assert sum(result.outcomes()) == 200
+    again = selfplay.play_games(5, 4, 3, agent.RandomAgent("a"), agent.RandomAgent("b"),
+                                200, seed=1, timed=False)
+    assert [r.moves for r in again.records] == [r.moves for r in result.records]
+    assert again.records[0].times is None
+
+def test_illegal_move_loses():
+    """An agent playing outside the board loses at once"""
+    result = selfplay.play_games(5, 4, 3, IllegalAgent("bad"), agent.RandomAgent("b"), 3)
+    assert [(r.moves, r.outcome) for r in result.records] == [(b"", 2)] * 3
+
+def test_lockstep_games_are_legal():
+    """Lockstep random games replay to finished games with the recorded outcome"""
+    pytest.importorskip("numpy")
+    result = selfplay.play_random_lockstep(6, 5, 4, 500, seed=1)
+    assert len(result.records) == 500
+    for r in result.records:
+        brd = replay(r, 6, 5, 4)
+        assert brd.is_over()
+        assert r.outcome == brd.get_outcome()
+    (ties, wins1, wins2) = result.outcomes()
+    assert wins1 > wins2 > ties
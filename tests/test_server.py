@@ -0,0 +1,104 @@
+import asyncio
+import agent
+import records
+import server
+
+# Run a coroutine with a local game server.
+#
+# PARAM [function] body:     the coroutine function, called with the server and its port
+# PARAM [float]    limit:    the time limit for a move in seconds
+# PARAM [records.RecordWriter] recorder: where to record the games, None not to record them
+# RETURN: the result of body
+def with_server(body, limit=1.0, recorder=None):
+    """Runs body against a 5x4 server with n=3 and returns its result"""
+    async def main():
+        srv = server.GameServer(5, 4, 3, limit, recorder)
+        listening = await srv.start("127.0.0.1", 0)
+        port = listening.sockets[0].getsockname()[1]
+        async with listening:
+            return await asyncio.wait_for(body(srv, port), 10)
+    return asyncio.run(main())
+
+# Connect a client and ask for a game.
+#
+# PARAM [int]    port: the port of the server
+# PARAM [string] name: the name of the player
+# RETURN [server.Connection]: the connection
+async def hello(port, name):
+    """Returns a connection that sent HELLO"""
+    (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+    conn = server.Connection(reader, writer)
+    await conn.send("HELLO " + name)
+    return conn
+
+def test_simulated_clients_play_their_games():
+    """Every agent plays its games, and the wins and losses balance"""
+    ps = [agent.RandomAgent("random%d" % i) for i in range(4)]
+    results = asyncio.run(asyncio.wait_for(server.simulate(5, 4, 3, 1.0, ps, 3), 30))
+    assert sorted(results) == ["random0", "random1", "random2", "random3"]
+    assert all(len(r) == 3 for r in results.values())
+    assert sum(sum(r) for r in results.values()) == 0
+
+def test_illegal_move_and_timeout_lose(tmp_path):
+    """A column out of the board and a late move lose the game, which is recorded"""
+    path = str(tmp_path / "games.cngr")
+    recorder = records.RecordWriter(path, 5, 4, 3)
+    async def body(srv, port):
+        a = await hello(port, "a")
+        await asyncio.sleep(0.1)
+        b = await hello(port, "b")
+        assert await a.receive() == "START 1 5 4 3 0.3 b"
+        assert await b.receive() == "START 2 5 4 3 0.3 a"
+        assert await a.receive() == "GO"
+        await a.send("2")
+        assert await b.receive() == "GO 2"
+        await b.send("7")
+        ends = [await a.receive(), await b.receive()]
+        # Another game, where Player 1 never answers
+        await a.send("HELLO a")
+        await asyncio.sleep(0.1)
+        await b.send("HELLO b")
+        for conn in (a, b):
+            assert (await conn.receive()).startswith("START")
+        assert await a.receive() == "GO"
+        ends += [await a.receive(), await b.receive()]
+        a.writer.close()
+        b.writer.close()
+        return ends
+    ends = with_server(body, 0.3, recorder)
+    recorder.close()
+    assert ends == ["END 1 illegal"] * 2 + ["END 2 timeout"] * 2
+    games = [(r.p1, r.p2, list(r.moves), r.outcome) for r in records.read_records(path)]
+    assert games == [("a", "b", [2], 1), ("a", "b", [], 2)]
+
+def test_clients_leaving_while_waiting_are_not_paired():
+    """A client that leaves before its opponent comes is dropped"""
+    async def body(srv, port):
+        gone = await hello(port, "gone")
+        await asyncio.sleep(0.1)
+        gone.writer.close()
+        await asyncio.sleep(0.1)
+        b = await hello(port, "b")
+        await asyncio.sleep(0.1)
+        c = await hello(port, "c")
+        starts = [await b.receive(), await c.receive()]
+        b.writer.close()
+        c.writer.close()
+        return starts
+    starts = with_server(body)
+    assert starts == ["START 1 5 4 3 1 c", "START 2 5 4 3 1 b"]
+
+def test_disconnect_loses():
+    """A player who leaves during the game loses it by disconnection"""
+    async def body(srv, port):
+        a = await hello(port, "a")
+        await asyncio.sleep(0.1)
+        b = await hello(port, "b")
+        await a.receive()
+        await b.receive()
+        assert await a.receive() == "GO"
+        a.writer.close()
+        end = await b.receive()
+        b.writer.close()
+        return end
+    assert with_server(body) == "END 2 disconnect"
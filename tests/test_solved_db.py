@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pytest
+import alpha_beta_agent
+import solved_db
+import solver
+from conftest import play_random
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    """A solved database of 4x4 boards with n=3"""
+    path = str(tmp_path_factory.mktemp("solved") / "4x4x3.cndb")
+    solved_db.build(path, 4, 4, 3, workers=1)
+    db = solved_db.SolvedDatabase(path)
+    yield db
+    db.close()
+
+def test_solver_matches_solved_database(database, rng):
+    """The solver and the database agree on the score and best move of every position tried"""
+    sv = solver.Solver()
+    checked = 0
+    while checked < 60:
+        brd = play_random(4, 4, 3, rng.randrange(16), rng)
+        if brd.is_over():
+            continue
+        score = database.probe(brd)
+        assert score == sv.solve(brd)[0]
+        col = database.best_move(brd)
+        brd.play(col)
+        assert -database.probe(brd) == score
+        brd.undo()
+        checked += 1
+
+def test_database_holds_only_reachable_positions(database, rng):
+    """Positions played on after the end of the game are not in the database"""
+    found = 0
+    while found < 20:
+        brd = play_random(4, 4, 3, 16, rng)
+        if brd.get_outcome() == 0:
+            continue
+        assert database.probe(brd) is not None
+        brd.play(rng.choice(brd.free_cols()))
+        assert database.probe(brd) is None
+        found += 1
+
+def test_position_index_round_trips():
+    """Every slot of a 3x3 board decodes to a position that encodes back to it"""
+    index = solved_db.position_index_of(3, 3)
+    seen = set()
+    for t in range(10):
+        slots = np.arange(index.offsets[t], index.offsets[t + 1], dtype=np.int64)
+        (bits1, bits2, heights) = index.decode(slots, t)
+        assert (index.encode(bits1, heights) == slots).all()
+        assert (heights.sum(axis=1) == t).all()
+        assert ((bits1 & bits2) == 0).all()
+        seen.update(zip(bits1.tolist(), bits2.tolist()))
+    assert len(seen) == index.slots
+
+def test_build_refuses_boards_too_large(tmp_path):
+    """Boards of more slots than allowed are refused before the file is written"""
+    path = str(tmp_path / "7x5x4.cndb")
+    with pytest.raises(ValueError):
+        solved_db.build(path, 7, 5, 4, workers=1)
+    with pytest.raises(ValueError):
+        solved_db.build(path, 5, 4, 3, workers=1, max_slots=1000)
+    assert not os.path.exists(path)
+    assert solved_db.slot_count(6, 5) <= 1 << 34
+
+def test_agent_plays_solved_positions(database, rng):
+    """AlphaBetaAgent plays the database's best move and reports the proven result"""
+    ag = alpha_beta_agent.AlphaBetaAgent("ab", 2, database=database)
+    for game in range(10):
+        brd = play_random(4, 4, 3, rng.randrange(8), rng)
+        if brd.is_over():
+            continue
+        ag.player = brd.player
+        assert ag.go(brd) == database.best_move(brd)
+        assert ag.proven == solver.Solver(1).outcome(brd, database.probe(brd))
@@ -0,0 +1,52 @@
+import time
+import pytest
+import solver
+from conftest import play_random
+
+# Solver scoring the finished boards of negamax()
+SCORER = solver.Solver(1)
+
+# Solve a board by plain negamax, with the scores of solver.Solver.
+#
+# PARAM [board.Board] brd:  the board, modified in place and restored
+# PARAM [dict]        memo: the scores of the positions already solved, by hash, or None
+# RETURN [int]: the score of the board for the player to move
+def negamax(brd, memo=None):
+    """Returns the exact score of the board, searched without pruning"""
+    if brd.is_over():
+        return SCORER.final_score(brd)
+    if memo is not None and brd.hash in memo:
+        return memo[brd.hash]
+    best = None
+    for col in brd.free_cols():
+        brd.play(col)
+        s = -negamax(brd, memo)
+        brd.undo()
+        if best is None or s > best:
+            best = s
+    if memo is not None:
+        memo[brd.hash] = best
+    return best
+
+def test_solver_matches_negamax(rng):
+    """The solver finds the exact score of 4x3 boards"""
+    sv = solver.Solver()
+    for game in range(20):
+        brd = play_random(4, 3, 3, rng.randrange(5, 12), rng)
+        (score, col) = sv.solve(brd)
+        assert score == negamax(brd)
+        if col is not None:
+            brd.play(col)
+            assert -negamax(brd) == score
+            brd.undo()
+
+def test_solver_solves_a_whole_small_board(rng):
+    """The empty 5x3 board with n=4 is solved quickly, to the score found by negamax"""
+    brd = play_random(5, 3, 4, 0, rng)
+    sv = solver.Solver()
+    # Raises solver.SolverTimeout if the search does not finish
+    (score, col) = sv.solve(brd, time.time() + 10)
+    memo = {}
+    assert score == negamax(brd, memo)
+    brd.play(col)
+    assert -negamax(brd, memo) == score
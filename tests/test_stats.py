@@ -0,0 +1,61 @@
+import json
+import pytest
+import alpha_beta_agent
+import stats
+from conftest import play_random
+
+def test_agent_counts_its_search(rng):
+    """A searched move reports its nodes, iterations and table lookups"""
+    ag = alpha_beta_agent.AlphaBetaAgent("ab", 5)
+    ag.collect_stats = True
+    ag.player = 1
+    ag.go(play_random(7, 6, 4, 0, rng))
+    s = ag.last_stats
+    assert s.moves == 1
+    assert [d for (d, t, nodes) in s.iterations] == [1, 2, 3, 4, 5]
+    assert s.nodes == sum(nodes for (d, t, nodes) in s.iterations)
+    assert 0 < s.leaves <= s.nodes
+    assert 0 < s.first_cutoffs <= s.cutoffs
+    assert 0 < s.tt_hits <= s.tt_probes
+    assert s.depth == 5
+    assert s.branching == pytest.approx(s.iterations[-1][2] / s.iterations[-2][2])
+    # Agents that do not collect statistics do not report any
+    ag.collect_stats = False
+    ag.go(play_random(7, 6, 4, 0, rng))
+    assert ag.last_stats is None
+
+def test_totals_and_rates():
+    """Moves add up, and the means only count the moves that have a value"""
+    searched = stats.SearchStats()
+    searched.moves = 1
+    searched.time = 0.5
+    searched.nodes = 1000
+    searched.cutoffs = 10
+    searched.first_cutoffs = 9
+    searched.add_iteration(1, 0.1, 100)
+    searched.add_iteration(2, 0.4, 400)
+    shallow = stats.SearchStats()
+    shallow.moves = 1
+    shallow.add_iteration(1, 0.1, 50)
+    book = stats.SearchStats()
+    book.moves = 1
+    book.book_moves = 1
+    s = stats.total([searched, None, shallow, book])
+    assert (s.moves, s.nodes, s.book_moves) == (3, 1000, 1)
+    assert s.nps == 2000
+    assert s.first_cutoff_rate == 0.9
+    assert s.mean_depth == 1.5
+    assert s.mean_branching == 4.0
+    assert stats.SearchStats().mean_branching == 0.0
+
+def test_json_lines(tmp_path):
+    """Each row is appended as one JSON object per line"""
+    path = str(tmp_path / "stats.jsonl")
+    s = stats.SearchStats()
+    s.moves = 2
+    stats.write_json_lines(path, [s.as_dict(agent="a")])
+    stats.write_json_lines(path, [s.as_dict(agent="b")])
+    with open(path) as f:
+        rows = [json.loads(line) for line in f]
+    assert [(r["agent"], r["moves"]) for r in rows] == [("a", 2), ("b", 2)]
+    assert "nps" in rows[0] and "iterations" not in rows[0]
@@ -0,0 +1,40 @@
+import argparse
+import agent
+import records
+import tournament
+
+# Play a seeded tournament of random agents and read back its games.
+#
+# PARAM [string] path:    the game record file to write
+# PARAM [int]    workers: the number of games played at once
+# RETURN [list of (str, str, list of int, int)]: the players, moves and outcome of each game
+def seeded_games(path, workers):
+    """Returns the games of a seeded tournament played by the given number of workers"""
+    ps = [agent.RandomAgent("random%d" % i) for i in range(1, 5)]
+    with records.RecordWriter(path, 5, 4, 3) as recorder:
+        tournament.play_tournament(5, 4, 3, 1, ps, workers=workers, seed=7, recorder=recorder)
+    return [(r.p1, r.p2, list(r.moves), r.outcome) for r in records.read_records(path)]
+
+def test_parallel_tournament_matches_serial(tmp_path, capsys, monkeypatch):
+    """With a seed, the games, their order and the scores do not depend on the workers"""
+    # Let the pool start even on a single core
+    monkeypatch.setattr(tournament.os, "cpu_count", lambda: 4)
+    serial = seeded_games(str(tmp_path / "serial.cngr"), 1)
+    serial_out = capsys.readouterr().out
+    parallel = seeded_games(str(tmp_path / "parallel.cngr"), 2)
+    parallel_out = capsys.readouterr().out
+    # Every pair meets twice, once as each player
+    assert len(serial) == 12
+    assert [(p1, p2) for (p1, p2, m, o) in serial].count(("random1", "random2")) == 1
+    assert parallel == serial
+    assert parallel_out == serial_out
+    assert "SCORES:" in serial_out
+
+def test_command_line_options():
+    """--workers and --seed are parsed, and default to a serial unseeded tournament"""
+    parser = argparse.ArgumentParser()
+    tournament.add_arguments(parser)
+    args = parser.parse_args([])
+    assert (args.workers, args.seed) == (1, None)
+    args = parser.parse_args(["--workers", "0", "--seed", "3"])
+    assert (args.workers, args.seed) == (0, 3)
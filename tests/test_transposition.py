@@ -0,0 +1,49 @@
+import board
+import transposition
+from conftest import play_random
+
+def test_table_finds_what_was_stored():
+    """A stored result is found under its key, and other keys miss"""
+    tt = transposition.TranspositionTable(1 << 4)
+    tt.store(12345, 7, 3, transposition.LOWER, 2)
+    assert tt.probe(12345) == (7, 3, transposition.LOWER, 2)
+    assert tt.probe(12345 + 16) is None
+    assert tt.stats()["hits"] == 1
+    assert tt.stats()["collisions"] == 1
+
+def test_table_size_is_bounded():
+    """The table keeps at most size entries, rounded down to a power of two"""
+    tt = transposition.TranspositionTable(100)
+    assert tt.size == 64
+    for key in range(1000):
+        tt.store(key, key, 1, transposition.EXACT, None)
+    assert len(tt.entries) == 64
+    assert tt.probe(999) == (999, 1, transposition.EXACT, None)
+
+def test_table_replaces_shallower_and_older_entries():
+    """Deeper results of the current search are kept, older searches give way"""
+    tt = transposition.TranspositionTable(1 << 4)
+    tt.store(1, 10, 5, transposition.EXACT, 0)
+    tt.store(17, 20, 2, transposition.EXACT, 1)
+    assert tt.probe(1) == (10, 5, transposition.EXACT, 0)
+    tt.new_search()
+    tt.store(17, 20, 2, transposition.EXACT, 1)
+    assert tt.probe(17) == (20, 2, transposition.EXACT, 1)
+    # A result without a move keeps the move of the same position
+    tt.store(17, 30, 3, transposition.UPPER, None)
+    assert tt.probe(17) == (30, 3, transposition.UPPER, 1)
+
+def test_mirror_images_share_entries(rng):
+    """A result stored for a board is found for its mirror image, with the mirrored move"""
+    tt = transposition.TranspositionTable(1 << 10)
+    for game in range(20):
+        brd = play_random(7, 6, 4, rng.randrange(1, 20), rng)
+        mirror = board.Board([[0] * 7 for i in range(6)], 7, 6, 4)
+        for entry in brd.history:
+            mirror.play(6 - entry[0])
+        col = rng.choice(brd.free_cols())
+        tt.store_board(brd, game, 4, transposition.EXACT, col)
+        assert tt.probe_board(brd) == (game, 4, transposition.EXACT, col)
+        # Symmetric positions are their own mirror image
+        mirrored = col if brd.hash == brd.mirror_hash else 6 - col
+        assert tt.probe_board(mirror) == (game, 4, transposition.EXACT, mirrored)
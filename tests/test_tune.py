@@ -0,0 +1,54 @@
+import pytest
+np = pytest.importorskip("numpy")
+import alpha_beta_agent
+import board
+import scoring
+import selfplay
+import tune
+
+def test_features_give_the_heuristic_of_weighted_profiles():
+    """Features times weights is the score of Player 1 under a profile with those weights"""
+    (w, h, n) = (6, 5, 4)
+    games = [(r.moves, r.outcome) for r in selfplay.play_random_lockstep(w, h, n, 30, seed=2).records]
+    (X, y) = tune.game_features(w, h, n, games, skip=3)
+    weights = [0, 3, 17, 101]
+    profile = scoring.WeightedProfile(weights)
+    row = 0
+    for (moves, outcome) in games:
+        brd = board.Board([[0] * w for i in range(h)], w, h, n)
+        brd.enable_scoring(profile)
+        for i, x in enumerate(moves[:-1]):
+            brd.play(x)
+            if i >= 3:
+                assert X[row] @ np.array(weights[1:]) == brd.scores[0]
+                assert y[row] == {0: 0.5, 1: 1.0, 2: 0.0}[outcome]
+                row += 1
+    assert row == len(y)
+    # Computing the features in chunks gives the same rows
+    (Xc, yc) = tune.dataset(w, h, n, games, skip=3, workers=1, chunk=7)
+    assert (Xc == X).all() and (yc == y).all()
+
+def test_fit_recovers_the_logits():
+    """The logistic regression finds the weights the labels were drawn with"""
+    generator = np.random.default_rng(1)
+    X = generator.integers(-3, 4, size=(200000, 3)).astype(np.float32)
+    theta = np.array([0.1, 0.4, -0.2])
+    y = (generator.random(len(X)) < 1 / (1 + np.exp(-(X @ theta)))).astype(np.float32)
+    assert tune.fit(X, y) == pytest.approx(theta, abs=0.01)
+    assert tune.profile_weights(np.array([0.1, 0.4, -0.2])) == [0, 25, 100, -50]
+
+def test_tuned_weights_play(tmp_path):
+    """Tuned weights predict the games at least as well as the classic profile, and can be played"""
+    (w, h, n) = (5, 4, 3)
+    games = [(r.moves, r.outcome) for r in selfplay.play_random_lockstep(w, h, n, 3000, seed=1).records]
+    info = tune.tune(w, h, n, games, workers=1)
+    assert len(info["weights"]) == n
+    assert info["loss"] <= info["classic_loss"] + 1e-4
+    path = str(tmp_path / "weights.json")
+    weights = info.pop("weights")
+    scoring.save_weights(path, weights, **info)
+    ag = alpha_beta_agent.AlphaBetaAgent("tuned", 3, profile=path)
+    assert ag.profile == scoring.WeightedProfile(weights)
+    ag.player = 1
+    brd = board.Board([[0] * w for i in range(h)], w, h, n)
+    assert ag.go(brd) in brd.free_cols()
@@ -1,27 +1,66 @@
+import argparse
+import os
 import random
+import concurrent.futures
 import game
 import agent
+import stats
+import profiling
 import alpha_beta_agent as aba
 
 ######################
 # Play a single game #
 ######################
 
-# Play a single game.
+# Play a single game without printing anything.
 #
-# PARAM [int]         w:  the board width
-# PARAM [int]         h:  the board height
-# PARAM [int]         n:  the number of tokens to line up to win
-# PARAM [int]         l:  the time limit for a move in seconds
-# PARAM [agent.Agent] p1: the agent for Player 1
-# PARAM [agent.Agent] p2: the agent for Player 2
-def play_game(w, h, n, l, p1, p2):
+# PARAM [int]         w:    the board width
+# PARAM [int]         h:    the board height
+# PARAM [int]         n:    the number of tokens to line up to win
+# PARAM [int]         l:    the time limit for a move in seconds
+# PARAM [agent.Agent] p1:   the agent for Player 1
+# PARAM [agent.Agent] p2:   the agent for Player 2
+# PARAM [int]         seed: the random seed for this game, None to leave the generator as is
+# PARAM [profiling.Profiler] profiler: the profiler of the moves, None not to profile them
+# RETURN [(int, list of int, list of float, list of stats.SearchStats, profiling.Profiler)]:
+#        The game outcome (1 for Player 1, 2 for Player 2, and 0 for no winner),
+#        the moves, the time of each move, the search statistics of each player
+#        and the profiler
+#
+# NOTE: this is the function run by the worker processes of a parallel tournament.
+def run_game(w, h, n, l, p1, p2, seed=None, profiler=None):
+    if seed is not None:
+        random.seed(seed)
     g = game.Game(w,  # width
                   h,  # height
                   n,  # tokens in a row to win
                   p1, # player 1
-                  p2) # player 2
+                  p2, # player 2
+                  profiler=profiler)
     o = g.timed_go(l)
+    if profiler is not None:
+        profiler.close()
+    return (o, g.moves(), g.times, g.stats, profiler)
+
+# Record a game, if a record writer was given.
+#
+# PARAM [records.RecordWriter] recorder: the record writer, or None
+# PARAM [agent.Agent]          p1:       the agent for Player 1
+# PARAM [agent.Agent]          p2:       the agent for Player 2
+# PARAM [tuple]                result:   the return value of run_game()
+def record_game(recorder, p1, p2, result):
+    if recorder is not None:
+        (o, moves, times) = result[:3]
+        if len(times) != len(moves):
+            times = None
+        recorder.write(p1.name, p2.name, moves, o, times)
+
+# Print the result of a game.
+#
+# PARAM [agent.Agent] p1: the agent for Player 1
+# PARAM [agent.Agent] p2: the agent for Player 2
+# PARAM [int]         o:  the game outcome
+def print_game(p1, p2, o):
     print("    GAME:", p1.name, "vs.", p2.name, ": ", end='')
     if o == 0:
         print("tie")
@@ -29,6 +68,35 @@ def play_game(w, h, n, l, p1, p2):
         print(p1.name, "won!")
     else:
         print(p2.name, "won!")
+
+# Add the search statistics of a game to those of its players.
+#
+# PARAM [dict]        stats:  the statistics by agent, updated in place, or None
+# PARAM [agent.Agent] p1:     the agent for Player 1
+# PARAM [agent.Agent] p2:     the agent for Player 2
+# PARAM [tuple]       result: the return value of run_game()
+def add_game_stats(stats, p1, p2, result):
+    if stats is not None:
+        stats[p1].add(result[3][0])
+        stats[p2].add(result[3][1])
+
+# Play a single game.
+#
+# PARAM [int]                  w:        the board width
+# PARAM [int]                  h:        the board height
+# PARAM [int]                  n:        the number of tokens to line up to win
+# PARAM [int]                  l:        the time limit for a move in seconds
+# PARAM [agent.Agent]          p1:       the agent for Player 1
+# PARAM [agent.Agent]          p2:       the agent for Player 2
+# PARAM [records.RecordWriter] recorder: where to record the game, None not to record it
+# PARAM [dict]                 stats:    the search statistics by agent, updated in place, or None
+# PARAM [profiling.Profiler]   profiler: the profiler of the moves, None not to profile them
+def play_game(w, h, n, l, p1, p2, recorder=None, stats=None, profiler=None):
+    result = run_game(w, h, n, l, p1, p2, profiler=profiler)
+    record_game(recorder, p1, p2, result)
+    add_game_stats(stats, p1, p2, result)
+    o = result[0]
+    print_game(p1, p2, o)
     return o
 
 ###########################################################
@@ -38,18 +106,28 @@ def play_game(w, h, n, l, p1, p2):
 
 # Play a match.
 #
-# PARAM [int]         w:  the board width
-# PARAM [int]         h:  the board height
-# PARAM [int]         n:  the number of tokens to line up to win
-# PARAM [int]         l:  the time limit for a move in seconds
-# PARAM [agent.Agent] p1: the agent for Player 1
-# PARAM [agent.Agent] p2: the agent for Player 2
-def play_match(w, h, n, l, p1, p2):
+# PARAM [int]                  w:        the board width
+# PARAM [int]                  h:        the board height
+# PARAM [int]                  n:        the number of tokens to line up to win
+# PARAM [int]                  l:        the time limit for a move in seconds
+# PARAM [agent.Agent]          p1:       the agent for Player 1
+# PARAM [agent.Agent]          p2:       the agent for Player 2
+# PARAM [records.RecordWriter] recorder: where to record the games, None not to record them
+# PARAM [dict]                 stats:    the search statistics by agent, updated in place, or None
+# PARAM [profiling.Profiler]   profiler: the profiler of the moves, None not to profile them
+def play_match(w, h, n, l, p1, p2, recorder=None, stats=None, profiler=None):
     print("  MATCH:", p1.name, "vs.", p2.name)
     # Play the games
-    o1 = play_game(w, h, n, l, p1, p2)
-    o2 = play_game(w, h, n, l, p2, p1)
-    # Calculate scores
+    o1 = play_game(w, h, n, l, p1, p2, recorder, stats, profiler)
+    o2 = play_game(w, h, n, l, p2, p1, recorder, stats, profiler)
+    return match_scores(o1, o2)
+
+# Calculate the scores of a match.
+#
+# PARAM [int] o1: the outcome of the first game, with p1 as Player 1
+# PARAM [int] o2: the outcome of the second game, with p2 as Player 1
+# RETURN [(int, int)]: the scores of p1 and p2
+def match_scores(o1, o2):
     s1 = 0
     s2 = 0
     if o1 == 1:
@@ -72,49 +150,166 @@ def play_match(w, h, n, l, p1, p2):
 
 # Play a tournament.
 #
-# PARAM [int]                 w:  the board width
-# PARAM [int]                 h:  the board height
-# PARAM [int]                 n:  the number of tokens to line up to win
-# PARAM [int]                 l:  the time limit for a move in seconds
-# PARAM [list of agent.Agent] ps: the agents in the tournament
-def play_tournament(w, h, n, l, ps):
+# PARAM [int]                  w:        the board width
+# PARAM [int]                  h:        the board height
+# PARAM [int]                  n:        the number of tokens to line up to win
+# PARAM [int]                  l:        the time limit for a move in seconds
+# PARAM [list of agent.Agent]  ps:       the agents in the tournament
+# PARAM [int]                  workers:  the number of games played at once, None for one per core
+# PARAM [int]                  seed:     the seed the per-game seeds are drawn from, None to
+#                                        play all the games on the global random generator
+# PARAM [records.RecordWriter] recorder: where to record the games, None not to record them
+# PARAM [string]               stats_path: the JSON lines file the search statistics of each
+#                                          agent are appended to, None not to write them
+# PARAM [profiling.Profiler]   profiler: the profiler of the moves, None not to profile them
+#
+# NOTE: with a seed, the results are the same whatever the number of workers.
+# NOTE: search statistics are only gathered for agents whose collect_stats is True.
+def play_tournament(w, h, n, l, ps, workers=1, seed=None, recorder=None, stats_path=None,
+                    profiler=None):
     print("TOURNAMENT START")
-    # Initialize scores
+    # Initialize scores and search statistics
     scores = {}
+    agent_stats = {}
     for p in ps:
         scores[p] = 0
+        agent_stats[p] = stats.SearchStats()
     # Play
-    for i in range(0, len(ps)-1):
-        for j in range(i + 1, len(ps)):
-            (s1, s2) = play_match(w, h, n, l, ps[i], ps[j])
-            scores[ps[i]] = scores[ps[i]] + s1
-            scores[ps[j]] = scores[ps[j]] + s2
+    if workers == 1 and seed is None:
+        for i in range(0, len(ps)-1):
+            for j in range(i + 1, len(ps)):
+                (s1, s2) = play_match(w, h, n, l, ps[i], ps[j], recorder, agent_stats, profiler)
+                scores[ps[i]] = scores[ps[i]] + s1
+                scores[ps[j]] = scores[ps[j]] + s2
+    else:
+        play_parallel_matches(w, h, n, l, ps, workers, seed, scores, recorder, agent_stats,
+                              profiler)
     print("TOURNAMENT END")
     # Calculate and print scores
     sscores = sorted( ((v,k.name) for k,v in scores.items()), reverse=True)
     print("\nSCORES:")
     for v,k in sscores:
         print(v,k)
+    print_stats(ps, agent_stats)
+    if stats_path is not None:
+        stats.write_json_lines(stats_path, [agent_stats[p].as_dict(agent=p.name)
+                                            for p in ps if p.collect_stats])
+
+# Print the search statistics of the agents that collect them.
+#
+# PARAM [list of agent.Agent] ps:    the agents in the tournament
+# PARAM [dict]                stats: the search statistics by agent
+def print_stats(ps, stats):
+    collecting = [p for p in ps if p.collect_stats]
+    if not collecting:
+        return
+    print("\nSEARCH STATS:")
+    for p in collecting:
+        s = stats[p]
+        print("%s: %d moves, %.0f nodes/s, depth %.1f, branching %.2f, first-move cutoffs %.0f%%, TT hits %.0f%%" %
+              (p.name, s.moves, s.nps, s.mean_depth, s.mean_branching,
+               100 * s.first_cutoff_rate, 100 * s.tt_hit_rate))
+
+# Play all the matches of a tournament on a pool of processes.
+#
+# Each worker plays one game at a time, and there are never more workers
+# than cores, so that an agent's move time does not depend on the load.
+#
+# PARAM [int]                  w:        the board width
+# PARAM [int]                  h:        the board height
+# PARAM [int]                  n:        the number of tokens to line up to win
+# PARAM [int]                  l:        the time limit for a move in seconds
+# PARAM [list of agent.Agent]  ps:       the agents in the tournament
+# PARAM [int]                  workers:  the number of games played at once, None for one per core
+# PARAM [int]                  seed:     the seed the per-game seeds are drawn from
+# PARAM [dict]                 scores:   the scores by agent, updated in place
+# PARAM [records.RecordWriter] recorder: where to record the games, None not to record them
+# PARAM [dict]                 stats:    the search statistics by agent, updated in place, or None
+# PARAM [profiling.Profiler]   profiler: the profiler of the moves, None not to profile them;
+#                                        each game is profiled apart, then merged into it
+def play_parallel_matches(w, h, n, l, ps, workers, seed, scores, recorder, stats=None,
+                          profiler=None):
+    cores = os.cpu_count() or 1
+    if workers is None or workers > cores:
+        workers = cores
+    # Seed every game up front, in match order
+    rnd = random.Random(seed)
+    matches = [(ps[i], ps[j], rnd.getrandbits(32), rnd.getrandbits(32))
+               for i in range(0, len(ps)-1) for j in range(i + 1, len(ps))]
+    games = []
+    for (p1, p2, seed1, seed2) in matches:
+        games.append((p1, p2, seed1))
+        games.append((p2, p1, seed2))
+    # Play the games
+    args = ([w] * len(games), [h] * len(games), [n] * len(games), [l] * len(games),
+            [g[0] for g in games], [g[1] for g in games], [g[2] for g in games],
+            [profiler.fresh() if profiler is not None else None for g in games])
+    if workers == 1:
+        results = list(map(run_game, *args))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(run_game, *args))
+    if profiler is not None:
+        for r in results:
+            profiler.merge(r[4])
+    # Report, record and score the matches in order
+    for k, (p1, p2, seed1, seed2) in enumerate(matches):
+        record_game(recorder, p1, p2, results[2*k])
+        record_game(recorder, p2, p1, results[2*k+1])
+        add_game_stats(stats, p1, p2, results[2*k])
+        add_game_stats(stats, p2, p1, results[2*k+1])
+        (o1, o2) = (results[2*k][0], results[2*k+1][0])
+        print("  MATCH:", p1.name, "vs.", p2.name)
+        print_game(p1, p2, o1)
+        print_game(p2, p1, o2)
+        (s1, s2) = match_scores(o1, o2)
+        scores[p1] = scores[p1] + s1
+        scores[p2] = scores[p2] + s2
+
+#################
+# Command lines #
+#################
+
+# Add the parallel tournament options to a command line parser.
+#
+# PARAM [argparse.ArgumentParser] parser: the parser
+def add_arguments(parser):
+    """Adds the --workers and --seed options to the parser"""
+    parser.add_argument("--workers", type=int, default=1,
+                        help="games played at once, 0 for one per core (default: 1)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed the per-game seeds are drawn from (default: none)")
 
 #######################
 # Run the tournament! #
 #######################
 
-# Set random seed for reproducibility
-random.seed(1)
-
-# Construct list of agents in the tournament
-agents = [
-    # aba.AlphaBetaAgent("aba", 4),
-    agent.RandomAgent("random1"),
-    agent.RandomAgent("random2"),
-    agent.RandomAgent("random3"),
-    agent.RandomAgent("random4")
-]
-
-# Run!
-play_tournament(7,      # board width
-                6,      # board height
-                4,      # tokens in a row to win
-                15,     # time limit in seconds
-                agents) # player list
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a ConnectN tournament")
+    add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiler = profiling.from_arguments(args)
+
+    # Set random seed for reproducibility
+    random.seed(1)
+
+    # Construct list of agents in the tournament
+    agents = [
+        # aba.AlphaBetaAgent("aba", 4),
+        agent.RandomAgent("random1"),
+        agent.RandomAgent("random2"),
+        agent.RandomAgent("random3"),
+        agent.RandomAgent("random4")
+    ]
+
+    # Run!
+    play_tournament(7,      # board width
+                    6,      # board height
+                    4,      # tokens in a row to win
+                    15,     # time limit in seconds
+                    agents, # player list
+                    workers=args.workers or None,
+                    seed=args.seed,
+                    profiler=profiler)
+    profiling.report(profiler, args)
@@ -0,0 +1,133 @@
+#######################
+# Transposition Table #
+#######################
+
+# Bound types of a stored value
+EXACT = 0 # The value is the exact value of the position
+LOWER = 1 # The value is a lower bound (the search failed high)
+UPPER = 2 # The value is an upper bound (the search failed low)
+
+class TranspositionTable(object):
+    """Fixed-size table of search results indexed by position hash"""
+
+    # Class constructor.
+    #
+    # PARAM [int] size: the number of entries, rounded down to a power of two
+    def __init__(self, size=1 << 18):
+        """Class constructor"""
+        # Number of entries
+        self.size = 1 << (max(1, size).bit_length() - 1)
+        # Mask to turn a hash into an index
+        self.mask = self.size - 1
+        # Entries: (hash, value, depth, bound type, best move, generation)
+        self.entries = [None] * self.size
+        # Generation of the current search, used to age out old entries
+        self.generation = 0
+        # Counters
+        self.reset_stats()
+
+    # Reset the hit/miss/collision counters.
+    def reset_stats(self):
+        """Resets the counters"""
+        # Probes that found the position
+        self.hits = 0
+        # Probes that did not find the position
+        self.misses = 0
+        # Probes that found another position in the slot (also counted as misses)
+        self.collisions = 0
+        # Entries written
+        self.stores = 0
+        # Entries written over a different position
+        self.overwrites = 0
+
+    # Remove all the entries.
+    def clear(self):
+        """Removes all the entries and resets the counters"""
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.reset_stats()
+
+    # Start a new search.
+    #
+    # NOTE: entries from previous searches are kept, but are the first to be replaced.
+    def new_search(self):
+        """Marks the entries stored so far as old"""
+        self.generation += 1
+
+    # Look up a position.
+    #
+    # PARAM [int] key: the hash of the position
+    # RETURN [tuple or None]: (value, depth, bound type, best move), or None if not found
+    def probe(self, key):
+        """Returns (value, depth, bound type, best move) for the position, or None"""
+        e = self.entries[key & self.mask]
+        if e is not None and e[0] == key:
+            self.hits += 1
+            return e[1:5]
+        self.misses += 1
+        if e is not None:
+            self.collisions += 1
+        return None
+
+    # Store a search result.
+    #
+    # An entry is replaced if it belongs to an older search, or if the new
+    # result was searched at least as deep.
+    #
+    # PARAM [int] key:   the hash of the position
+    # PARAM [int] value: the value of the position
+    # PARAM [int] depth: the remaining search depth the value was computed with
+    # PARAM [int] bound: EXACT, LOWER or UPPER
+    # PARAM [int] move:  the best move found, or None
+    def store(self, key, value, depth, bound, move):
+        """Stores a search result, subject to the replacement policy"""
+        i = key & self.mask
+        e = self.entries[i]
+        if e is not None:
+            if e[5] == self.generation and depth < e[2] and e[0] != key:
+                return
+            if e[0] != key:
+                self.overwrites += 1
+            elif move is None:
+                # Keep the best move of a previous search of the same position
+                move = e[4]
+        self.entries[i] = (key, value, depth, bound, move, self.generation)
+        self.stores += 1
+
+    # Look up a board, sharing entries between mirror images.
+    #
+    # The entry is found under the board's canonical key, and its move is
+    # converted back to the board.
+    #
+    # PARAM [board.Board] brd: the board
+    # RETURN [tuple or None]: (value, depth, bound type, best move), or None if not found
+    def probe_board(self, brd):
+        """Returns (value, depth, bound type, best move) for the board or its mirror image, or None"""
+        e = self.probe(brd.canonical_key())
+        if e is not None and e[3] is not None:
+            return (e[0], e[1], e[2], brd.uncanonical_move(e[3]))
+        return e
+
+    # Store a search result of a board, sharing entries between mirror images.
+    #
+    # PARAM [board.Board] brd:   the board
+    # PARAM [int]         value: the value of the position
+    # PARAM [int]         depth: the remaining search depth the value was computed with
+    # PARAM [int]         bound: EXACT, LOWER or UPPER
+    # PARAM [int]         move:  the best move found, or None
+    def store_board(self, brd, value, depth, bound, move):
+        """Stores a search result under the board's canonical key"""
+        if move is not None:
+            move = brd.canonical_move(move)
+        self.store(brd.canonical_key(), value, depth, bound, move)
+
+    # Get the counters.
+    #
+    # RETURN [dict]: the counters by name
+    def stats(self):
+        """Returns the counters as a dictionary"""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "collisions": self.collisions,
+                "stores": self.stores,
+                "overwrites": self.overwrites}
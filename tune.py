@@ -0,0 +1,248 @@
+import argparse
+import concurrent.futures
+import os
+import time
+import numpy as np
+import board
+import records
+import scoring
+import selfplay
+
+#############################
+# Features of line profiles #
+#############################
+
+# The heuristic of a scoring.WeightedProfile is linear in its weights: a
+# board scores sum_k weight[k] * f_k for Player 1, where f_k is the number of
+# lines holding k tokens of Player 1 and none of Player 2, minus the number
+# of lines holding k tokens of Player 2 and none of Player 1. Tuning the
+# weights is then fitting a logistic regression of the game results on the
+# features f_1 .. f_(n-1), as in Texel tuning.
+
+# Build the matrix mapping the cells of a board to the lines through them.
+#
+# PARAM [int] w: the board width
+# PARAM [int] h: the board height
+# PARAM [int] n: the number of tokens to line up to win
+# RETURN [2D numpy array of float32]: 1 at [pos, i] if bit position pos is in line i
+def incidence(w, h, n):
+    """Returns the cell-by-line incidence matrix of the board geometry"""
+    table = board.line_table(w, h, n)
+    m = np.zeros((w * (h + 1), len(table.lines)), dtype=np.float32)
+    for i, line in enumerate(table.lines):
+        m[list(line), i] = 1
+    return m
+
+# Compute the features and labels of the positions of some games.
+#
+# Every position after a move, except the final one and the first skip
+# positions, is kept. The label of a position is the result of its game for
+# Player 1: 1 for a win, 0.5 for a tie and 0 for a loss.
+#
+# PARAM [int]                       w:     the board width
+# PARAM [int]                       h:     the board height
+# PARAM [int]                       n:     the number of tokens to line up to win
+# PARAM [list of (bytes, int)]      games: the moves and outcome of each game
+# PARAM [int]                       skip:  the number of opening positions to leave out
+# RETURN [(2D numpy array of float32, numpy array of float32)]: one row of n-1
+#        features per position, and the label of each position
+def game_features(w, h, n, games, skip=0):
+    """Returns the features and labels of the positions played in the games"""
+    stride = h + 1
+    size = w * stride
+    nbytes = (size + 7) // 8
+    # Bitboards of every position, as bytes, and the label of each
+    raw = [bytearray(), bytearray()]
+    labels = []
+    for (moves, outcome) in games:
+        result = 1.0 if outcome == 1 else (0.0 if outcome == 2 else 0.5)
+        bits = [0, 0]
+        heights = [0] * w
+        for i, x in enumerate(moves[:-1]):
+            bits[i & 1] |= 1 << (x * stride + heights[x])
+            heights[x] += 1
+            if i >= skip:
+                raw[0] += bits[0].to_bytes(nbytes, 'little')
+                raw[1] += bits[1].to_bytes(nbytes, 'little')
+                labels.append(result)
+    count = len(labels)
+    m = incidence(w, h, n)
+    counts = []
+    for p in range(2):
+        cells = np.unpackbits(np.frombuffer(bytes(raw[p]), dtype=np.uint8).reshape(count, nbytes),
+                              axis=1, bitorder='little')[:, :size]
+        counts.append((cells.astype(np.float32) @ m).astype(np.int8))
+    (c1, c2) = counts
+    (free1, free2) = (c2 == 0, c1 == 0)
+    features = np.empty((count, n - 1), dtype=np.float32)
+    for k in range(1, n):
+        features[:, k - 1] = ((c1 == k) & free1).sum(axis=1) - ((c2 == k) & free2).sum(axis=1)
+    return (features, np.array(labels, dtype=np.float32))
+
+# Compute the features and labels of many games, in parallel.
+#
+# PARAM [int]                  w:       the board width
+# PARAM [int]                  h:       the board height
+# PARAM [int]                  n:       the number of tokens to line up to win
+# PARAM [list of (bytes, int)] games:   the moves and outcome of each game
+# PARAM [int]                  skip:    the number of opening positions to leave out per game
+# PARAM [int]                  workers: the number of processes, None for one per core
+# PARAM [int]                  chunk:   the number of games per task
+# RETURN [(2D numpy array of float32, numpy array of float32)]: the features and labels
+def dataset(w, h, n, games, skip=0, workers=None, chunk=2000):
+    """Returns the features and labels of the positions played in the games"""
+    chunks = [games[i:i + chunk] for i in range(0, len(games), chunk)]
+    if workers == 1 or len(chunks) <= 1:
+        parts = [game_features(w, h, n, c, skip) for c in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(game_features, *zip(*[(w, h, n, c, skip) for c in chunks])))
+    if not parts:
+        return (np.zeros((0, n - 1), dtype=np.float32), np.zeros(0, dtype=np.float32))
+    return (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+
+# Load the games of record files.
+#
+# PARAM [list of string] paths: the paths of the record files
+# PARAM [int]            w:     the board width
+# PARAM [int]            h:     the board height
+# PARAM [int]            n:     the number of tokens to line up to win
+# RETURN [list of (bytes, int)]: the moves and outcome of each game
+def load_records(paths, w, h, n):
+    """Returns the games of the record files"""
+    games = []
+    for path in paths:
+        reader = records.RecordReader(path)
+        if (reader.w, reader.h, reader.n) != (w, h, n):
+            raise ValueError("%s holds %dx%d boards with n=%d" % (path, reader.w, reader.h, reader.n))
+        games.extend((r.moves, r.outcome) for r in reader)
+    return games
+
+###########
+# Fitting #
+###########
+
+# Fit a logistic model of the labels.
+#
+# The cross-entropy of the predictions 1/(1+e^(-X.theta)) with the labels,
+# plus a small L2 penalty, is minimized with Newton's method. Each step is a
+# few products of the feature matrix, which NumPy hands to its BLAS library.
+#
+# PARAM [2D numpy array of float] X:          one row of features per position
+# PARAM [numpy array of float]    y:          the label of each position, between 0 and 1
+# PARAM [float]                   l2:         the weight of the L2 penalty
+# PARAM [int]                     iterations: the maximum number of Newton steps
+# PARAM [float]                   tolerance:  the largest change of a weight at which to stop
+# RETURN [numpy array of float]: the weights, in logits per unit of each feature
+def fit(X, y, l2=1e-6, iterations=50, tolerance=1e-9):
+    """Returns the weights of the logistic regression of y on X"""
+    X = X.astype(np.float64)
+    y = y.astype(np.float64)
+    (count, d) = X.shape
+    theta = np.zeros(d)
+    for it in range(iterations):
+        p = 1 / (1 + np.exp(-(X @ theta)))
+        grad = X.T @ (p - y) / count + l2 * theta
+        hess = (X * (p * (1 - p))[:, None]).T @ X / count + l2 * np.eye(d)
+        step = np.linalg.solve(hess, grad)
+        theta -= step
+        if np.abs(step).max() < tolerance:
+            break
+    return theta
+
+# Measure how well weights predict the labels.
+#
+# PARAM [2D numpy array of float] X:     one row of features per position
+# PARAM [numpy array of float]    y:     the label of each position
+# PARAM [numpy array of float]    theta: the weights, in logits
+# RETURN [float]: the mean squared error of the predicted scores, as in Texel tuning
+def loss(X, y, theta):
+    """Returns the mean squared error of the predictions of theta"""
+    p = 1 / (1 + np.exp(-(X.astype(np.float64) @ theta)))
+    return float(np.mean((p - y) ** 2))
+
+# Convert weights in logits to the integer weights of a profile.
+#
+# The weights are scaled so that the largest one is 10^(n-2), the weight of
+# n-1 tokens in the classic profile, which keeps every heuristic value well
+# below the score of a won game.
+#
+# PARAM [numpy array of float] theta: the weights of 1 .. n-1 tokens, in logits
+# RETURN [list of int]: the weights of 0 .. n-1 tokens
+def profile_weights(theta):
+    """Returns the integer profile weights of the fitted weights"""
+    scale = 10 ** (len(theta) - 1) / np.abs(theta).max()
+    return [0] + [int(round(t * scale)) for t in theta]
+
+##################
+# Tuning session #
+##################
+
+# Tune the profile weights on a set of games.
+#
+# The classic profile is fitted too, with a single scale factor, so that its
+# error can be compared with the tuned weights'.
+#
+# PARAM [int]                  w:       the board width
+# PARAM [int]                  h:       the board height
+# PARAM [int]                  n:       the number of tokens to line up to win
+# PARAM [list of (bytes, int)] games:   the moves and outcome of each game
+# PARAM [int]                  skip:    the number of opening positions to leave out per game
+# PARAM [float]                holdout: the fraction of the games kept to measure the error
+# PARAM [int]                  workers: the number of processes, None for one per core
+# PARAM [int]                  seed:    the seed of the split between fitting and holdout games
+# RETURN [dict]: the weights, the errors and the numbers of positions
+def tune(w, h, n, games, skip=0, holdout=0.1, workers=None, seed=1):
+    """Fits the profile weights to the games and returns them with their errors"""
+    start = time.time()
+    order = np.random.default_rng(seed).permutation(len(games))
+    cut = int(len(games) * (1 - holdout))
+    (X, y) = dataset(w, h, n, [games[i] for i in order[:cut]], skip, workers)
+    (Xt, yt) = dataset(w, h, n, [games[i] for i in order[cut:]], skip, workers)
+    features_time = time.time() - start
+    theta = fit(X, y)
+    classic = np.array([scoring.classic(k, 0) for k in range(1, n)], dtype=np.float64)
+    classic_scale = fit(X @ classic[:, None], y)[0]
+    held = (Xt, yt) if len(yt) else (X, y)
+    return {
+        "w": w, "h": h, "n": n,
+        "weights": profile_weights(theta),
+        "logits": [float(t) for t in theta],
+        "games": len(games),
+        "positions": int(len(y) + len(yt)),
+        "loss": loss(held[0], held[1], theta),
+        "classic_loss": loss(held[0], held[1], classic * classic_scale),
+        "features_seconds": round(features_time, 3),
+        "seconds": round(time.time() - start, 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the weights of the ConnectN heuristic")
+    parser.add_argument("--size", type=int, nargs=3, default=[7, 6, 4], metavar=("W", "H", "N"),
+                        help="board geometry")
+    parser.add_argument("--records", nargs="*", default=[], help="game record files to learn from")
+    parser.add_argument("--selfplay", type=int, default=0, metavar="GAMES",
+                        help="also learn from this many random self-play games")
+    parser.add_argument("--skip", type=int, default=0, help="opening positions left out of each game")
+    parser.add_argument("--holdout", type=float, default=0.1,
+                        help="fraction of the games kept to measure the error")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes computing the features (default: one per core)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", default="weights.json", help="weight file to write")
+    args = parser.parse_args()
+    (w, h, n) = args.size
+    games = load_records(args.records, w, h, n)
+    if args.selfplay:
+        result = selfplay.play_random_lockstep(w, h, n, args.selfplay, seed=args.seed)
+        games.extend((r.moves, r.outcome) for r in result.records)
+    if not games:
+        parser.error("no games to learn from, give --records or --selfplay")
+    info = tune(w, h, n, games, args.skip, args.holdout, args.workers or os.cpu_count(), args.seed)
+    print("%d positions from %d games, features in %.1f s, total %.1f s" %
+          (info["positions"], info["games"], info["features_seconds"], info["seconds"]))
+    print("weights:", info["weights"][1:])
+    print("holdout error: %.5f (classic profile: %.5f)" % (info["loss"], info["classic_loss"]))
+    weights = info.pop("weights")
+    scoring.save_weights(args.output, weights, **info)
+    print("Wrote", args.output)